@@ -108,12 +108,14 @@ if __name__ == '__main__':
     compute_file = os.path.join(zfm_dir, 'compute_nodes.conf')
     memory_file  = os.path.join(zfm_dir, 'memory_nodes.conf')
     io_file      = os.path.join(zfm_dir, 'io_nodes.conf')
+    snap_file    = os.path.join(zfm_dir, 'zfm.snapshot')
 
     zfm_config = { 'zfm_management_network'  : 'out-of-band',       # prototype is out-of-band management
                    'zfm_switch_node_file'    : switch_file,         # directory containing switch JSON configuration data
                    'zfm_compute_node_file'   : compute_file,        # directory containing compute JSON configuration data
                    'zfm_memory_node_file'    : memory_file,         # directory containing memory JSON configuration data
                    'zfm_io_node_file'        : io_file,             # directory containing IO JSON configuration data
+                   'zfm_snapshot_file'       : snap_file,           # fabric state saved for warm restarts
                    'zfm_default_timer'       : timers['DEFAULT'],   # default timer for unspecified functions
                    'zfm_init_timer'          : timers['INIT'],      # seconds before timing out
                    'zfm_train_timer'         : timers['TRAIN'],     # seconds before timing out
@@ -121,6 +123,9 @@ if __name__ == '__main__':
                    'zfm_load_timer'          : timers['LOAD'],      # seconds before timing out
                    'zfm_enable_timer'        : timers['ENABLE'],    # seconds before timing out
                    'zfm_sweep_timer'         : timers['SWEEP'],     # seconds between fabric health checks
+                   'zfm_metrics_retention'   : 360,                 # port metrics samples kept for history
+                   'zfm_state_ttl'           : 30,                  # seconds a cached port state is served
+                   'zfm_metrics_ttl'         : 30,                  # seconds cached port metrics are served
                    'zfm_HA'                  : 0,                   # HA not enabled
                    'zfm_HA_master'           : 1,                   # HA master
                    'zfm_HA_interval'         : 60,                  # HA heartbeat interval
@@ -54,6 +54,8 @@ class Compute(Node):
                 if 'RIT'  in genz_attributes: self.rit  = RIT(self, fabric_adapter_name)
                 if 'PIDT' in genz_attributes: self.pidt = PIDT(self, fabric_adapter_name)
 
+        self.adapter_name = fabric_adapter_name
+
         #
         # We don't have an LPRT or MPRT here.
         #
@@ -77,22 +79,44 @@ class Compute(Node):
         self.create_ports(port_attr_names)
 
 
-    def load_specific(self, args, kwargs):
-        status = True
+    def adapter_entries(self):
+        entries = {}
+        entries.update(self.req_vcat.entries())
+        entries.update(self.rsp_vcat.entries())
+
+        entries.update(self.ssdt.entries())
+        entries.update(self.msdt.entries())
 
+        return entries
+
+
+    def load_specific(self, args, kwargs):
         #
-        # Load compute specific attributes.
+        # Load compute specific attributes.  The adapter tables go in a single request.
         #
-        status &= self.req_vcat.patch()
-        status &= self.rsp_vcat.patch()
+        entries = self.adapter_entries()
 
-        status &= self.ssdt.patch()
-        status &= self.msdt.patch()
+        current = {}
+        if args[0] == 'diff':
+            entries, current = self.diff_entries(self.adapter_name, entries)
 
-        status &= self.pidt.patch()
-        status &= self.rit.patch()
+        status,_ = self.deeppatch(self.adapter_name, entries)
+
+        adapter = current.get(self.adapter_name, {})
+        if not self.pidt.matches(adapter): status &= self.pidt.patch()
+        if not self.rit.matches(adapter):  status &= self.rit.patch()
 
         return status
 
+
+    def probe_specific(self):
+        #
+        # Warm restart check : the adapter must still hold the tables that we would load.
+        #
+        entries, current = self.diff_entries(self.adapter_name, self.adapter_entries())
+        adapter = current.get(self.adapter_name, {})
+
+        return not entries and self.pidt.matches(adapter) and self.rit.matches(adapter)
+
 # ----------------------------------------------------------------------------------------------------------------------
 
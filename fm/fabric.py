@@ -11,6 +11,8 @@ import json
 import time
 import datetime
 
+from threading     import Condition
+
 from km.fm.log     import Log
 from km.fm.memory  import Memory
 from km.fm.io      import IO
@@ -31,14 +33,45 @@ class Fabric():
     }
 
     sweep_types = [ 'light', 'medium', 'heavy' ]
+    load_types = [ 'full', 'diff' ]
+
+    #
+    # Metric families exposed at /metrics : name -> (type, help).
+    #
+    metric_families = {
+        'zfm_node_up'                   : ('gauge',   'Node is configured and active'),
+        'zfm_node_sweeps_total'         : ('counter', 'Scheduled sweeps of the node'),
+        'zfm_node_sweep_seconds'        : ('gauge',   'Duration of the last sweep of the node'),
+        'zfm_port_up'                   : ('gauge',   'Port link and interface are enabled'),
+        'zfm_port_active'               : ('gauge',   'Port is being swept'),
+        'zfm_port_healthy'              : ('gauge',   'Port health is OK'),
+        'zfm_port_metrics_age_seconds'  : ('gauge',   'Age of the cached port metrics'),
+        'zfm_port_interface_total'      : ('counter', 'Gen-Z interface counters'),
+        'zfm_port_requests_total'       : ('counter', 'Requests sent and received'),
+        'zfm_port_request_bytes_total'  : ('counter', 'Request bytes sent and received'),
+        'zfm_port_responses_total'      : ('counter', 'Responses sent and received'),
+        'zfm_port_response_bytes_total' : ('counter', 'Response bytes sent and received'),
+        'zfm_port_vc_packets_total'     : ('counter', 'Packets relayed per virtual channel'),
+        'zfm_port_vc_bytes_total'       : ('counter', 'Bytes relayed per virtual channel'),
+        'zfm_port_vc_occupancy'         : ('gauge',   'Virtual channel occupancy'),
+        'zfm_phase_seconds'             : ('gauge',   'Duration of the last fabric wide phase'),
+    }
 
     # ----------------------------------------------------------------------------------------------------------------------
 
-    def __init__(self, sweep_type, timers, node_file_list):
+    def __init__(self, sweep_type, timers, node_file_list, load_type='full', pipeline=False, snapshot_file=None, warm=True):
         self.status = True
         self.sweep_type = sweep_type
+        self.load_type = load_type
+        self.pipeline = pipeline
+        self.snapshot_file = snapshot_file
+        self.warm = warm
         self.timers = timers
         self.node_file_list = node_file_list
+        self.condition = Condition()
+        self.timings = {}
+        self.nodes = {}
+        self.index_nodes()
 
     # ----------------------------------------------------------------------------------------------------------------------
 
@@ -51,6 +84,13 @@ class Fabric():
             Log.error('invalid sweep type {}', self.sweep_type)
             return False
 
+        #
+        # Validate the load type.
+        #
+        if self.load_type not in Fabric.load_types:
+            Log.error('invalid load type {}', self.load_type)
+            return False
+
         #
         # Read the node profiles.
         #
@@ -67,6 +107,23 @@ class Fabric():
                 Log.error('error reading {}', filename)
                 return False
 
+        self.index_nodes()
+
+        #
+        # Find the link peers of each node.
+        #
+        for node in self.nodes.values():
+            peers = [ self.locate_node(port.remote_uid) for port in node.ports if port.active ]
+            node.peers = [ peer for peer in set(peers) if peer and peer.active and peer is not node ]
+
+        #
+        # Warm restart : nodes that still match the last snapshot skip the bringup steps.
+        #
+        if self.warm and self.snapshot_file:
+            snapshot = self.read_snapshot()
+            if snapshot:
+                self.probe_nodes(snapshot)
+
         #
         # There are 5 steps for node initialization:
         #   1) load the GCIDs and UID into the endpoints
@@ -75,13 +132,19 @@ class Fabric():
         #   4) load the node attributes
         #   5) enable the port interfaces
         #
+        # They either run as fabric wide steps or pipelined, where each node goes through all
+        # of the steps on its own.
+        #
         status = True
 
-        if status: status = self.init_ids()
-        if status: status = self.train_ports()
-        if status: status = self.validate_ports()
-        if status: status = self.load_nodes()
-        if status: status = self.enable_ports()
+        if self.pipeline:
+            status = self.bringup_nodes()
+        else:
+            if status: status = self.init_ids()
+            if status: status = self.train_ports()
+            if status: status = self.validate_ports()
+            if status: status = self.load_nodes()
+            if status: status = self.enable_ports()
 
         #
         # Verify the state of all connected ports.
@@ -89,24 +152,78 @@ class Fabric():
         if status:
             status = self.verify_fabric_health()
 
+        if status and self.snapshot_file:
+            self.write_snapshot()
+
+        self.log_stats()
+
         Log.debug('fabric initialization status = {}', status)
         return status
 
     # ----------------------------------------------------------------------------------------------------------------------
 
+    def read_snapshot(self):
+        try:
+            with open(self.snapshot_file) as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            Log.info('no fabric snapshot {}', self.snapshot_file)
+            return None
+        except:
+            Log.error('can\'t read fabric snapshot {}', self.snapshot_file)
+            return None
+
+        return snapshot.get('Nodes', None)
+
+
+    def write_snapshot(self):
+        #
+        # Only nodes that made it all the way up (or came up warm) go into the snapshot.  The
+        # file is replaced in one step so a crash can't leave half of it behind.
+        #
+        nodes = { name : node.snapshot() for name,node in self.nodes.items()
+                  if node.active and ((node.enable_done() == 1) or (node.bringup_done() == 1)) }
+
+        snapshot = { 'Timestamp' : datetime.datetime.now().isoformat(),
+                     'Nodes'     : nodes
+        }
+
+        try:
+            temp_file = self.snapshot_file + '.tmp'
+            with open(temp_file, 'w') as f:
+                json.dump(snapshot, f)
+            os.replace(temp_file, self.snapshot_file)
+        except:
+            Log.error('can\'t write fabric snapshot {}', self.snapshot_file)
+            return False
+
+        Log.info('fabric snapshot written : {} nodes', len(nodes))
+        return True
+
+
+    def probe_nodes(self, snapshot):
+        self.wait_for('probe', [snapshot], {})
+
+        warm_nodes = [ name for name,node in self.nodes.items() if node.warm ]
+        Log.info('warm restart : {} of {} nodes match the snapshot', len(warm_nodes), len(self.nodes))
+        return warm_nodes
+
+    # ----------------------------------------------------------------------------------------------------------------------
+
     def wait_status(self, statuses):
         return min(statuses)
 
 
-    def wait_display(self, command, cycles, statuses):
+    def wait_display(self, command, elapsed, statuses):
             s = { -1 : '-', 0 : '0', 1 : '1' }
             status_str = ''.join(s[x] for x in statuses)
-            Log.info('{} : cycles={:<4}  status={:<}', command, cycles, status_str)
+            Log.info('{} : elapsed={:<8.2f}  status={:<}', command, elapsed, status_str)
 
 
     def wait_for(self, command, args, kwargs):
         Log.info('starting {}...', command)
-        kwargs['retries'] = self.timers.get(command, self.timers['default'])
+        kwargs.setdefault('retries', self.timers.get(command, self.timers['default']))
+        kwargs['condition'] = self.condition
         verify_name = '{}_done'.format(command)
 
         #
@@ -117,23 +234,35 @@ class Fabric():
             node.enqueue(command, args, kwargs)
 
         #
-        # Wait for all of the node threads to complete.
+        # Wait for all of the node threads to complete.  Each node notifies the condition when it
+        # finishes, so we wake up as soon as the last one is done.  The statuses are read with the
+        # condition held so that a notification can't slip in between the check and the wait.
         #
-        cycles = 0
-        node_statuses = [-1]
-        while (self.wait_status(node_statuses) < 0) and (cycles < self.timers[command]):
-            time.sleep(1)
-            cycles += 1
+        start = time.time()
+        deadline = start + kwargs['retries']
+        next_display = start + 60
+
+        with self.condition:
+            while True:
+                node_statuses = [getattr(node, verify_name)() for node in active_nodes]
+                now = time.time()
+                if (self.wait_status(node_statuses) >= 0) or (now >= deadline):
+                    break
 
-            node_statuses = [getattr(node, verify_name)() for node in active_nodes]
-            if (cycles%60) == 0:
-                self.wait_display(command, cycles, node_statuses)
+                if now >= next_display:
+                    self.wait_display(command, now - start, node_statuses)
+                    next_display += 60
+
+                self.condition.wait(min(deadline, next_display) - now)
+
+        elapsed = time.time() - start
+        self.timings[command] = (start, start + elapsed)
 
         #
         # Check for node timeouts.
         #
         if self.wait_status(node_statuses) < 0:
-            self.wait_display(command, cycles, node_statuses)
+            self.wait_display(command, elapsed, node_statuses)
 
             for i in range(len(node_statuses)):
                 if node_statuses[i] == -1:
@@ -143,7 +272,7 @@ class Fabric():
         # Display the command status.
         #
         command_status = self.wait_status(node_statuses) == 1
-        Log.info('{} done ... status = {}   cycles = {}', command, command_status, cycles)
+        Log.info('{} done ... status = {}   elapsed = {:.2f}', command, command_status, elapsed)
         return command_status
 
 
@@ -169,7 +298,7 @@ class Fabric():
 
 
     def load_nodes(self):
-        status = self.wait_for('load', [], {})
+        status = self.wait_for('load', [self.load_type], {})
         if not status:
             Log.error('ports not loaded')
         return status
@@ -182,12 +311,18 @@ class Fabric():
         return status
 
 
-    def sweep(self):
-        status = self.wait_for('sweep', [self.sweep_type], {})
+    def bringup_nodes(self):
+        #
+        # The pipeline can take as long as all of the steps put together.
+        #
+        timeout = sum(self.timers.get(command, self.timers['default']) for command in [ 'init', 'train', 'validate', 'load', 'enable' ])
+
+        status = self.wait_for('bringup', [self.load_type], { 'timers' : self.timers, 'retries' : timeout })
         if not status:
-            Log.error('nodes not swept')
+            Log.error('nodes not brought up')
         return status
 
+
     # ----------------------------------------------------------------------------------------------------------------------
 
     def verify_fabric_health(self):
@@ -226,6 +361,26 @@ class Fabric():
 
     # ----------------------------------------------------------------------------------------------------------------------
 
+    def index_nodes(self):
+        #
+        # Map every way of naming a node to the node.  This has to be rebuilt whenever the node
+        # dictionary changes.  When two nodes share a key, the first one wins (as in a scan).
+        #
+        self.node_index = { 'name' : {}, 'topoid' : {}, 'geoid' : {}, 'uid' : {}, 'address' : {} }
+
+        for name,node in self.nodes.items():
+            geoid = node.geoid
+            if type(geoid) is dict:
+                geoid = '{}:{}:{}:{}'.format(geoid['RackID'], geoid['ChassisID'], geoid['SlotID'], geoid['NodeID'])
+
+            self.node_index['name'].setdefault(name, node)
+            self.node_index['topoid'].setdefault(node.topoid, node)
+            self.node_index['geoid'].setdefault(geoid, node)
+            self.node_index['uid'].setdefault(node.uid, node)
+            self.node_index['address'].setdefault(node.address, node)
+            self.node_index['address'].setdefault(node.profile['address'], node)
+
+
     def locate_node(self, node_id):
         node_hex_id = -1
 
@@ -234,14 +389,10 @@ class Fabric():
         elif type(node_id) is str and node_id.isdigit():
             node_hex_id = int(node_id, 0)
 
-        for name,node in self.nodes.items():
-            if name == node_id:
-                return node
-            elif node.topoid == node_id:
-                return node
-            elif node.geoid == node_id:
-                return node
-            elif node.uid == node_hex_id:
+        keys = [ ('name', node_id), ('topoid', node_id), ('geoid', node_id), ('uid', node_hex_id), ('address', node_id) ]
+        for index_name, key in keys:
+            node = self.node_index[index_name].get(key, None)
+            if node:
                 return node
 
         Log.error('invalid node identifier {}', node_id)
@@ -279,6 +430,138 @@ class Fabric():
 
     # ----------------------------------------------------------------------------------------------------------------------
 
+    def GET_metrics(self, parameters):
+        data = { 'DataType'  : 'METRICS',
+                 'Timestamp' : datetime.datetime.now().isoformat(),
+                 'Metrics'   : {}
+        }
+
+        def add(name, labels, value):
+            family = data['Metrics'].setdefault(name, { 'Type'    : Fabric.metric_families[name][0],
+                                                        'Help'    : Fabric.metric_families[name][1],
+                                                        'Samples' : [] })
+            family['Samples'].append({ 'Labels' : labels, 'Value' : value })
+
+        #
+        # Everything comes from what the sweeps already read.  Nothing here goes to the nodes.
+        #
+        now = time.time()
+        for name,node in self.nodes.items():
+            add('zfm_node_up', { 'node' : name, 'type' : node.profile['type'] }, 1 if node.active else 0)
+            if not node.active: continue
+
+            add('zfm_node_sweeps_total', { 'node' : name }, node.sweep_count)
+            add('zfm_node_sweep_seconds', { 'node' : name }, node.sweep_seconds)
+
+            for port in node.ports:
+                if node.profile['ports'][port.index]['State'] != 'Enabled': continue
+
+                labels = { 'node' : name, 'port' : str(port.index) }
+
+                current = port.current
+                up = port.active and current is not None and current['LinkState'] == 'Enabled' and current['InterfaceState'] == 'Enabled'
+                add('zfm_port_up', labels, 1 if up else 0)
+                add('zfm_port_active', labels, 1 if port.active else 0)
+                if current is not None:
+                    add('zfm_port_healthy', labels, 1 if current['Status']['Health'] == 'OK' else 0)
+
+                attr = port.metrics.current
+                if attr is None: continue
+
+                add('zfm_port_metrics_age_seconds', labels, now - port.metrics.current_time)
+
+                for counter, value in attr['Gen-Z'].items():
+                    add('zfm_port_interface_total', { **labels, 'counter' : counter }, value)
+
+                oem_metrics = attr.get('Oem', {}).get('Hpe', {}).get('Metrics', {})
+                for group, packets, octets in [ ('Request',  'zfm_port_requests_total',  'zfm_port_request_bytes_total'),
+                                                ('Response', 'zfm_port_responses_total', 'zfm_port_response_bytes_total') ]:
+                    group_metrics = oem_metrics.get(group, None)
+                    if group_metrics:
+                        add(packets, { **labels, 'direction' : 'xmit' }, group_metrics['XmitCount'])
+                        add(packets, { **labels, 'direction' : 'recv' }, group_metrics['RecvCount'])
+                        add(octets,  { **labels, 'direction' : 'xmit' }, group_metrics['XmitBytes'])
+                        add(octets,  { **labels, 'direction' : 'recv' }, group_metrics['RecvBytes'])
+
+                for vc in range(16):
+                    vc_metrics = oem_metrics.get('VC{}'.format(vc), None)
+                    if vc_metrics:
+                        vc_labels = { **labels, 'vc' : str(vc) }
+                        add('zfm_port_vc_packets_total', { **vc_labels, 'direction' : 'xmit' }, vc_metrics['XmitCount'])
+                        add('zfm_port_vc_packets_total', { **vc_labels, 'direction' : 'recv' }, vc_metrics['RecvCount'])
+                        add('zfm_port_vc_bytes_total',   { **vc_labels, 'direction' : 'xmit' }, vc_metrics['XmitBytes'])
+                        add('zfm_port_vc_bytes_total',   { **vc_labels, 'direction' : 'recv' }, vc_metrics['RecvBytes'])
+                        add('zfm_port_vc_occupancy',     vc_labels, vc_metrics['Occupancy'])
+
+        #
+        # ZFM's own timings.
+        #
+        for command, (start, end) in self.timings.items():
+            add('zfm_phase_seconds', { 'phase' : command }, end - start)
+
+        return 200, data
+
+
+    @staticmethod
+    def phase(start, end):
+        return { 'Start'   : datetime.datetime.fromtimestamp(start).isoformat(),
+                 'End'     : datetime.datetime.fromtimestamp(end).isoformat(),
+                 'Elapsed' : end - start
+        }
+
+
+    def GET_stats(self, parameters):
+        data = { 'DataType'  : 'STATS',
+                 'Timestamp' : datetime.datetime.now().isoformat(),
+                 'Phases'    : { command : Fabric.phase(start, end) for command,(start,end) in self.timings.items() },
+                 'Nodes'     : {}
+        }
+
+        #
+        # Each node's command times and REST statistics.  The node threads are still running, so
+        # work from a copy of the times.
+        #
+        for name,node in self.nodes.items():
+            if not node.active: continue
+
+            data['Nodes'][name] = { 'Phases' : { command : Fabric.phase(start, end) for command,(start,end) in dict(node.phase_times).items() },
+                                    'Rest'   : node.rest_stats.summary(),
+                                    'Sweeps' : node.sweep_rounds
+            }
+
+        return 200, data
+
+
+    def log_stats(self):
+        _, data = self.GET_stats({})
+
+        Log.info('initialization summary')
+        for command, phase in data['Phases'].items():
+            Log.info('    {:<10} {:>8.2f} seconds', command, phase['Elapsed'])
+
+        #
+        # One line per node : REST totals over all of the verbs and its slowest step.
+        #
+        for name, node_stats in data['Nodes'].items():
+            verbs = node_stats['Rest'].values()
+            requests = sum(verb['Requests'] for verb in verbs)
+            if requests == 0: continue
+
+            latency = sum(verb['Latency']['Sum'] for verb in verbs) / requests
+            worst = max(verb['Latency']['P99'] for verb in verbs)
+
+            phases = node_stats['Phases']
+            slowest = max(phases, key=lambda command: phases[command]['Elapsed']) if phases else '--'
+            elapsed = phases[slowest]['Elapsed'] if phases else 0.0
+
+            Log.info('    {:<12} requests={:<6} retries={:<4} timeouts={:<4} errors={:<4} mean={:.1f}ms p99<={:.1f}ms slowest={}({:.2f}s)',
+                     name, requests,
+                     sum(verb['Retries'] for verb in verbs),
+                     sum(verb['Timeouts'] for verb in verbs),
+                     sum(verb['Errors'] for verb in verbs),
+                     latency*1000, worst*1000, slowest, elapsed)
+
+
     def GET(self, parameters):
         return self.GET_fabric(parameters)
 
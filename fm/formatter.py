@@ -23,15 +23,28 @@ class ZFMFormatter():
         self.delimiters = { 'BROWSER' : ('<pre>', '<pre/>', '<br/>'),
                             'ASCII'   : ('',      '',       '\n'   ),
                             'JSON'    : ('',      '',       ''     ),
+                            'NDJSON'  : ('',      '',       '\n'   ),
         }
 
-        self.funcs = { 'FABRIC' : { 'BROWSER' : self.f_browser, 'ASCII' : self.f_human, 'JSON' : self.f_machine },
-                       'NODE'   : { 'BROWSER' : self.n_browser, 'ASCII' : self.n_human, 'JSON' : self.n_machine },
-                       'PORT'   : { 'BROWSER' : self.p_browser, 'ASCII' : self.p_human, 'JSON' : self.p_machine },
+        self.funcs = { 'FABRIC'  : { 'BROWSER' : self.f_browser, 'ASCII' : self.f_human, 'JSON' : self.f_machine, 'NDJSON' : self.f_lines },
+                       'NODE'    : { 'BROWSER' : self.n_browser, 'ASCII' : self.n_human, 'JSON' : self.n_machine, 'NDJSON' : self.n_lines },
+                       'PORT'    : { 'BROWSER' : self.p_browser, 'ASCII' : self.p_human, 'JSON' : self.p_machine, 'NDJSON' : self.p_lines },
+                       'HISTORY' : { 'BROWSER' : self.h_browser, 'ASCII' : self.h_human, 'JSON' : self.h_machine, 'NDJSON' : self.h_lines },
+                       'METRICS' : { 'BROWSER' : self.m_browser, 'ASCII' : self.m_human, 'JSON' : self.m_machine, 'NDJSON' : self.m_lines },
+                       'STATS'   : { 'BROWSER' : self.s_browser, 'ASCII' : self.s_human, 'JSON' : self.s_machine, 'NDJSON' : self.s_lines },
         }
 
 
     def format(self, data, consumer):
+        chunks = self.stream(data, consumer)
+        return ''.join(chunks) if chunks is not None else None
+
+
+    def stream(self, data, consumer):
+        #
+        # The formatters are generators : the output comes out a piece at a time so that it can
+        # be written as it is produced instead of being built up in one string.
+        #
         data_type = data.get('DataType', None)
 
         if consumer not in self.delimiters:
@@ -58,18 +71,18 @@ class ZFMFormatter():
     def f_human(self, data, consumer, delimiters):
         prefix, suffix, line_break = delimiters
 
-        output  = ''
-        output += line_break
-        output += 'ZFM address  : {}{}'.format(data['ZFM'], line_break)
-        output += 'Generated at : {}{}'.format(data['Timestamp'], line_break)
-        output += line_break
-        output += line_break
+        yield prefix
+        yield line_break
+        yield 'ZFM address  : {}{}'.format(data['ZFM'], line_break)
+        yield 'Generated at : {}{}'.format(data['Timestamp'], line_break)
+        yield line_break
+        yield line_break
 
         header = '{:<20} {:<10} {:<21} {:<15} {:<15} {:<15}' + line_break
         layout = '{}{} {:<10} {:<21} {:<15} {:<15} {:<15}' + line_break
 
-        output += header.format('Hostname', 'Type', 'IP address', 'Config state', 'Power state', 'Status/Health')
-        output += header.format('-'*20, '-'*10, '-'*21, '-'*15, '-'*15, '-'*15)
+        yield header.format('Hostname', 'Type', 'IP address', 'Config state', 'Power state', 'Status/Health')
+        yield header.format('-'*20, '-'*10, '-'*21, '-'*15, '-'*15, '-'*15)
 
         for name,node in data['Nodes'].items():
             node_type = node['Type']
@@ -85,13 +98,17 @@ class ZFMFormatter():
             href = '<a href={}>{}</a>'.format(name, name) if consumer == 'BROWSER' else name
             filler = ' '*(20 - len(name))
 
-            output += layout.format(href, filler, node_type, ip_address, config_state, power_state, status)
+            yield layout.format(href, filler, node_type, ip_address, config_state, power_state, status)
 
-        return prefix + output + suffix
+        yield suffix
 
 
     def f_machine(self, data, consumer, delimiters):
-        return json.dumps(data)
+        return json.JSONEncoder().iterencode(data)
+
+
+    def f_lines(self, data, consumer, delimiters):
+        return self.lines(data, 'Nodes', 'Name', delimiters)
 
 # ----------------------------------------------------------------------------------------------------------------------
 
@@ -102,37 +119,37 @@ class ZFMFormatter():
     def n_human(self, data, consumer, delimiters):
         prefix, suffix, line_break = delimiters
 
-        output  = ''
-        output += line_break
-        output += 'ZFM address  : {}{}'.format(data['ZFM'], line_break)
-        output += 'Generated at : {}{}'.format(data['Timestamp'], line_break)
-        output += line_break
-        output += line_break
+        yield prefix
+        yield line_break
+        yield 'ZFM address  : {}{}'.format(data['ZFM'], line_break)
+        yield 'Generated at : {}{}'.format(data['Timestamp'], line_break)
+        yield line_break
+        yield line_break
 
         #
         # For enabled nodes, all the fields should be valid.
         #
         if data['ConfigState'] != 'Enabled':
-            output += '{} is {}{}'.format(data['Hostname'], data['ConfigState'], line_break)
-            return prefix + output + suffix
+            yield '{} is {}{}'.format(data['Hostname'], data['ConfigState'], line_break)
+            yield suffix
+            return
 
         #
         # For enabled nodes, all the fields should be valid.
         #
-        output += ''
-        output += 'Node name      {:<}{}'.format(data['Name'], line_break)
-        output += 'Hostname       {:<}{}'.format(data['Hostname'], line_break)
-        output += 'FQDN           {:<}{}'.format(data['FQDN'], line_break)
-        output += line_break
-        output += 'Config state   {:<}{}'.format(data['ConfigState'], line_break)
-        output += 'Power state    {:<}{}'.format(data['ConfigState'], line_break)
-        output += 'Status         {:<}{}'.format(data['Status'], line_break)
-        output += line_break
-        output += 'UID            0x{:<X}{}'.format(data['UID'], line_break)
-        output += 'TopoID         {:<}{}'.format(data['TopoID'], line_break)
-        output += 'GeoID          {:<}{}'.format(data['GeoID'], line_break)
-        output += 'AsicID         {:<}{}'.format(data['AsicID'], line_break)
-        output += line_break
+        yield 'Node name      {:<}{}'.format(data['Name'], line_break)
+        yield 'Hostname       {:<}{}'.format(data['Hostname'], line_break)
+        yield 'FQDN           {:<}{}'.format(data['FQDN'], line_break)
+        yield line_break
+        yield 'Config state   {:<}{}'.format(data['ConfigState'], line_break)
+        yield 'Power state    {:<}{}'.format(data['ConfigState'], line_break)
+        yield 'Status         {:<}{}'.format(data['Status'], line_break)
+        yield line_break
+        yield 'UID            0x{:<X}{}'.format(data['UID'], line_break)
+        yield 'TopoID         {:<}{}'.format(data['TopoID'], line_break)
+        yield 'GeoID          {:<}{}'.format(data['GeoID'], line_break)
+        yield 'AsicID         {:<}{}'.format(data['AsicID'], line_break)
+        yield line_break
 
         #
         # Loop over the ports to get the basic states.
@@ -140,20 +157,24 @@ class ZFMFormatter():
         header = '{:<4} {:<15}  {:<15}  {:<21}  {:<15}  {:<}' + line_break
         layout = '{}{} {:<15}  {:<15}  {:<21}  {:<15}  {:<}' + line_break
 
-        output += header.format('', '', '', '', '', 'Remote Node')
-        output += header.format('Port', 'Config state', 'Status/Health', 'Link state', 'Interface state', 'UID/Port #')
-        output += header.format('-'*4, '-'*15, '-'*15, '-'*21, '-'*15, '-'*15)
+        yield header.format('', '', '', '', '', 'Remote Node')
+        yield header.format('Port', 'Config state', 'Status/Health', 'Link state', 'Interface state', 'UID/Port #')
+        yield header.format('-'*4, '-'*15, '-'*15, '-'*21, '-'*15, '-'*15)
 
         for index, port in sorted(data['Ports'].items()):
             href = '<a href={}/{}>{}</a>'.format(data['Name'], index, index) if consumer == 'BROWSER' else index
             filler = ' '*(4-len(str(index)))
-            output += layout.format(href, filler, port['ConfigState'], port['Status'], port['LinkState'], port['InterfaceState'], port['Remote'])
+            yield layout.format(href, filler, port['ConfigState'], port['Status'], port['LinkState'], port['InterfaceState'], port['Remote'])
 
-        return prefix + output + suffix
+        yield suffix
 
 
     def n_machine(self, data, consumer, delimiters):
-        return json.dumps(data)
+        return json.JSONEncoder().iterencode(data)
+
+
+    def n_lines(self, data, consumer, delimiters):
+        return self.lines(data, 'Ports', 'Port', delimiters)
 
 # ----------------------------------------------------------------------------------------------------------------------
 
@@ -164,33 +185,33 @@ class ZFMFormatter():
     def p_human(self, data, consumer, delimiters):
         prefix, suffix, line_break = delimiters
 
-        output  = ''
-        output += line_break
-        output += 'ZFM address  : {}{}'.format(data['ZFM'], line_break)
-        output += 'Generated at : {}{}'.format(data['Timestamp'], line_break)
-        output += line_break
-        output += line_break
+        yield prefix
+        yield line_break
+        yield 'ZFM address  : {}{}'.format(data['ZFM'], line_break)
+        yield 'Generated at : {}{}'.format(data['Timestamp'], line_break)
+        yield line_break
+        yield line_break
 
         #
         # For disabled ports, nothing is valid.
         #
         if data['ConfigState'] != 'Enabled':
-            output += '{} port {} is {}{}'.format(data['Hostname'], data['Index'], data['ConfigState'], line_break)
-            return prefix + output + suffix
+            yield '{} port {} is {}{}'.format(data['Hostname'], data['Index'], data['ConfigState'], line_break)
+            yield suffix
+            return
 
         #
         # For enabled nodes, all the fields should be valid.
         #
-        output += ''
-        output += '{:<} port {}{}'.format(data['Hostname'], data['Index'], line_break)
-        output += line_break
-        output += '    Config State       {:<}{}'.format(data['ConfigState'], line_break)
-        output += '    Status/Health      {:<}{}'.format(data['Status'], line_break)
-        output += '    Link State         {:<}{}'.format(data['LinkState'], line_break)
-        output += '    Interface State    {:<}{}'.format(data['InterfaceState'], line_break)
-        output += '    Remote neighbor    {:<}{}'.format(data['Remote'], line_break)
-        output += line_break
-        output += line_break
+        yield '{:<} port {}{}'.format(data['Hostname'], data['Index'], line_break)
+        yield line_break
+        yield '    Config State       {:<}{}'.format(data['ConfigState'], line_break)
+        yield '    Status/Health      {:<}{}'.format(data['Status'], line_break)
+        yield '    Link State         {:<}{}'.format(data['LinkState'], line_break)
+        yield '    Interface State    {:<}{}'.format(data['InterfaceState'], line_break)
+        yield '    Remote neighbor    {:<}{}'.format(data['Remote'], line_break)
+        yield line_break
+        yield line_break
 
         #
         # Format the metrics.
@@ -199,15 +220,15 @@ class ZFMFormatter():
         if metrics:
             layout = '    {:<24}  {:>20}' + line_break
 
-            output += 'Interface Statistics:' + line_break
+            yield 'Interface Statistics:' + line_break
 
             interface_metrics = metrics['Interface']
             for s in Metrics.interface_fields():
-                output += layout.format(s, interface_metrics[s])
+                yield layout.format(s, interface_metrics[s])
 
-            output += line_break
-            output += line_break
-            output += line_break
+            yield line_break
+            yield line_break
+            yield line_break
 
             #
             # Header and value format for counters and bytes.
@@ -221,49 +242,235 @@ class ZFMFormatter():
             response_metrics = metrics.get('Response', None)
 
             if request_metrics and response_metrics:
-                output += 'Requestor/Responder Interface Statistics:' + line_break
-                output += line_break
-                output += layout.format('', 'Xmit Count', 'Xmit Bytes', 'Recv Count', 'Recv Bytes', '')
-                output += layout.format('Requests',
-                                      request_metrics['XmitCount'],
-                                      request_metrics['XmitBytes'],
-                                      request_metrics['RecvCount'],
-                                      request_metrics['RecvBytes'],
-                                      '')
-                output += layout.format('Responses',
-                                      response_metrics['XmitCount'],
-                                      response_metrics['XmitBytes'],
-                                      response_metrics['RecvCount'],
-                                      response_metrics['RecvBytes'],
-                                      '')
-
-                output += line_break
-                output += line_break
-                output += line_break
+                yield 'Requestor/Responder Interface Statistics:' + line_break
+                yield line_break
+                yield layout.format('', 'Xmit Count', 'Xmit Bytes', 'Recv Count', 'Recv Bytes', '')
+                yield layout.format('Requests',
+                                  request_metrics['XmitCount'],
+                                  request_metrics['XmitBytes'],
+                                  request_metrics['RecvCount'],
+                                  request_metrics['RecvBytes'],
+                                  '')
+                yield layout.format('Responses',
+                                  response_metrics['XmitCount'],
+                                  response_metrics['XmitBytes'],
+                                  response_metrics['RecvCount'],
+                                  response_metrics['RecvBytes'],
+                                  '')
+
+                yield line_break
+                yield line_break
+                yield line_break
 
             #
             # Port VC statistics.
             #
             vc_metrics = metrics.get('VC0', None)
             if vc_metrics:
-                output += 'Packet Relay Interface Statistics:' + line_break
-                output += line_break
-                output += layout.format('', 'Xmit Packets', 'Xmit Bytes', 'Recv Packets', 'Recv Bytes', 'Occupancy')
+                yield 'Packet Relay Interface Statistics:' + line_break
+                yield line_break
+                yield layout.format('', 'Xmit Packets', 'Xmit Bytes', 'Recv Packets', 'Recv Bytes', 'Occupancy')
 
                 for vc in range(16):
                     vc_key = 'VC{}'.format(vc)
-                    output += layout.format(vc_key,
-                                          metrics[vc_key]['XmitCount'],
-                                          metrics[vc_key]['XmitBytes'],
-                                          metrics[vc_key]['RecvCount'],
-                                          metrics[vc_key]['RecvBytes'],
-                                          metrics[vc_key]['Occupancy'])
+                    yield layout.format(vc_key,
+                                      metrics[vc_key]['XmitCount'],
+                                      metrics[vc_key]['XmitBytes'],
+                                      metrics[vc_key]['RecvCount'],
+                                      metrics[vc_key]['RecvBytes'],
+                                      metrics[vc_key]['Occupancy'])
 
-        return prefix + output + suffix
+        yield suffix
 
 
     def p_machine(self, data, consumer, delimiters):
-        return json.dumps(data)
+        return json.JSONEncoder().iterencode(data)
+
+
+    def p_lines(self, data, consumer, delimiters):
+        return self.lines(data, 'Metrics', 'Group', delimiters)
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+    def h_browser(self, data, consumer, delimiters):
+        return self.h_human(data, consumer, delimiters)
+
+
+    def h_human(self, data, consumer, delimiters):
+        prefix, suffix, line_break = delimiters
+
+        yield prefix
+        yield line_break
+        yield 'ZFM address  : {}{}'.format(data['ZFM'], line_break)
+        yield 'Generated at : {}{}'.format(data['Timestamp'], line_break)
+        yield line_break
+        yield line_break
+
+        window = '{} seconds'.format(data['Window']) if data['Window'] is not None else 'all'
+
+        yield '{:<} port {} history{}'.format(data['Hostname'], data['Index'], line_break)
+        yield line_break
+        yield '    Samples            {:<} of {}{}'.format(data['Samples'], data['Retention'], line_break)
+        yield '    Window             {:<}{}'.format(window, line_break)
+        yield line_break
+        yield line_break
+
+        #
+        # One line per counter, then one line per gauge.
+        #
+        counters = [ (field, series) for field, series in data['Series'].items() if 'Delta' in series ]
+        gauges   = [ (field, series) for field, series in data['Series'].items() if 'Delta' not in series ]
+
+        layout = '{:<32}  {:>20}  {:>20}' + line_break
+
+        if counters:
+            yield layout.format('Counter', 'Delta', 'Rate (/s)')
+            yield layout.format('-'*32, '-'*20, '-'*20)
+
+            for field, series in counters:
+                yield layout.format(field, '{:.0f}'.format(series['Delta']), '{:.2f}'.format(series['Rate']))
+
+            yield line_break
+
+        layout = '{:<32}  {:>20}  {:>20}  {:>20}' + line_break
+
+        if gauges:
+            yield layout.format('Gauge', 'Last', 'Mean', 'Max')
+            yield layout.format('-'*32, '-'*20, '-'*20, '-'*20)
+
+            for field, series in gauges:
+                yield layout.format(field, '{:.0f}'.format(series['Last']), '{:.2f}'.format(series['Mean']), '{:.0f}'.format(series['Max']))
+
+        yield suffix
+
+
+    def h_machine(self, data, consumer, delimiters):
+        return json.JSONEncoder().iterencode(data)
+
+
+    def h_lines(self, data, consumer, delimiters):
+        return self.lines(data, 'Series', 'Field', delimiters)
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+    def m_browser(self, data, consumer, delimiters):
+        return self.m_human(data, consumer, delimiters)
+
+
+    def m_human(self, data, consumer, delimiters):
+        prefix, suffix, line_break = delimiters
+
+        def escape(value):
+            return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+        #
+        # Prometheus text exposition format : HELP and TYPE for each family, then one line per
+        # sample.
+        #
+        yield prefix
+
+        for name, family in data['Metrics'].items():
+            yield '# HELP {} {}{}'.format(name, family['Help'], line_break)
+            yield '# TYPE {} {}{}'.format(name, family['Type'], line_break)
+
+            for sample in family['Samples']:
+                labels = ','.join('{}="{}"'.format(key, escape(value)) for key,value in sample['Labels'].items())
+                yield '{}{{{}}} {}{}'.format(name, labels, sample['Value'], line_break)
+
+        yield suffix
+
+
+    def m_machine(self, data, consumer, delimiters):
+        return json.JSONEncoder().iterencode(data)
+
+
+    def m_lines(self, data, consumer, delimiters):
+        return self.lines(data, 'Metrics', 'Name', delimiters)
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+    def s_browser(self, data, consumer, delimiters):
+        return self.s_human(data, consumer, delimiters)
+
+
+    def s_human(self, data, consumer, delimiters):
+        prefix, suffix, line_break = delimiters
+
+        def ms(value):
+            return '{:.1f}'.format(value*1000) if value is not None else '--'
+
+        yield prefix
+        yield line_break
+        yield 'ZFM address  : {}{}'.format(data['ZFM'], line_break)
+        yield 'Generated at : {}{}'.format(data['Timestamp'], line_break)
+        yield line_break
+        yield line_break
+
+        #
+        # Fabric wide steps.
+        #
+        layout = '{:<12} {:<26} {:<26} {:>10}' + line_break
+
+        yield layout.format('Phase', 'Start', 'End', 'Elapsed')
+        yield layout.format('-'*12, '-'*26, '-'*26, '-'*10)
+
+        for command, phase in data['Phases'].items():
+            yield layout.format(command, phase['Start'], phase['End'], '{:.2f}'.format(phase['Elapsed']))
+
+        yield line_break
+        yield line_break
+
+        #
+        # REST requests by node and verb.  Times are in milliseconds.
+        #
+        layout = '{:<12} {:<10} {:>8} {:>7} {:>8} {:>6} {:>8} {:>8} {:>8} {:>8} {:>8}' + line_break
+
+        yield layout.format('Node', 'Verb', 'Requests', 'Retries', 'Timeouts', 'Errors', 'Mean', 'P50', 'P90', 'P99', 'Max')
+        yield layout.format('-'*12, '-'*10, '-'*8, '-'*7, '-'*8, '-'*6, '-'*8, '-'*8, '-'*8, '-'*8, '-'*8)
+
+        for name, node_stats in data['Nodes'].items():
+            for verb, stats in node_stats['Rest'].items():
+                latency = stats['Latency']
+                yield layout.format(name, verb, stats['Requests'], stats['Retries'], stats['Timeouts'], stats['Errors'],
+                                    ms(latency['Mean']), ms(latency['P50']), ms(latency['P90']), ms(latency['P99']), ms(latency['Max']))
+
+        yield line_break
+        yield line_break
+
+        #
+        # The last run of each node command.
+        #
+        layout = '{:<12} {:<12} {:<26} {:>10}' + line_break
+
+        yield layout.format('Node', 'Command', 'Start', 'Elapsed')
+        yield layout.format('-'*12, '-'*12, '-'*26, '-'*10)
+
+        for name, node_stats in data['Nodes'].items():
+            for command, phase in node_stats['Phases'].items():
+                yield layout.format(name, command, phase['Start'], '{:.2f}'.format(phase['Elapsed']))
+
+        yield suffix
+
+
+    def s_machine(self, data, consumer, delimiters):
+        return json.JSONEncoder().iterencode(data)
+
+
+    def s_lines(self, data, consumer, delimiters):
+        return self.lines(data, 'Nodes', 'Name', delimiters)
 
 # ----------------------------------------------------------------------------------------------------------------------
 
+    def lines(self, data, collection, item_name, delimiters):
+        prefix, suffix, line_break = delimiters
+
+        #
+        # Line delimited JSON : the first line has the scalar fields, then there is one line per
+        # member of the collection, named by item_name.  Each line parses on its own.
+        #
+        yield json.dumps({ key : value for key,value in data.items() if key != collection }) + line_break
+
+        for name, value in (data.get(collection) or {}).items():
+            yield json.dumps({ item_name : name, **value }) + line_break
+
+# ----------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+#
+# (C) Copyright 2020 Hewlett Packard Enterprise Development LP.
+# Licensed under the Apache v2.0 license.
+#
+
+import re
+import os
+import sys
+import bisect
+
+from threading import Lock
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+LATENCY_BUCKETS = [ 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0 ]     # seconds
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class Histogram():
+
+    #
+    # Fixed bucket histogram.  counts[i] holds the values <= bounds[i] (and > bounds[i-1]), the
+    # last slot holds everything above the largest bound.
+    #
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self.lock = Lock()
+
+
+    def record(self, value):
+        slot = bisect.bisect_left(self.bounds, value)
+
+        with self.lock:
+            self.counts[slot] += 1
+            self.count += 1
+            self.sum += value
+            self.min = value if self.min is None else min(self.min, value)
+            self.max = value if self.max is None else max(self.max, value)
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+    def percentile(self, p):
+        #
+        # The upper bound of the bucket holding the p'th value.  The overflow bucket has no bound,
+        # so the largest value seen stands in for it.
+        #
+        if self.count == 0:
+            return None
+
+        rank = p * self.count
+        total = 0
+        for slot, count in enumerate(self.counts):
+            total += count
+            if total >= rank:
+                return min(self.bounds[slot], self.max) if slot < len(self.bounds) else self.max
+
+        return self.max
+
+
+    def summary(self):
+        with self.lock:
+            cumulative = 0
+            buckets = {}
+            for bound, count in zip(self.bounds + [ '+Inf' ], self.counts):
+                cumulative += count
+                buckets[str(bound)] = cumulative
+
+            return { 'Count'   : self.count,
+                     'Sum'     : self.sum,
+                     'Mean'    : self.sum / self.count if self.count else None,
+                     'Min'     : self.min,
+                     'Max'     : self.max,
+                     'P50'     : self.percentile(0.50),
+                     'P90'     : self.percentile(0.90),
+                     'P99'     : self.percentile(0.99),
+                     'Buckets' : buckets
+            }
+
+# ----------------------------------------------------------------------------------------------------------------------
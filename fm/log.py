@@ -8,9 +8,23 @@ import re
 import os
 import sys
 import json
+import time
+import queue
+import string
+import atexit
 import logging
 import logging.handlers
 
+from threading import Lock
+from threading import Thread
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+LOG_RATE_LIMIT  = 10        # times a message may be logged in each window before it is suppressed
+LOG_RATE_WINDOW = 60        # seconds in the rate limit window
+LOG_RATE_KEYS   = 1000      # messages tracked before expired windows are cleared out
+LOG_RATE_FLUSH  = 5         # seconds between checks for expired windows with suppressed messages
+
 # ----------------------------------------------------------------------------------------------------------------------
 
 class Log():
@@ -21,6 +35,17 @@ class Log():
                       'critical' : logging.CRITICAL }
     log_level = log_level_map['warning']
     logger = None
+    listener = None
+
+    #
+    # Rate limit windows : (level, template, identity) -> [window start, count, suppressed, last
+    # suppressed message].  The template is the unformatted message, so messages that differ
+    # only in their values (counts, states) share a window.  The identity is the arguments in
+    # the message's subject (before the first ' : ', e.g. '{}[{}].sweep : ...'), which name the
+    # node and port, so one noisy port doesn't silence the others.
+    #
+    windows = {}
+    windows_lock = Lock()
 
 
     @staticmethod
@@ -50,39 +75,131 @@ class Log():
         console_handler.setFormatter(formatter)
 
         #
-        # Create logger and add the handlers.
+        # The callers only put records on a queue.  A background listener thread does the
+        # syslog and console writes, so a slow syslog never holds up a node thread.  The
+        # queue is drained at exit.
+        #
+        log_queue = queue.SimpleQueue()
+        Log.listener = logging.handlers.QueueListener(log_queue, syslog_handler, console_handler,
+                                                      respect_handler_level=True)
+        Log.listener.start()
+        atexit.register(Log.listener.stop)
+
+        #
+        # Create logger and add the queue handler.
         #
         Log.logger = logging.getLogger('ZFM')
         Log.logger.setLevel(Log.log_level)
-        Log.logger.addHandler(syslog_handler)
-        Log.logger.addHandler(console_handler)
+        Log.logger.addHandler(logging.handlers.QueueHandler(log_queue))
+
+        #
+        # Suppressed counts are reported when their window runs out (and at exit), not only if
+        # the message comes up again.
+        #
+        Thread(target=Log.flush_windows, daemon=True).start()
+        atexit.register(Log.report_suppressed, True)
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def rate_limit(level, template, args, msg):
+        #
+        # Returns the number of copies suppressed since the last one logged, or -1 if this one
+        # should be suppressed too.
+        #
+        now = time.time()
+
+        subject, separator, _ = template.partition(' : ')
+        if separator:
+            fields = sum(1 for _, field, _, _ in string.Formatter().parse(subject) if field is not None)
+        else:
+            fields = len(args)
+
+        key = (level, template, tuple(str(arg) for arg in args[:fields]))
+
+        with Log.windows_lock:
+            window = Log.windows.get(key, None)
+            if not window or (now - window[0] >= LOG_RATE_WINDOW):
+                if len(Log.windows) >= LOG_RATE_KEYS:
+                    Log.windows = { k : w for k,w in Log.windows.items() if now - w[0] < LOG_RATE_WINDOW }
+
+                suppressed = window[2] if window else 0
+                Log.windows[key] = [now, 1, 0, None]
+                return suppressed
+
+            if window[1] >= LOG_RATE_LIMIT:
+                window[2] += 1
+                window[3] = msg
+                return -1
+
+            window[1] += 1
+            return 0
+
+
+    @staticmethod
+    def log(level, msg, args, kwargs):
+        #
+        # The message is only formatted if the level is enabled.
+        #
+        if not Log.logger.isEnabledFor(level):
+            return
+
+        template = msg
+        msg = template.format(*args, **kwargs)
+
+        suppressed = Log.rate_limit(level, template, args, msg)
+        if suppressed < 0:
+            return
+
+        if suppressed > 0:
+            msg = '{} ({} similar messages suppressed)'.format(msg, suppressed)
+
+        Log.logger.log(level, msg)
+
+
+    @staticmethod
+    def report_suppressed(everything=False):
+        #
+        # Close the expired windows (or all of them) and log the last suppressed copy of each
+        # message that had any.
+        #
+        now = time.time()
+        with Log.windows_lock:
+            closed = [ (key, window) for key,window in Log.windows.items() if everything or now - window[0] >= LOG_RATE_WINDOW ]
+            for key, _ in closed:
+                del Log.windows[key]
+
+        for (level, _, _), (_, _, suppressed, msg) in closed:
+            if suppressed > 0:
+                Log.logger.log(level, '{} ({} similar messages suppressed)'.format(msg, suppressed))
+
+
+    @staticmethod
+    def flush_windows():
+        while True:
+            time.sleep(LOG_RATE_FLUSH)
+            Log.report_suppressed()
 
 # ----------------------------------------------------------------------------------------------------------------------
 
     @staticmethod
     def debug(msg, *args, **kwargs):
-        msg = msg.format(*args, **kwargs)
-        Log.logger.debug(msg)
+        Log.log(logging.DEBUG, msg, args, kwargs)
 
     @staticmethod
     def info(msg, *args, **kwargs):
-        msg = msg.format(*args, **kwargs)
-        Log.logger.info(msg)
+        Log.log(logging.INFO, msg, args, kwargs)
 
     @staticmethod
     def warning(msg, *args, **kwargs):
-        msg = msg.format(*args, **kwargs)
-        Log.logger.warning(msg)
+        Log.log(logging.WARNING, msg, args, kwargs)
 
     @staticmethod
     def error(msg, *args, **kwargs):
-        msg = msg.format(*args, **kwargs)
-        Log.logger.error(msg)
+        Log.log(logging.ERROR, msg, args, kwargs)
 
     @staticmethod
     def critical(msg, *args, **kwargs):
-        msg = msg.format(*args, **kwargs)
-        Log.logger.critical(msg)
+        Log.log(logging.CRITICAL, msg, args, kwargs)
 
 # ----------------------------------------------------------------------------------------------------------------------
-
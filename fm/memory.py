@@ -53,4 +53,11 @@ class Memory(Node):
         #
         return True
 
+
+    def probe_specific(self):
+        #
+        # Warm restart check of the memory specific attributes.
+        #
+        return True
+
 # ----------------------------------------------------------------------------------------------------------------------
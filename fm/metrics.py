@@ -8,22 +8,42 @@ import re
 import os
 import sys
 import copy
+import time
 
-from km.fm.log import Log
+from km.fm.log        import Log
+from km.fm.timeseries import TimeSeries
 
 # ----------------------------------------------------------------------------------------------------------------------
 
 class Metrics():
 
+    #
+    # Number of samples kept in each port's metrics history.
+    #
+    retention = 360
+
     def __init__(self, node, port, name):
         self.node = node
         self.port = port
         self.name = name
         self.data = None
+        self.errors_rising = False
+        self.current = None
+        self.current_time = 0
+        self.history = TimeSeries(Metrics.series_fields(), Metrics.retention, Metrics.gauge_fields())
 
 
     def get(self):
-        return self.node.get(self.name)
+        #
+        # Every successful read becomes the current view and goes into the history.
+        #
+        status, attr = self.node.get(self.name)
+        if status:
+            self.current = attr
+            self.current_time = time.time()
+            self.history.record(self.current_time, Metrics.sample(attr))
+
+        return status, attr
 
 
     def patch(self, metrics_data):
@@ -67,11 +87,13 @@ class Metrics():
             if v_curr != v_last:
                 Log.error('{:<20} port {:<2} : {:<25} : {} -> {}', self.node.name, self.port.index, s, v_last, v_curr)
 
+        self.errors_rising = any(attr['Gen-Z'].get(s, 0) > self.data['Gen-Z'].get(s, 0) for s in Metrics.error_fields())
+
         self.data = copy.deepcopy(attr)
         return status
 
     @staticmethod
-    def interface_fields():
+    def error_fields():
         return [ 'PCRCErrors',
                  'ECRCErrors',
                  'TXStompedECRC',
@@ -83,7 +105,11 @@ class Metrics():
                  'ReceivedECN',
                  'LinkNTE',
                  'AKEYViolations',
+        ]
 
+    @staticmethod
+    def interface_fields():
+        return Metrics.error_fields() + [
                  'TotalTransReqs',
                  'TotalTransReqBytes',
                  'TotalRecvReqs',
@@ -94,4 +120,38 @@ class Metrics():
                  'TotalRecvRespBytes',
         ]
 
+    @staticmethod
+    def series_fields():
+        #
+        # Names of the counters kept in the history : 'Interface.<field>', 'Request.<field>',
+        # 'Response.<field>' and 'VC<n>.<field>'.
+        #
+        fields  = [ 'Interface.{}'.format(s) for s in Metrics.interface_fields() ]
+        fields += [ '{}.{}'.format(group, s) for group in [ 'Request', 'Response' ] for s in [ 'XmitCount', 'XmitBytes', 'RecvCount', 'RecvBytes' ] ]
+        fields += [ 'VC{}.{}'.format(vc, s) for vc in range(16) for s in [ 'XmitCount', 'XmitBytes', 'RecvCount', 'RecvBytes', 'Occupancy' ] ]
+        return fields
+
+    @staticmethod
+    def gauge_fields():
+        #
+        # History fields that are levels rather than counters.
+        #
+        return [ 'VC{}.Occupancy'.format(vc) for vc in range(16) ]
+
+    @staticmethod
+    def sample(attr):
+        #
+        # Flatten a metrics attribute into series_fields() order.  Counters the node doesn't
+        # report are recorded as 0.
+        #
+        groups = dict(attr.get('Oem', {}).get('Hpe', {}).get('Metrics', {}))
+        groups['Interface'] = attr.get('Gen-Z', {})
+
+        values = []
+        for field in Metrics.series_fields():
+            group, _, name = field.partition('.')
+            values.append(groups.get(group, {}).get(name, 0))
+
+        return values
+
 # ----------------------------------------------------------------------------------------------------------------------
@@ -12,20 +12,31 @@ import json
 import copy
 import glob
 import socket
+import hashlib
 import datetime
-import multiprocessing
 
 from enum      import Enum
+from http      import HTTPStatus
 from queue     import Queue
 from threading import Thread
 
+from concurrent.futures import ThreadPoolExecutor
+
 from km.fm.log     import Log
 from km.fm.port    import Port
 from km.fm.rest    import Rest
+from km.fm.rest    import RestStats
 from km.fm.chassis import Chassis
 
 # ----------------------------------------------------------------------------------------------------------------------
 
+POLL_MIN_DELAY = 0.05       # first port poll interval (seconds)
+POLL_MAX_DELAY = 1.0        # port poll interval back off limit (seconds)
+PORT_WORKERS   = 8          # concurrent port operations per node
+TELEMETRY_WAIT = 3.0        # how long to wait for telemetry services to turn off (seconds)
+
+# ----------------------------------------------------------------------------------------------------------------------
+
 class WIStatus(Enum):
     IDLE        = 1         # Not started yet
     BUSY        = 2         # Busy processing
@@ -36,11 +47,23 @@ class WIStatus(Enum):
 
 class Node():
 
+    #
+    # Bringup steps and the status each one sets.
+    #
+    phases = { 'init'     : 'inited',
+               'train'    : 'trained',
+               'validate' : 'validated',
+               'load'     : 'loaded',
+               'enable'   : 'enabled',
+               'bringup'  : 'brought_up',
+    }
+
     def __init__(self, name, profile):
 
         #
-        # Save the attributes.
+        # Save the attributes.  The profile digest is taken before anything in it is resolved.
         #
+        self.profile_digest = hashlib.sha1(json.dumps(profile, sort_keys=True).encode()).hexdigest()
         self.name = name
         self.type = profile['type']
         self.active = profile['Active'] == 'Enabled'
@@ -53,6 +76,8 @@ class Node():
         self.port_states = profile['ports']
         self.num_ports = len(profile['ports'])
         self.profile = profile
+        self.deeppatch_supported = True
+        self.etags = {}
 
         address, sep, port = profile['address'].partition(':')
         try:
@@ -77,19 +102,48 @@ class Node():
         self.validated = WIStatus.IDLE
         self.loaded = WIStatus.IDLE
         self.enabled = WIStatus.IDLE
-        self.swept = WIStatus.IDLE
+        self.brought_up = WIStatus.IDLE
+        self.probed = WIStatus.IDLE
+
+        #
+        # A warm node matched the fabric snapshot at startup and skips the bringup steps.
+        #
+        self.warm = False
+
+        #
+        # Link peers are filled in by the fabric once all of the nodes exist.
+        #
+        self.peers = []
+
+        #
+        # Sweep counts and the duration of the last one.  The node itself is checked once a sweep
+        # interval, so its checks count the sweep rounds.
+        #
+        self.sweep_count = 0
+        self.sweep_rounds = 0
+        self.sweep_seconds = 0.0
+
+        #
+        # REST latencies and the start/end times of the last run of each command.
+        #
+        self.rest_stats = RestStats()
+        self.phase_times = {}
 
         #
         # Load the attributes.
         #
-        with open(profile['attributes']) as f:
-            self.configuration = json.load(f)
+        with open(profile['attributes'], 'rb') as f:
+            attributes = f.read()
+
+        self.configuration = json.loads(attributes)
+        self.attributes_digest = hashlib.sha1(attributes).hexdigest()
 
         #
         #
-        # Create a work queue.
+        # Create a work queue and the pool that runs the port operations.
         #
         self.queue = Queue()
+        self.port_pool = ThreadPoolExecutor(max_workers=PORT_WORKERS, thread_name_prefix=name)
 
         #
         # Start the thread.
@@ -119,6 +173,56 @@ class Node():
     def patch(self, name, value):
         return Rest.patch(self, name, value)
 
+
+    def deepget(self, name):
+        return Rest.deepget(self, name)
+
+
+    def diff_entries(self, name, entries):
+        #
+        # Read what the node holds at or below name and keep only the entries that differ.
+        # If the node can't tell us, then everything gets loaded.
+        #
+        status, current = self.deepget(name)
+        if not status:
+            Log.info('{} : can\'t read {} - loading all entries', self.name, name)
+            return entries, {}
+
+        entries = { entry_name : value for entry_name,value in entries.items() if not Node.matches(current.get(entry_name), value) }
+        return entries, current
+
+
+    @staticmethod
+    def matches(current, value):
+        if type(value) is dict:
+            return type(current) is dict and all(key in current and Node.matches(current[key], value[key]) for key in value)
+        else:
+            return current == value
+
+
+    def deeppatch(self, name, values):
+        if not values:
+            return True, None
+
+        #
+        # Load the whole table in one request.  If the node doesn't support DEEPPATCH (405, or
+        # 501 from a server that doesn't know the verb), then remember that and fall back to one
+        # PATCH per entry.  Any other failure is just a failure.
+        #
+        if self.deeppatch_supported:
+            status, http_status = Rest.deeppatch(self, name, values)
+            if http_status not in [ HTTPStatus.METHOD_NOT_ALLOWED, HTTPStatus.NOT_IMPLEMENTED ]:
+                return status, None
+
+            self.deeppatch_supported = False
+
+        status = True
+        for entry_name, entry_value in values.items():
+            entry_status, _ = Rest.patch(self, entry_name, entry_value)
+            status &= entry_status
+
+        return status, None
+
 # ----------------------------------------------------------------------------------------------------------------------
 
     def init_endpoints(self):
@@ -170,6 +274,22 @@ class Node():
 
         return status
 
+
+    def wait_telemetry_off(self):
+        #
+        # Poll until telemetry services report off rather than sleeping for the worst case.
+        #
+        delay = POLL_MIN_DELAY
+        deadline = time.time() + TELEMETRY_WAIT
+
+        status = self.is_telemetry_off()
+        while (not status) and (time.time() < deadline):
+            time.sleep(min(delay, max(0, deadline - time.time())))
+            delay = min(2*delay, POLL_MAX_DELAY)
+            status = self.is_telemetry_off()
+
+        return status
+
 # ----------------------------------------------------------------------------------------------------------------------
 
     def done_status(self, status):
@@ -182,28 +302,32 @@ class Node():
 
 # ----------------------------------------------------------------------------------------------------------------------
 
-    def do_active(self, function):
+    def do_active(self, function, *args):
         #
-        # Execute the given function name on all of the active ports.  It returns True if
-        # every function succeeds else False.
+        # Execute the given function name on all of the active ports using the port pool.  It
+        # returns True if every function succeeds else False.  The ports run in this process, so
+        # any state they change (e.g. port.active) is kept.
         #
-        return all(getattr(port, function)() for port in self.ports if port.active)
+        ports = [ port for port in self.ports if port.active ]
+        statuses = list(self.port_pool.map(lambda port: getattr(port, function)(*args), ports))
 
+        return all(statuses)
 
-    def do_child_active(self, function, stdout):
-        status = self.do_active(function)
-        stdout.send(status)
-        stdout.close()
 
+    def wait_active(self, function, timeout):
+        #
+        # Poll the active ports until the function succeeds on all of them or the timeout expires.
+        # The poll interval starts small and backs off, so fast ports finish fast without slow
+        # ones being hammered.
+        #
+        delay = POLL_MIN_DELAY
+        deadline = time.time() + timeout
 
-    def do_mp_active(self, function):
-        stdin, stdout = multiprocessing.Pipe()
-        process = multiprocessing.Process(target=self.do_child_active, name=self.name, args=(function,stdout))
-        process.daemon = True
-        process.start()
-        status = stdin.recv()
-        process.join()
-        stdin.close()
+        status = self.do_active(function)
+        while (not status) and (time.time() < deadline):
+            time.sleep(min(delay, max(0, deadline - time.time())))
+            delay = min(2*delay, POLL_MAX_DELAY)
+            status = self.do_active(function)
 
         return status
 
@@ -253,7 +377,7 @@ class Node():
             return
 
         #
-        # Train the ports one at a time.
+        # Train the ports on the node's port pool (at most PORT_WORKERS at a time).
         #
         if not self.do_active('train'):
             Log.error('{} : ports didn\'t train', self.name)
@@ -262,22 +386,15 @@ class Node():
 
         #
         # Wait for Port.Status to transition to StandbyOffline.
-        # If the ports don't transition in 200 seconds, then call it quits.
+        # If the ports don't transition in time, then call it quits.
         #
-        retries = 0
-        status = False
-        max_retries = kwargs['retries']
-        while (retries < max_retries) and (not status):
-            retries += 1
-            status = self.do_active('is_trained')
-            time.sleep(1)
-
-        if (retries >= max_retries) and (not status):
+        status = self.wait_active('is_trained', kwargs['retries'])
+        if not status:
             Log.error('{} : timed out waiting for ports to train', self.name)
 
         self.trained = WIStatus.SUCCESS if status else WIStatus.FAILURE
         if not status:
-            s = ''.join([ '-' if not port.active else '1' if port.is_trained() else '0' ])
+            s = ''.join([ '-' if not port.active else '1' if port.is_trained() else '0' for port in self.ports ])
             Log.error('{} : ports didn\'t train : {}', self.name, s)
 
         return self.train_done()
@@ -314,10 +431,12 @@ class Node():
     def load(self, args, kwargs):
         self.loaded = WIStatus.BUSY
 
+        load_type = args[0]
+
         #
         # Load the port attributes.
         #
-        status = self.do_mp_active('load')
+        status = self.do_active('load', load_type)
         Log.debug('{} : port load done', self.name)
 
         #
@@ -354,17 +473,10 @@ class Node():
 
         #
         # Wait for Port.Status to transition to Enabled.
-        # If the ports don't transition in 20 seconds, then call it quits.
+        # If the ports don't transition in time, then call it quits.
         #
-        retries = 0
-        status = False
-        max_retries = kwargs['retries']
-        while (retries < max_retries) and (not status):
-            retries += 1
-            time.sleep(1)
-            status = self.do_active('is_enabled')
-
-        if (retries >= max_retries) and (not status):
+        status = self.wait_active('is_enabled', kwargs['retries'])
+        if not status:
             Log.error('{} : timed out waiting for ports to enable', self.name)
 
         #
@@ -379,62 +491,161 @@ class Node():
 
 # ----------------------------------------------------------------------------------------------------------------------
 
-    def sweep_done(self):
-        return self.done_status(self.swept)
+    def sweep_ports(self, args, kwargs):
+        sweep_type, check_node, ports = args
+        done = kwargs['done']
+        start = time.time()
 
+        #
+        # Scheduled sweep of a node and/or some of its ports.  The sweeper decides what is due,
+        # this just does the work and hands the results back.
+        #
+        try:
+            #
+            # Any failed check means the node is no longer as a warm start found it.
+            #
+            if check_node and not self.is_powered_on():
+                Log.error('{} : is not powered on', self.name)
+                self.warm = False
+
+            ports = [ port for port in ports if port.active ]
+            if sweep_type != 'light' and ports:
+                telemetry_was_on = self.is_telemetry_on()
+                if sweep_type == 'heavy' and telemetry_was_on:
+                    self.turn_telemetry_off()
+                    self.wait_telemetry_off()
+
+                if self.is_telemetry_off():
+                    statuses = list(self.port_pool.map(lambda port: port.sweep(), ports))
+                    if not all(statuses):
+                        Log.error('{} : didn\'t sweep', self.name)
+                        self.warm = False
+
+                if sweep_type == 'heavy' and telemetry_was_on:
+                    self.turn_telemetry_on()
+        finally:
+            self.sweep_count += 1
+            if check_node:
+                self.sweep_rounds += 1
+            self.sweep_seconds = time.time() - start
+            done(self, check_node, ports)
 
-    def sweep(self, args, kwargs):
-        self.swept = WIStatus.BUSY
+# ----------------------------------------------------------------------------------------------------------------------
 
-        sweep_type = args[0]
+    def probe_done(self):
+        return self.done_status(self.probed)
 
-        #
-        # Check the chassis power.
-        #
-        if not self.is_powered_on():
-            Log.error('{} : is not powered on', self.name)
-            self.swept = WIStatus.FAILURE
-            return self.sweep_done()
 
-        #
-        # 'light' sweep is now done.
-        #
-        if sweep_type == 'light':
-            self.swept = WIStatus.SUCCESS
-            return self.sweep_done()
+    def probe(self, args, kwargs):
+        self.probed = WIStatus.BUSY
+        self.warm = False
+
+        snapshot = args[0].get(self.name, None)
+        active_ports = { str(port.index) : port for port in self.ports if port.active }
 
         #
-        # 'medium' sweeps need Telemetry Services off.
-        # 'heavy' sweeps will turn Telemetry Services off.
+        # The snapshot only counts if it was taken with the same profile and attributes (and so
+        # the same tables) and the same ports up.  The digests only say what we meant to load, so
+        # the node is then asked : one chassis read, a conditional read of each port (seeded from
+        # the snapshot, so an unchanged port is a 304) and a read back of the tables tell us
+        # whether the node still holds what we left in it.
         #
-        telemetry_was_on = self.is_telemetry_on()
-        if sweep_type == 'heavy' and telemetry_was_on:
-            self.turn_telemetry_off()
-            time.sleep(3)
+        if not snapshot:
+            Log.info('{} : not in the snapshot', self.name)
+        elif (snapshot['Profile'] != self.profile_digest) or (snapshot['Attributes'] != self.attributes_digest):
+            Log.info('{} : configuration changed since the snapshot', self.name)
+        elif set(snapshot['Ports']) != set(active_ports):
+            Log.info('{} : active ports changed since the snapshot', self.name)
+        elif not self.chassis.ready():
+            Log.info('{} : chassis is not ready', self.name)
+        else:
+            for index, port_snapshot in snapshot['Ports'].items():
+                if port_snapshot['ETag']:
+                    self.etags[active_ports[index].name] = (port_snapshot['ETag'], port_snapshot['Reply'])
+
+            self.warm = self.do_active('probe') and self.probe_specific()
 
         #
-        # Read metrics.
+        # A warm node has, in effect, already been through every step.
         #
-        status = True
-        if self.is_telemetry_off():
-            status = self.do_active('sweep')
+        if self.warm:
+            Log.info('{} : matches the snapshot - skipping bringup', self.name)
+            for status_name in Node.phases.values():
+                setattr(self, status_name, WIStatus.SUCCESS)
+
+        self.probed = WIStatus.SUCCESS
+        return self.probe_done()
+
+
+    def snapshot(self):
+        return { 'Profile'    : self.profile_digest,
+                 'Attributes' : self.attributes_digest,
+                 'Ports'      : { str(port.index) : port.snapshot() for port in self.ports if port.active }
+        }
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+    def bringup_done(self):
+        return self.done_status(self.brought_up)
+
+
+    def bringup(self, args, kwargs):
+        self.brought_up = WIStatus.BUSY
+
+        load_type = args[0]
+        timers = kwargs['timers']
+        condition = kwargs['condition']
+        start = time.time()
 
         #
-        # Turn telemetry back on (if it was previously on).
+        # Run the phases back to back without waiting for the rest of the fabric.  Only validation
+        # depends on other nodes : the link peers must have trained before the remote identities
+        # can be checked.  Each phase's times are kept as they are when the fabric runs the phases
+        # one at a time (without the wait for the peers).
         #
-        if sweep_type == 'heavy' and telemetry_was_on:
-            self.turn_telemetry_on()
+        phases = [ ('init', []), ('train', []), ('validate', []), ('load', [load_type]), ('enable', []) ]
+
+        for command, command_args in phases:
+            if command == 'validate':
+                self.wait_for_peers('train', timers.get('train', timers['default']), condition)
+
+            command_kwargs = { 'retries' : timers.get(command, timers['default']) }
+            phase_start = time.time()
+            getattr(self, command)(command_args, command_kwargs)
+            self.phase_times[command] = (phase_start, time.time())
+            self.notify(condition)
+
+            if getattr(self, '{}_done'.format(command))() != 1:
+                Log.error('{} : bringup failed at {}', self.name, command)
+                self.brought_up = WIStatus.FAILURE
+                return self.bringup_done()
+
+        Log.info('{} : enabled after {:.2f} seconds', self.name, time.time() - start)
+
+        self.brought_up = WIStatus.SUCCESS
+        return self.bringup_done()
+
+
+    def wait_for_peers(self, command, timeout, condition):
+        verify_name = '{}_done'.format(command)
 
         #
-        # Check the final status.
+        # Wait until every link peer has finished the command or has given up on bringup.
         #
-        if status:
-            self.swept = WIStatus.SUCCESS
-        else:
-            Log.error('{} : didn\'t sweep', self.name)
-            self.swept = WIStatus.FAILURE
+        deadline = time.time() + timeout
+        with condition:
+            while True:
+                pending = [ peer for peer in self.peers if getattr(peer, verify_name)() < 0 and peer.bringup_done() < 0 ]
+                now = time.time()
+                if (not pending) or (now >= deadline):
+                    break
+
+                condition.wait(deadline - now)
+
+        for peer in pending:
+            Log.error('{} : timed out waiting for {} to {}', self.name, peer.name, command)
 
-        return self.sweep_done()
+        return not pending
 
 # ----------------------------------------------------------------------------------------------------------------------
 
@@ -452,11 +663,26 @@ class Node():
         while True:
             command, args, kwargs = self.dequeue()
             function = getattr(self, command, None)
-            if function:
+            if self.warm and command in Node.phases:
+                Log.debug('{} : {} skipped (warm)', self.name, command)
+            elif function:
+                start = time.time()
                 function(args, kwargs)
+                self.phase_times[command] = (start, time.time())
             else:
                 Log.error('invalid request [{}]', command)
 
+            #
+            # Let the fabric know that this node is done.
+            #
+            self.notify(kwargs.get('condition', None))
+
+
+    def notify(self, condition):
+        if condition:
+            with condition:
+                condition.notify_all()
+
 # ----------------------------------------------------------------------------------------------------------------------
 
     def GET_node(self, parameters):
@@ -492,10 +718,20 @@ class Node():
             data['GeoID']      = geo_id
             data['AsicID']     = profile['AsicID']['ComponentID']
 
+            #
+            # Port states come from the cache.  Stale ones (or all of them for 'fresh') are read
+            # in parallel.
+            #
+            fresh = parameters.get('fresh', ['0'])[0] not in ['0', 'false', 'False']
+            ports = self.ports[profile['portStart']:profile['portEnd']]
+            statuses = list(self.port_pool.map(lambda port: port.refresh(fresh), ports))
+
             node_ports = data['Ports']
-            for i in range(profile['portStart'], profile['portEnd']):
-                port = self.ports[i]
-                port.query()
+            for port, status in zip(ports, statuses):
+                i = port.index
+                if not status:
+                    Log.error('can\'t retrieve port attribute for {}/{}', self.name, i)
+                    continue
 
                 port_state   = port.current['Status']['State']
                 port_health  = port.current['Status']['Health']
@@ -24,6 +24,10 @@ class PIDT():
         return status,attr['Gen-Z']['PIDT']
 
 
+    def matches(self, attr):
+        return attr.get('Gen-Z', {}).get('PIDT', None) == self.table
+
+
     def patch(self):
         status,_ = self.node.patch(self.name, { 'Gen-Z' : { 'PIDT' : self.table }})
         return status
@@ -23,6 +23,11 @@ from km.fm.metrics  import Metrics
 
 class Port():
 
+    #
+    # Seconds that a cached port state or port metrics read stays good enough to serve.
+    #
+    ttl = { 'state' : 30, 'metrics' : 30 }
+
     def __init__(self, node, index, name):
 
         #
@@ -33,6 +38,10 @@ class Port():
         self.index = index
         self.active = node.port_states[index]['State'] == 'Enabled'
         self.configuration = node.configuration[name]
+        self.last_state = None
+        self.state_changed = False
+        self.current = None
+        self.current_time = 0
 
         if self.active:
             self.remote_uid  = node.port_states[index]['Remote']['UID']
@@ -48,6 +57,7 @@ class Port():
         #
         # Setup the Metrics.
         #
+        self.metrics = None
         metrics_attributes = self.configuration.get('Metrics', None)
         if metrics_attributes:
             self.metrics = Metrics(node, self, metrics_attributes['@odata.id'])
@@ -60,44 +70,60 @@ class Port():
         status,attr = self.node.get(self.name)
         if status:
             self.current = attr
+            self.current_time = time.time()
         else:
             Log.error('failed to get {}/{} attributes', self.node.name, self.index)
 
         return status
 
 
-    def query_all(self):
-        metric_attr = None
-
+    def refresh(self, fresh=False):
         #
-        # Get the port and metric attributes.  Update the current view.
+        # The sweeps (and bringup) keep the current view up to date.  Only go to the device if
+        # the caller asks for a live read or the view is older than its TTL.
         #
-        status = self.query()
+        now = time.time()
+
+        status = True
+        if fresh or (now - self.current_time > Port.ttl['state']):
+            status = self.query()
+
+        return status and (self.current is not None)
+
+
+    def refresh_all(self, fresh=False):
+        status = self.refresh(fresh)
         if status:
-            status,attr = self.metrics.get()
-            if status:
-                metric_attr = {}
-                metric_attr['Interface'] = attr['Gen-Z']
-
-                try:
-                    metric_attr['Request']   = attr['Oem']['Hpe']['Metrics']['Request']
-                    metric_attr['Response']  = attr['Oem']['Hpe']['Metrics']['Response']
-                except:
-                    metric_attr.pop('Request', None)
-                    metric_attr.pop('Response', None)
-
-                try:
-                    for vc in range(16):
-                        vc_name = 'VC{}'.format(vc)
-                        metric_attr[vc_name] = attr['Oem']['Hpe']['Metrics'][vc_name]
-                except:
-                    for vc in range(16):
-                        vc_name = 'VC{}'.format(vc)
-                        metric_attr.pop(vc_name, None)
-
-                self.current_metrics = metric_attr
+            now = time.time()
+            if fresh or (now - self.metrics.current_time > Port.ttl['metrics']):
+                status,_ = self.metrics.get()
 
-        return status
+        return status and (self.metrics.current is not None)
+
+
+    def current_metrics(self):
+        attr = self.metrics.current
+
+        metric_attr = {}
+        metric_attr['Interface'] = attr['Gen-Z']
+
+        try:
+            metric_attr['Request']   = attr['Oem']['Hpe']['Metrics']['Request']
+            metric_attr['Response']  = attr['Oem']['Hpe']['Metrics']['Response']
+        except:
+            metric_attr.pop('Request', None)
+            metric_attr.pop('Response', None)
+
+        try:
+            for vc in range(16):
+                vc_name = 'VC{}'.format(vc)
+                metric_attr[vc_name] = attr['Oem']['Hpe']['Metrics'][vc_name]
+        except:
+            for vc in range(16):
+                vc_name = 'VC{}'.format(vc)
+                metric_attr.pop(vc_name, None)
+
+        return metric_attr
 
 # ----------------------------------------------------------------------------------------------------------------------
 
@@ -236,11 +262,33 @@ class Port():
 
 # ----------------------------------------------------------------------------------------------------------------------
 
-    def load(self):
-        status = True
-        if self.lprt: status &= self.lprt.patch()
-        if self.mprt: status &= self.mprt.patch()
-        if self.vcat: status &= self.vcat.patch()
+    def table_entries(self):
+        entries = {}
+        if self.lprt: entries.update(self.lprt.entries())
+        if self.mprt: entries.update(self.mprt.entries())
+        if self.vcat: entries.update(self.vcat.entries())
+
+        return entries
+
+
+    def load(self, load_type='full'):
+
+        #
+        # Gather the port tables and load them with a single request.
+        #
+        entries = self.table_entries()
+
+        #
+        # A 'diff' load only sends what the port doesn't already hold.  If that is nothing, then
+        # the port is left alone (metrics included).
+        #
+        if load_type == 'diff':
+            entries,_ = self.node.diff_entries(self.name, entries)
+            if not entries:
+                Log.debug('{}[{}].load : tables already loaded', self.node.name, self.index)
+                return True
+
+        status,_ = self.node.deeppatch(self.name, entries)
         if self.metrics: status &= self.metrics.reset()
 
         if not status:
@@ -317,6 +365,14 @@ class Port():
             Log.debug('{}[{}].enable : link state not ready {}', self.node.name, self.index, link_state)
             return False
 
+        #
+        # The metrics reset at the end of load re-enables the interface.  If the port hasn't
+        # reached Enabled yet, then it is on its way.
+        #
+        if if_state == 'Enabled':
+            Log.debug('{}[{}].enable : interface already enabling {}/{}', self.node.name, self.index, state, health)
+            return True
+
         if if_state != 'Disabled':
             Log.debug('{}[{}].enable : interface state not ready {}', self.node.name, self.index, if_state)
             return False
@@ -357,6 +413,15 @@ class Port():
             time.sleep(2)
             link_state, if_state = self.link_interface_state()
 
+        #
+        # Remember whether the state moved since the last sweep.  A port that moved (e.g. was
+        # reset) no longer vouches for a warm start of its node.
+        #
+        self.state_changed = (self.last_state is not None) and (self.last_state != (link_state, if_state))
+        self.last_state = (link_state, if_state)
+        if self.state_changed:
+            self.node.warm = False
+
         status = (link_state == 'Enabled') and (if_state == 'Enabled')
         if not status:
             Log.error('{}[{}].sweep : link/interface in bad state - downing port', self.node.name, self.index)
@@ -364,6 +429,50 @@ class Port():
 
         return status
 
+# ----------------------------------------------------------------------------------------------------------------------
+
+    def probe(self):
+        #
+        # Warm restart check : the port must still be up and connected to the neighbor that the
+        # configuration expects, and must still hold the tables that we would load.  The snapshot
+        # only vouches for what we wrote last time, so the tables are read back from the port
+        # itself.  A port that fails this just means a full bringup, so it isn't downed.
+        #
+        if not self.query():
+            return False
+
+        remote = self.current['Oem']['Hpe']['RemoteComponentID']
+
+        status = (self.status_is_enabled() and
+                  self.current['LinkState'] == 'Enabled' and
+                  self.current['InterfaceState'] == 'Enabled' and
+                  remote['UID'] == self.remote_uid and
+                  remote['Port'] == self.remote_port)
+
+        if not status:
+            Log.debug('{}[{}].probe : port changed since the snapshot', self.node.name, self.index)
+            return False
+
+        entries,_ = self.node.diff_entries(self.name, self.table_entries())
+        if entries:
+            Log.debug('{}[{}].probe : tables changed since the snapshot', self.node.name, self.index)
+            return False
+
+        return True
+
+
+    def snapshot(self):
+        etag, reply = self.node.etags.get(self.name, (None, None))
+        current = self.current or {}
+
+        return { 'Status'         : current.get('Status', None),
+                 'LinkState'      : current.get('LinkState', None),
+                 'InterfaceState' : current.get('InterfaceState', None),
+                 'Remote'         : { 'UID' : self.remote_uid, 'Port' : self.remote_port },
+                 'ETag'           : etag,
+                 'Reply'          : reply
+        }
+
 # ----------------------------------------------------------------------------------------------------------------------
 
     def status_is_starting(self):
@@ -395,10 +504,10 @@ class Port():
         node = self.node
 
         #
-        # Fetch the port attribute.
+        # Fetch the port attribute (from the cache unless it is stale or 'fresh' was asked for).
         #
-        metric_attr = self.query_all()
-        if not metric_attr:
+        fresh = parameters.get('fresh', ['0'])[0] not in ['0', 'false', 'False']
+        if not self.refresh_all(fresh):
             Log.error('can\'t retrieve port attribute for {}', self.name)
             return 404, None
 
@@ -417,7 +526,63 @@ class Port():
                  'LinkState'      : self.current['LinkState'],
                  'InterfaceState' : self.current['InterfaceState'],
                  'Remote'         : '0x{:08X}/{:<2}'.format(oem_data['RemoteComponentID']['UID'], oem_data['RemoteComponentID']['Port']),
-                 'Metrics'        : self.current_metrics
+                 'Metrics'        : self.current_metrics(),
+                 'Updated'        : datetime.datetime.fromtimestamp(min(self.current_time, self.metrics.current_time)).isoformat()
+        }
+
+        return 200, data
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+    def GET_history(self, parameters):
+        #
+        # A port without metrics has no history.
+        #
+        if not self.metrics:
+            Log.error('no metrics history for {}', self.name)
+            return 404, None
+
+        history = self.metrics.history
+
+        #
+        # Parameters:
+        #   fields  - comma separated counter names or groups (e.g. 'Interface', 'VC3.XmitBytes')
+        #   window  - seconds of history to look at (default all of it)
+        #   values  - include the raw samples
+        #
+        # Counters are reported as their increase (Delta) and Rate over the window.  Gauges (the
+        # VC occupancies) are reported as their Last, Mean and Max values.
+        #
+        try:
+            window = float(parameters['window'][0]) if 'window' in parameters else None
+        except ValueError:
+            Log.error('invalid history window {}', parameters['window'][0])
+            return 400, None
+
+        selected = [ f for value in parameters.get('fields', []) for f in value.split(',') ]
+        fields = [ f for f in history.fields if not selected or any(f == s or f.startswith(s + '.') for s in selected) ]
+
+        series = {}
+        for field in fields:
+            if field in history.gauges:
+                series[field] = { 'Last' : history.last(field, window),
+                                  'Mean' : history.mean(field, window),
+                                  'Max'  : history.peak(field, window) }
+            else:
+                series[field] = { 'Delta' : history.delta(field, window),
+                                  'Rate'  : history.rate(field, window) }
+            if 'values' in parameters:
+                series[field]['Values'] = history.samples(field, window)
+
+        data = { 'DataType'  : 'HISTORY',
+                 'Timestamp' : datetime.datetime.now().isoformat(),
+                 'Node'      : self.node.profile['name'],
+                 'Hostname'  : self.node.name,
+                 'Index'     : self.index,
+                 'Retention' : history.retention,
+                 'Samples'   : len(history),
+                 'Window'    : window,
+                 'Series'    : series
         }
 
         return 200, data
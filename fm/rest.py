@@ -8,29 +8,84 @@ import re
 import os
 import sys
 import json
+import time
 import requests
 
-from http import HTTPStatus
+from http      import HTTPStatus
+from threading import Lock
 
-from km.fm.log import Log
+from km.fm.log       import Log
+from km.fm.histogram import Histogram
+from km.fm.trace     import TraceWriter
 
 # ----------------------------------------------------------------------------------------------------------------------
 
 REST_RETRIES = 3
+REST_TIMEOUT = 30       # seconds without a reply before a request times out
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class RestStats():
+
+    #
+    # Per node REST statistics : for each verb, the request latency (including retries) and
+    # the number of requests, retries, timeouts and failures.
+    #
+    def __init__(self):
+        self.verbs = {}
+        self.lock = Lock()
+
+
+    def record(self, verb, elapsed, attempts, timeouts, status):
+        with self.lock:
+            stats = self.verbs.get(verb, None)
+            if not stats:
+                stats = { 'Latency' : Histogram(), 'Requests' : 0, 'Retries' : 0, 'Timeouts' : 0, 'Errors' : 0 }
+                self.verbs[verb] = stats
+
+            stats['Requests'] += 1
+            stats['Retries'] += attempts - 1
+            stats['Timeouts'] += timeouts
+            if (status//100) not in [ 2, 3 ]:
+                stats['Errors'] += 1
+
+        stats['Latency'].record(elapsed)
+
+
+    def summary(self):
+        with self.lock:
+            return { verb : { **{ key : value for key,value in stats.items() if key != 'Latency' },
+                              'Latency' : stats['Latency'].summary() }
+                     for verb,stats in self.verbs.items() }
+
+# ----------------------------------------------------------------------------------------------------------------------
 
 class Rest():
 
+    #
+    # When set, every request is recorded in the trace.
+    #
+    trace = None
+
+
+    @staticmethod
+    def start_trace(filename):
+        Rest.trace = TraceWriter(filename, 'zfm')
+
+
     @staticmethod
-    def _rest_function(f, url, headers=None, data=None):
+    def _rest_function(f, url, headers=None, data=None, reply_headers=None, node=None, verb=None):
 
         r = None
         retries = 0
+        timeouts = 0
+        start = time.time()
         status = HTTPStatus.REQUEST_TIMEOUT
         while (retries < REST_RETRIES) and (status == HTTPStatus.REQUEST_TIMEOUT):
             retries += 1
 
             try:
-                r = f(url, headers=headers, data=data)
+                r = f(url, headers=headers, data=data, timeout=REST_TIMEOUT)
             except requests.exceptions.Timeout as e:
                 status = HTTPStatus.REQUEST_TIMEOUT
             except requests.exceptions.HTTPError as e:
@@ -44,6 +99,22 @@ class Rest():
             else:
                 status = r.status_code
 
+            if status == HTTPStatus.REQUEST_TIMEOUT:
+                timeouts += 1
+
+        if node is not None:
+            node.rest_stats.record(verb, time.time() - start, retries, timeouts, status)
+
+        if Rest.trace:
+            _, _, address, path = url.split('/', 3)
+            conditional = headers is not None and 'If-None-Match' in headers
+            received = len(r.content) if r is not None else 0
+            Rest.trace.record(start, node.name if node else None, address, verb, '/' + path, status,
+                              len(data) if data else 0, received, time.time() - start, conditional, data)
+
+        if r is not None and reply_headers is not None:
+            reply_headers.update(r.headers)
+
         reply = r.text if (status//100) == 2 else None
         return status, reply
 
@@ -57,7 +128,20 @@ class Rest():
         headers = { "Accept": "application/json", "Content-Type": "application/json" }
         url = 'http://{address}{attribute}'.format(address=node.address, attribute=attribute)
 
-        status, reply = Rest._rest_function(requests.get, url, headers=headers)
+        #
+        # Ask for the attribute only if it changed since the last read.  If it hasn't, then the
+        # last reply is used again.
+        #
+        etag, last_reply = node.etags.get(attribute, (None, None))
+        if etag: headers['If-None-Match'] = etag
+
+        reply_headers = {}
+        status, reply = Rest._rest_function(requests.get, url, headers=headers, reply_headers=reply_headers, node=node, verb='GET')
+
+        if status == HTTPStatus.NOT_MODIFIED and last_reply is not None:
+            status, reply = 200, last_reply
+        elif status == 200 and 'ETag' in reply_headers:
+            node.etags[attribute] = (reply_headers['ETag'], reply)
 
         if status != 200:
             Log.error('Rest(GET): {} failed with status {}', url,status)
@@ -79,6 +163,31 @@ class Rest():
         return status, data
 
 
+    @staticmethod
+    def deepget(node, attribute):
+
+        #
+        # Send the REST command to the server.  The reply maps the attribute and every
+        # resource below it to its current value.
+        #
+        headers = { "Accept": "application/json", "Content-Type": "application/json" }
+        url = 'http://{address}{attribute}'.format(address=node.address, attribute=attribute)
+
+        status, reply = Rest._rest_function(Rest._deepget, url, headers=headers, node=node, verb='DEEPGET')
+
+        if status != 200:
+            Log.info('Rest(DEEPGET): {} failed with status {}', url,status)
+            return False, None
+
+        try:
+            status,data = True,json.loads(reply)
+        except:
+            Log.error('Rest.deepget() : invalid JSON returned.')
+            status,data = False,None
+
+        return status, data
+
+
     @staticmethod
     def patch(node, attribute, value):
 
@@ -98,12 +207,51 @@ class Rest():
         headers = { "Accept": "application/json", "Content-Type": "application/json" }
         url = 'http://{address}{attribute}'.format(address=node.address, attribute=attribute)
 
-        status, _ = Rest._rest_function(requests.patch, url, headers=headers, data=data)
+        status, _ = Rest._rest_function(requests.patch, url, headers=headers, data=data, node=node, verb='PATCH')
 
         if status != 204:
             Log.error('Rest(PATCH): {} failed with status {}', url,status)
 
         return status == 204, None
 
+
+    @staticmethod
+    def deeppatch(node, attribute, values):
+
+        #
+        # Convert the input to JSON format.  The values map each resource at or below the
+        # attribute to its update, so a whole table goes to the server in one request.
+        #
+        try:
+            data = json.dumps(values)
+        except:
+            Log.error('Rest.(DEEPPATCH) : could not convert input to JSON.')
+            return False,HTTPStatus.BAD_REQUEST
+
+        #
+        # Send the REST command to the server.
+        #
+        headers = { "Accept": "application/json", "Content-Type": "application/json" }
+        url = 'http://{address}{attribute}'.format(address=node.address, attribute=attribute)
+
+        status, _ = Rest._rest_function(Rest._deeppatch, url, headers=headers, data=data, node=node, verb='DEEPPATCH')
+
+        if status in [ HTTPStatus.METHOD_NOT_ALLOWED, HTTPStatus.NOT_IMPLEMENTED ]:
+            Log.info('Rest(DEEPPATCH): {} not supported', url)
+        elif status != 204:
+            Log.error('Rest(DEEPPATCH): {} failed with status {}', url,status)
+
+        return status == 204, status
+
+
+    @staticmethod
+    def _deepget(url, **kwargs):
+        return requests.request('DEEPGET', url, **kwargs)
+
+
+    @staticmethod
+    def _deeppatch(url, **kwargs):
+        return requests.request('DEEPPATCH', url, **kwargs)
+
 # ----------------------------------------------------------------------------------------------------------------------
 
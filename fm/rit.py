@@ -24,6 +24,10 @@ class RIT():
         return status,attr['Gen-Z']['RIT']
 
 
+    def matches(self, attr):
+        return attr.get('Gen-Z', {}).get('RIT', None) == self.table
+
+
     def patch(self):
         status,_ = self.node.patch(self.name, { 'Gen-Z' : { 'RIT' : self.table }})
         return status
@@ -24,8 +24,11 @@ class _RouteSet():
         return status,table
 
 
-    def patch(self):
-        all_status = True
+    def entries(self):
+        #
+        # Gather every RouteSet entry of every CID/SID into a single table image.
+        #
+        entries = {}
         for member_id in self.configuration['Members']:
             member_name = member_id['@odata.id']
             member_attr = self.node.configuration[member_name]
@@ -35,12 +38,14 @@ class _RouteSet():
             for route_set_id in route_set_attr['Members']:
                 route_set_entry_name = route_set_id['@odata.id']
                 route_set_entry = self.node.configuration[route_set_entry_name]
-                route_set_entry_data = { id : route_set_entry[id] for id in ['Valid', 'VCAction', 'HopCount', 'EgressIdentifier'] }
+                entries[route_set_entry_name] = { id : route_set_entry[id] for id in ['Valid', 'VCAction', 'HopCount', 'EgressIdentifier'] }
+
+        return entries
 
-                status,_ = self.node.patch(route_set_entry_name, route_set_entry_data)
-                all_status &= status
 
-        return all_status
+    def patch(self):
+        status,_ = self.node.deeppatch(self.name, self.entries())
+        return status
 
 
 # ----------------------------------------------------------------------------------------------------------------------
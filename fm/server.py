@@ -7,15 +7,17 @@
 import re
 import os
 import sys
+import zlib
 import json
 import glob
 import copy
 import socket
+import hashlib
 import datetime
 import subprocess
 
 from urllib      import parse
-from http.server import HTTPServer
+from http.server import ThreadingHTTPServer
 from http.server import BaseHTTPRequestHandler
 
 from km.fm.log       import Log
@@ -23,6 +25,10 @@ from km.fm.formatter import ZFMFormatter
 
 # ----------------------------------------------------------------------------------------------------------------------
 
+STREAM_CHUNK_SIZE = 65536       # formatted output gathered before a chunk is written to the requester
+
+# ----------------------------------------------------------------------------------------------------------------------
+
 #
 # Method    Scope           Semantics
 # -------   ----------      ----------------------------------------------------
@@ -56,6 +62,11 @@ def browser_update(node):
 
 class GenZHandler(BaseHTTPRequestHandler):
 
+    #
+    # HTTP/1.1 for chunked replies.  Every other reply carries a Content-Length.
+    #
+    protocol_version = 'HTTP/1.1'
+
     def normalize_path(self, path):
         new_path = path
 
@@ -83,24 +94,125 @@ class GenZHandler(BaseHTTPRequestHandler):
     # ----------------------------------------------------------------------------------------------
 
     def reply(self, status, headers=None, data=None):
+        encoded_data = data.encode() if type(data) is str else data
+
+        headers = dict(headers) if headers else {}
+        headers.setdefault('Content-Length', str(len(encoded_data)) if encoded_data else '0')
+
         try:
             self.send_response(status)
-            if headers:
-                for key,value in headers.items():
-                    self.send_header(key, value)
+            for key,value in headers.items():
+                self.send_header(key, value)
             self.end_headers()
 
-            if data:
-                encoded_data = data.encode()
+            if encoded_data:
                 self.wfile.write(encoded_data)
         except:
             Log.error('can\'t reply to requester')
 
+
+    def stream(self, headers, chunks):
+        #
+        # Write the output as it is produced : chunked transfer encoding for HTTP/1.1 requesters,
+        # gzip compressed when the requester accepts it.  An HTTP/1.0 requester gets the whole
+        # reply at once.  The output is returned so that it can be cached.
+        #
+        compressor = None
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+            headers['Content-Encoding'] = 'gzip'
+
+        chunked = self.request_version == 'HTTP/1.1'
+        output = []
+
+        try:
+            if chunked:
+                headers['Transfer-Encoding'] = 'chunked'
+                self.send_response(200)
+                for key,value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+
+            pending, size = [], 0
+            for chunk in chunks:
+                if type(chunk) is str: chunk = chunk.encode()
+                output.append(chunk)
+
+                if chunked:
+                    pending.append(chunk)
+                    size += len(chunk)
+                    if size >= STREAM_CHUNK_SIZE:
+                        self.write_chunk(b''.join(pending), compressor)
+                        pending, size = [], 0
+
+            if chunked:
+                self.write_chunk(b''.join(pending), compressor)
+                if compressor: self.write_chunk(None, compressor)
+                self.wfile.write(b'0\r\n\r\n')
+        except:
+            Log.error('can\'t reply to requester')
+            self.close_connection = True
+            return None
+
+        output = b''.join(output)
+        if not chunked:
+            data = compressor.compress(output) + compressor.flush() if compressor else output
+            self.reply(200, headers, data)
+
+        return output
+
+
+    def write_chunk(self, data, compressor):
+        #
+        # No data means flush the compressor.
+        #
+        if compressor:
+            data = compressor.compress(data) if data is not None else compressor.flush()
+
+        if data:
+            self.wfile.write('{:X}\r\n'.format(len(data)).encode() + data + b'\r\n')
+
+    # ----------------------------------------------------------------------------------------------
+
+    def etag(self, data):
+        #
+        # The views are built from many device reads, so the version is a digest of the content
+        # (less the generation time) and of the request (which picks the format).
+        #
+        content = json.dumps({ key : value for key,value in data.items() if key != 'Timestamp' }, sort_keys=True, default=str)
+        return '"{}"'.format(hashlib.sha1((self.path + content).encode()).hexdigest())
+
+
+    def send(self, headers, data, output_format):
+        #
+        # The formatted reply is kept for each resource and format, so an unchanged view isn't
+        # formatted again.  Only the latest version is kept : a new view (or the same resource
+        # with other parameters, e.g. another history window) replaces it, so the cache is bounded
+        # by the resources and not by the requests.  A new view is streamed as it is formatted.
+        #
+        etag = headers['ETag']
+        key = (parse.urlsplit(self.path).path.strip('/'), output_format)
+
+        cached = self.server.formatted.get(key)
+        if cached and cached[0] == etag:
+            self.stream(headers, [cached[1]])
+            return
+
+        chunks = self.server.formatter.stream(data, output_format)
+        if chunks is None:
+            self.reply(404)
+            return
+
+        output = self.stream(headers, chunks)
+        if output is not None:
+            self.server.formatted[key] = (etag, output)
+
     # ----------------------------------------------------------------------------------------------
 
     def do_GET(self):
         if 'favicon.ico' in self.path:
-            return 404, None
+            self.reply(404)
+            return
 
         Log.info('GET {}:{}', self.server.node_address, self.path)
 
@@ -109,8 +221,6 @@ class GenZHandler(BaseHTTPRequestHandler):
         query = parsed_url.query
         parameters = parse.parse_qs(query)
 
-        if 'format' not in parameters: parameters['format'] = ['BROWSER']
-
         #
         # Remove empty strings from the parsed URL.
         #
@@ -120,14 +230,26 @@ class GenZHandler(BaseHTTPRequestHandler):
         while (len(tokens) > 0) and (tokens[-1] == ''):
             del tokens[-1]
 
+        #
+        # Scrapers expect the metrics in text exposition format.
+        #
+        metrics_request = tokens == ['metrics']
+        stats_request = tokens == ['stats']
+
+        if 'format' not in parameters: parameters['format'] = ['ASCII' if metrics_request else 'BROWSER']
+
         if (len(tokens) > 0) and (tokens[-1] == 'favicon.ico'):
-            return 404, None
+            self.reply(404)
+            return
 
         #
         # Valid requests are:
-        #   1) []          -> fabric request
-        #   2) [name]      -> node request
-        #   3) [name,port] -> port request
+        #   1) []                   -> fabric request
+        #   2) [name]               -> node request
+        #   3) [name,port]          -> port request
+        #   4) [name,port,history]  -> port metrics history request
+        #   5) [metrics]            -> fabric metrics (from the sweep cache)
+        #   6) [stats]              -> REST and phase timing statistics
         #
         status,data = 404,None
 
@@ -138,52 +260,77 @@ class GenZHandler(BaseHTTPRequestHandler):
         #
         # Validate that the parameters are in range and correct.
         #
-        if len(tokens) > 2:
+        if len(tokens) > 3 or (len(tokens) == 3 and tokens[2] != 'history'):
             Log.error('too many fields in URL {}', self.path)
-            return 404, None
+            self.reply(404)
+            return
 
-        if len(tokens) == 2 and not tokens[1].isdigit():
+        if len(tokens) >= 2 and not tokens[1].isdigit():
             Log.error('invalid URL (port incorrect) {}', self.path)
-            return 404, None
+            self.reply(404)
+            return
 
-        if len(tokens) >= 1:
+        if len(tokens) >= 1 and not (metrics_request or stats_request):
             node = self.server.fabric.locate_node(tokens[0])
             if not node:
                 Log.error('invalid URL (node incorrect) {}', self.path)
-                return 404, None
+                self.reply(404)
+                return
 
-        if len(tokens) == 2:
+        if len(tokens) >= 2:
             value = int(tokens[1])
             if not (node.profile['portStart'] <= value < node.profile['portEnd']):
                 Log.error('invalid URL (port out of range) {}', self.path)
-                return 404, None
+                self.reply(404)
+                return
             port = node.ports[value]
 
         #
         # Execute the command at the appropriate level.
         #
-        if len(tokens) == 0:
+        if metrics_request:
+            status, data = fabric.GET_metrics(parameters)
+        elif stats_request:
+            status, data = fabric.GET_stats(parameters)
+        elif len(tokens) == 0:
             status, data = fabric.GET(parameters)
         elif len(tokens) == 1:
             status, data = node.GET(parameters)
         elif len(tokens) == 2:
             status, data = port.GET(parameters)
+        elif len(tokens) == 3:
+            status, data = port.GET_history(parameters)
+
+        if status != 200:
+            self.reply(status)
+            return
+
+        output_format = parameters['format'][0]
+
+        if output_format == 'NDJSON':
+            content_type = 'application/x-ndjson'
+        elif metrics_request and output_format == 'ASCII':
+            content_type = 'text/plain; version=0.0.4'
+        else:
+            content_type = 'text/html'
+
+        headers = {'Content-type'  :  content_type,
+                   'Cache-Control' :  'no-cache' }
 
-        if status == 200:
-            data['ZFM'] = self.server.node_address
-            output = self.server.formatter.format(data, parameters['format'][0])
+        data['ZFM'] = self.server.node_address
+        headers['ETag'] = self.etag(data)
 
         #
-        # Send the reply back to the requester.
+        # If the requester already has this view, send 304.
         #
-        headers = {'Content-type'  :  'text/html',
-                   'Cache-Control' :  'no-cache, no-store, must-revalidate',
-                   'Pragma'        :  'no-cache',
-                   'Expires'       :  '0' }
-
-        payload = output if status == 200 else None
+        if self.headers.get('If-None-Match') == headers['ETag']:
+            self.reply(304, headers)
+            return
 
-        self.reply(status, headers, payload)
+        #
+        # Send the reply back to the requester.
+        #
+        self.send(headers, data, output_format)
 
     # ----------------------------------------------------------------------------------------------
 
@@ -344,14 +491,20 @@ class Server():
         self.server = None
 
         try:
-            self.server = HTTPServer((self.address, self.port), GenZHandler)
+            self.server = ThreadingHTTPServer((self.address, self.port), GenZHandler)
         except:
             output = subprocess.check_output('lsof -i:{}'.format(self.port), shell=True)
             Log.error('can\'t create HTTP server')
             Log.error(output.decode('utf-8'))
             sys.exit(0)
 
+        #
+        # Each request gets its own thread.  Requests are answered from the state the sweeps keep
+        # current, so a slow (or 'fresh') request doesn't hold up the others.
+        #
+        self.server.daemon_threads = True
         self.server.formatter = ZFMFormatter()
+        self.server.formatted = {}
         self.server.node_address = hostname
         self.server.redfish_base = os.path.join('redfish', 'v1')
         self.server.fabric = fabric
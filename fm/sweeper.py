@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+#
+# (C) Copyright 2020 Hewlett Packard Enterprise Development LP.
+# Licensed under the Apache v2.0 license.
+#
+
+import re
+import os
+import sys
+import time
+import heapq
+import random
+
+from threading import Thread
+from threading import Condition
+
+from km.fm.log import Log
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+SWEEP_SPEEDUP   = 8         # troubled ports are swept up to this many times more often than quiet ones
+SWEEP_JITTER    = 0.1       # fraction of an interval randomly added or removed to spread the sweeps out
+SWEEP_NODE_RATE = 20        # port sweeps per second allowed on each node
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class Sweeper():
+
+    def __init__(self, fabric, sweep_type, interval):
+        self.fabric = fabric
+        self.sweep_type = sweep_type
+        self.max_interval = interval
+        self.min_interval = interval / SWEEP_SPEEDUP
+
+        #
+        # The schedule is a heap of (due time, sequence, node, port) entries.  A port of None is
+        # the node level (chassis) check.  The sequence keeps the heap from comparing nodes.
+        #
+        self.schedule = []
+        self.sequence = 0
+        self.condition = Condition()
+
+        self.intervals = {}
+        self.buckets = {}
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+    def start(self):
+        now = time.time()
+
+        #
+        # Spread the first sweeps over the shortest interval so they don't all go out at once.
+        #
+        for node in self.fabric.nodes.values():
+            if not node.active: continue
+
+            self.buckets[node] = (SWEEP_NODE_RATE, now)
+            self.add(node, None, now + random.uniform(0, self.min_interval))
+
+            if self.sweep_type != 'light':
+                for port in node.ports:
+                    if port.active:
+                        self.intervals[port] = self.max_interval
+                        self.add(node, port, now + random.uniform(0, self.min_interval))
+
+        Log.info('sweeper started : {} entries', len(self.schedule))
+
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+
+    def add(self, node, port, due):
+        with self.condition:
+            self.sequence += 1
+            heapq.heappush(self.schedule, (due, self.sequence, node, port))
+            self.condition.notify()
+
+
+    def jitter(self, interval):
+        return interval * random.uniform(1 - SWEEP_JITTER, 1 + SWEEP_JITTER)
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+    def take_token(self, node, now):
+        #
+        # Token bucket per node : it refills at SWEEP_NODE_RATE and holds at most one second's worth.
+        #
+        tokens, last = self.buckets[node]
+        tokens = min(SWEEP_NODE_RATE, tokens + (now - last)*SWEEP_NODE_RATE)
+
+        status = tokens >= 1
+        if status:
+            tokens -= 1
+
+        self.buckets[node] = (tokens, now)
+        return status
+
+
+    def run(self):
+
+        while True:
+            #
+            # Wait for the next entry to come due.
+            #
+            with self.condition:
+                while (not self.schedule) or (self.schedule[0][0] > time.time()):
+                    timeout = self.schedule[0][0] - time.time() if self.schedule else None
+                    self.condition.wait(timeout)
+
+                #
+                # Gather everything that is due, by node.  Ports over the node's rate are pushed
+                # back by a token's worth of time.
+                #
+                now = time.time()
+                batches = {}
+                deferred = []
+                while self.schedule and (self.schedule[0][0] <= now):
+                    _, _, node, port = heapq.heappop(self.schedule)
+                    check_node, ports = batches.setdefault(node, (False, []))
+
+                    if port is None:
+                        batches[node] = (True, ports)
+                    elif self.take_token(node, now):
+                        ports.append(port)
+                    else:
+                        deferred.append((node, port))
+
+                for node, port in deferred:
+                    self.sequence += 1
+                    heapq.heappush(self.schedule, (now + 1/SWEEP_NODE_RATE, self.sequence, node, port))
+
+            #
+            # Hand the work to the node threads.
+            #
+            for node, (check_node, ports) in batches.items():
+                if check_node or ports:
+                    node.enqueue('sweep_ports', [self.sweep_type, check_node, ports], { 'done' : self.done })
+
+
+    def done(self, node, check_node, ports):
+        now = time.time()
+
+        #
+        # The node check always runs at the configured interval.
+        #
+        if check_node:
+            self.add(node, None, now + self.jitter(self.max_interval))
+
+        #
+        # Ports whose error counters are rising or whose state just changed are looked at more
+        # often.  Quiet ones drift back to the configured interval.  Downed ports drop out.
+        #
+        for port in ports:
+            if not port.active:
+                Log.info('{}[{}] : removed from sweep', node.name, port.index)
+                self.intervals.pop(port, None)
+                continue
+
+            interval = self.intervals.get(port, self.max_interval)
+            if (port.metrics and port.metrics.errors_rising) or port.state_changed:
+                interval = max(self.min_interval, interval/2)
+            else:
+                interval = min(self.max_interval, interval*2)
+
+            self.intervals[port] = interval
+            self.add(node, port, now + self.jitter(interval))
+
+# ----------------------------------------------------------------------------------------------------------------------
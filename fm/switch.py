@@ -55,4 +55,11 @@ class Switch(Node):
         #
         return True
 
+
+    def probe_specific(self):
+        #
+        # Warm restart check of the switch specific attributes.
+        #
+        return True
+
 # ----------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+#
+# (C) Copyright 2020 Hewlett Packard Enterprise Development LP.
+# Licensed under the Apache v2.0 license.
+#
+
+import re
+import os
+import sys
+import time
+
+from array     import array
+from threading import Lock
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class TimeSeries():
+
+    #
+    # Ring buffer of counter samples.  There is one timestamp array and one flat value array holding
+    # 'retention' rows of len(fields) counters, so recording a sample never allocates.  Gauges (e.g.
+    # an occupancy) are sampled the same way, but they go up and down, so they have their own
+    # aggregates.
+    #
+    def __init__(self, fields, retention, gauges=[]):
+        self.fields = fields
+        self.gauges = set(gauges)
+        self.width = len(fields)
+        self.field_index = { name : i for i,name in enumerate(fields) }
+        self.retention = retention
+        self.times = array('d', [0.0]) * retention
+        self.values = array('d', [0.0]) * (retention * self.width)
+        self.count = 0
+        self.lock = Lock()
+
+
+    def __len__(self):
+        return min(self.count, self.retention)
+
+
+    def record(self, timestamp, values):
+        with self.lock:
+            slot = self.count % self.retention
+            start = slot * self.width
+
+            self.times[slot] = timestamp
+            self.values[start:start+self.width] = array('d', values)
+            self.count += 1
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+    def slots(self, window=None):
+        #
+        # Slot numbers from oldest to newest, limited to the last 'window' seconds.
+        #
+        first = max(0, self.count - self.retention)
+        slots = [ i % self.retention for i in range(first, self.count) ]
+
+        if window is not None and slots:
+            newest = self.times[slots[-1]]
+            slots = [ slot for slot in slots if newest - self.times[slot] <= window ]
+
+        return slots
+
+
+    def samples(self, field, window=None):
+        offset = self.field_index[field]
+
+        with self.lock:
+            return [ (self.times[slot], self.values[slot*self.width + offset]) for slot in self.slots(window) ]
+
+
+    @staticmethod
+    def increments(samples):
+        #
+        # Sum of the increments between samples.  A counter that goes backwards was reset, so the
+        # new value is the increment since the reset.
+        #
+        total = 0
+        for (_, v_last), (_, v_curr) in zip(samples, samples[1:]):
+            total += v_curr - v_last if v_curr >= v_last else v_curr
+
+        return total
+
+
+    def delta(self, field, window=None):
+        return TimeSeries.increments(self.samples(field, window))
+
+
+    def rate(self, field, window=None):
+        samples = self.samples(field, window)
+        if len(samples) < 2:
+            return 0.0
+
+        elapsed = samples[-1][0] - samples[0][0]
+        return TimeSeries.increments(samples) / elapsed if elapsed > 0 else 0.0
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+    def last(self, field, window=None):
+        samples = self.samples(field, window)
+        return samples[-1][1] if samples else 0.0
+
+
+    def mean(self, field, window=None):
+        samples = self.samples(field, window)
+        return sum(v for _,v in samples) / len(samples) if samples else 0.0
+
+
+    def peak(self, field, window=None):
+        samples = self.samples(field, window)
+        return max(v for _,v in samples) if samples else 0.0
+
+# ----------------------------------------------------------------------------------------------------------------------
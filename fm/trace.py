@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+#
+# (C) Copyright 2020 Hewlett Packard Enterprise Development LP.
+# Licensed under the Apache v2.0 license.
+#
+
+import re
+import os
+import sys
+import gzip
+import json
+import time
+import atexit
+
+from threading import Lock
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+TRACE_FLUSH  = 1000                 # requests between flushes, so little is lost if the process is killed
+
+TRACE_FIELDS = [ 'Time',            # seconds from the start of the trace to the request
+                 'Node',            # node name
+                 'Address',         # node address (host:port)
+                 'Verb',
+                 'Path',
+                 'Status',          # reply status (0 if there was no reply)
+                 'Sent',            # request payload bytes
+                 'Received',        # reply payload bytes
+                 'Elapsed',         # seconds to complete the request
+                 'Conditional',     # GET with If-None-Match
+                 'Data' ]           # request payload (write verbs only)
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class TraceWriter():
+
+    #
+    # REST request trace.  The first line is a header naming the source, start time and fields,
+    # then there is one JSON list per request, in the order the requests completed.  A file name
+    # ending in .gz is compressed.
+    #
+    def __init__(self, filename, source):
+        self.filename = filename
+        self.file = gzip.open(filename, 'wt') if filename.endswith('.gz') else open(filename, 'w')
+        self.start = time.time()
+        self.count = 0
+        self.lock = Lock()
+
+        header = { 'Trace' : source, 'Start' : self.start, 'Fields' : TRACE_FIELDS }
+        self.file.write(json.dumps(header) + '\n')
+
+        atexit.register(self.close)
+
+
+    def record(self, start, node, address, verb, path, status, sent, received, elapsed, conditional=False, data=None):
+        entry = [ round(start - self.start, 6), node, address, verb, path, status,
+                  sent, received, round(elapsed, 6), 1 if conditional else 0, data ]
+
+        line = json.dumps(entry, separators=(',', ':')) + '\n'
+        with self.lock:
+            if self.file:
+                self.file.write(line)
+                self.count += 1
+                if self.count % TRACE_FLUSH == 0:
+                    self.file.flush()
+
+
+    def close(self):
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+def read_trace(filename):
+    #
+    # Returns the trace header and its requests (as dicts), sorted by time.
+    #
+    with (gzip.open(filename, 'rt') if filename.endswith('.gz') else open(filename)) as f:
+        header = json.loads(f.readline())
+        fields = header['Fields']
+
+        #
+        # A trace whose writer was killed ends part way through a line (or a compressed block).
+        #
+        records = []
+        try:
+            for line in f:
+                records.append(dict(zip(fields, json.loads(line))))
+        except (ValueError, EOFError):
+            pass
+
+    records.sort(key=lambda record : record['Time'])
+    return header, records
+
+# ----------------------------------------------------------------------------------------------------------------------
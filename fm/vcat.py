@@ -24,18 +24,20 @@ class _VCTable():
         return status,attr
 
 
-    def patch(self):
-        all_status = True
+    def entries(self):
+        entries = {}
         for member_id in self.configuration['Members']:
             member_name = member_id['@odata.id']
             member_attr = self.node.configuration[member_name]
             if len(member_attr['VCATEntry']):
-                status,_ = self.node.patch(member_name, { 'VCATEntry' : member_attr['VCATEntry'] })
-            else:
-                status = True
-            all_status &= status
+                entries[member_name] = { 'VCATEntry' : member_attr['VCATEntry'] }
+
+        return entries
 
-        return all_status
+
+    def patch(self):
+        status,_ = self.node.deeppatch(self.name, self.entries())
+        return status
 
 
 # ----------------------------------------------------------------------------------------------------------------------
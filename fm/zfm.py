@@ -14,10 +14,14 @@ import argparse
 
 from threading import Thread
 
-from km.fm.log    import Log
-from km.fm.node   import Node
-from km.fm.fabric import Fabric
-from km.fm.server import Server
+from km.fm.log     import Log
+from km.fm.node    import Node
+from km.fm.port    import Port
+from km.fm.metrics import Metrics
+from km.fm.fabric  import Fabric
+from km.fm.server  import Server
+from km.fm.sweeper import Sweeper
+from km.fm.rest    import Rest
 
 # ----------------------------------------------------------------------------------------------------------------------
 
@@ -59,16 +63,26 @@ if __name__ == '__main__':
     # Get the command line parameters.
     #
     parser = argparse.ArgumentParser(description='Gen-Z fabric manager')
-    parser.add_argument('-d', '--dir',   help='zfm config file',  required=False,  default=os.path.join(os.sep, 'opt','zfm'))
-    parser.add_argument('-H', '--host',  help='server address',   required=False,  default=socket.gethostname())
-    parser.add_argument('-l', '--log',   help='log level',        required=False,  default='warning')
-    parser.add_argument('-s', '--sweep', help='sweep type',       required=False,  default='light')
+    parser.add_argument('-d', '--dir',      help='zfm config file',         required=False,  default=os.path.join(os.sep, 'opt','zfm'))
+    parser.add_argument('-H', '--host',     help='server address',          required=False,  default=socket.gethostname())
+    parser.add_argument('-l', '--log',      help='log level',               required=False,  default='warning')
+    parser.add_argument('-s', '--sweep',    help='sweep type',              required=False,  default='light')
+    parser.add_argument('-L', '--load',     help='load type',               required=False,  default='full')
+    parser.add_argument('-P', '--pipeline', help='pipelined node bringup',  required=False,  default=False,  action='store_true')
+    parser.add_argument('-c', '--cold',     help='ignore the snapshot',     required=False,  default=False,  action='store_true')
+    parser.add_argument('-T', '--trace',    help='REST trace file',         required=False,  default=None)
 
     args = vars(parser.parse_args())
     args['conf'] = 'zfm.conf'
 
     Log.Init(args['log'])
 
+    #
+    # The trace file is named relative to where we were started, not the config directory.
+    #
+    if args['trace']:
+        Rest.start_trace(os.path.abspath(args['trace']))
+
     #
     # Chdir to the config directory.
     #
@@ -80,6 +94,7 @@ if __name__ == '__main__':
 
     zfm_config_file = args['conf']
     zfm_sweep_type = args['sweep']
+    zfm_load_type = args['load']
     hostname = args['host']
 
     #
@@ -99,6 +114,12 @@ if __name__ == '__main__':
                'sweep'    : int(zfm_configuration['zfm_sweep_timer']),
     }
 
+    Metrics.retention = int(zfm_configuration.get('zfm_metrics_retention', Metrics.retention))
+    Port.ttl['state'] = int(zfm_configuration.get('zfm_state_ttl', Port.ttl['state']))
+    Port.ttl['metrics'] = int(zfm_configuration.get('zfm_metrics_ttl', Port.ttl['metrics']))
+
+    snapshot_file = zfm_configuration.get('zfm_snapshot_file', 'zfm.snapshot')
+
     config_files = [ zfm_configuration['zfm_switch_node_file'],
                      zfm_configuration['zfm_compute_node_file'],
                      zfm_configuration['zfm_memory_node_file'],
@@ -108,9 +129,17 @@ if __name__ == '__main__':
     #
     # Create the fabric and server.
     #
-    fabric = Fabric(zfm_sweep_type, timers, config_files)
+    fabric = Fabric(zfm_sweep_type, timers, config_files, zfm_load_type, args['pipeline'], snapshot_file, not args['cold'])
     server = Server(hostname,fabric)
 
+    #
+    # SIGTERM shuts down like ^C, so the exit handlers (e.g. closing the trace) run.
+    #
+    def terminate(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, terminate)
+
     #
     # Initialize the fabric.
     #
@@ -129,12 +158,14 @@ if __name__ == '__main__':
     server_thread.start()
 
     #
-    # Monitor the fabric.
+    # Monitor the fabric.  The sweeper schedules the nodes and ports on its own.
     #
+    sweeper = Sweeper(fabric, zfm_sweep_type, timers['sweep'])
+    sweeper.start()
+
     try:
         while True:
-            fabric.sweep()
-            time.sleep(timers['sweep'])
+            time.sleep(3600)
     except KeyboardInterrupt:
         Log.info('user interrupt caught - exiting')
     else:
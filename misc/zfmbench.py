@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+#
+# (C) Copyright 2020 Hewlett Packard Enterprise Development LP.
+# Licensed under the Apache v2.0 license.
+#
+
+#
+# End to end bring-up benchmark : zfmroute -> zfmconf -> zfmsim -> zfm.
+#
+# A fabric of the requested size is cut out of a base configuration (env/NxM.conf by default),
+# routed, configured and simulated locally.  The fabric manager then initializes it and sweeps it
+# a few times.  The result (stage and phase wall times, requests, bytes and peak memory) is
+# written as JSON.
+#
+# Example calls:
+#
+# ./zfmbench.py -S 2 -E 3                                      2 switches, 3 endpoints
+# ./zfmbench.py -S 16 -E 64 -a -s 20 -o bench.json             the whole base fabric on the asyncio host
+# ./zfmbench.py -b my_fabric.conf -S 8 -E 32 -n 5 -w /tmp/b    5 sweeps, keep the run in /tmp/b
+#
+
+import os
+import sys
+import json
+import time
+import glob
+import signal
+import platform
+import argparse
+import tempfile
+import datetime
+import requests
+import subprocess
+
+from km.fm.trace import read_trace
+
+BENCH_NODE_PORT     = 30000     # simulated nodes listen on consecutive ports from here
+BENCH_FM_PORT       = 60000     # fabric manager port
+BENCH_READY_TIMEOUT = 900       # seconds for the simulator to come up, the FM to initialize or the sweeps to finish
+BENCH_POLL          = 0.5       # seconds between polls
+BENCH_STOP_TIMEOUT  = 30        # seconds for a process to exit once told to
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+def progress(message):
+    print(message, file=sys.stderr)
+    sys.stderr.flush()
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+def generate(base_file, num_switches, num_endpoints, sweep_interval):
+    #
+    # Keep the first switches and the first endpoints connected to them, and the links between
+    # them.  Every node gets a local address.
+    #
+    with open(base_file) as f:
+        config = json.load(f)
+
+    layout = config['Layout']
+    addr = layout.index('Addr')
+
+    nodes = config['Nodes']
+    connections = config['Connections']
+
+    switches = list(nodes.get('Switch', {}))[:num_switches]
+    kept = set(switches)
+
+    for node_type in [ 'Compute', 'IO', 'Memory' ]:
+        for name in nodes.get(node_type, {}):
+            if len(kept) - len(switches) >= num_endpoints: break
+
+            peers = [ dst for src,dst in connections.items() if src.split(',')[0] == name ] + \
+                    [ src for src,dst in connections.items() if dst.split(',')[0] == name ]
+            if any(peer.split(',')[0] in switches for peer in peers):
+                kept.add(name)
+
+    for node_type in list(nodes):
+        nodes[node_type] = { name : profile for name,profile in nodes[node_type].items() if name in kept }
+
+    config['Connections'] = { src : dst for src,dst in connections.items()
+                              if src.split(',')[0] in kept and dst.split(',')[0] in kept }
+
+    port = BENCH_NODE_PORT
+    for node_type in nodes:
+        for name, profile in nodes[node_type].items():
+            profile[addr] = '127.0.0.1:{}'.format(port)
+            port += 1
+
+    config['Constants']['Timers']['SWEEP'] = sweep_interval
+
+    return config, len(switches), len(kept) - len(switches)
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+def run_stage(name, command, log_file):
+    progress('{} ...'.format(name))
+
+    start = time.time()
+    with open(log_file, 'w') as f:
+        status = subprocess.run(command, stdout=f, stderr=subprocess.STDOUT).returncode
+
+    if status != 0:
+        progress('{} failed (see {})'.format(name, log_file))
+        sys.exit(1)
+
+    return time.time() - start
+
+
+def wait_for(what, check, process):
+    #
+    # Poll until check() returns something, the process dies or we run out of time.
+    #
+    deadline = time.time() + BENCH_READY_TIMEOUT
+    while time.time() < deadline:
+        if process.poll() is not None:
+            progress('{} : process exited with status {}'.format(what, process.returncode))
+            return None
+
+        result = check()
+        if result:
+            return result
+
+        time.sleep(BENCH_POLL)
+
+    progress('{} : timed out after {} seconds'.format(what, BENCH_READY_TIMEOUT))
+    return None
+
+
+def stop(process):
+    if process.poll() is None:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(BENCH_STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+def peak_memory(pid):
+    #
+    # Peak resident set (kB) of a process and its children (the simulator's workers).  Linux only.
+    #
+    def vm_hwm(pid):
+        try:
+            with open('/proc/{}/status'.format(pid)) as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        return int(line.split()[1])
+        except (OSError, ValueError):
+            pass
+        return 0
+
+    total = vm_hwm(pid)
+    for stat_file in glob.glob('/proc/[0-9]*/stat'):
+        try:
+            with open(stat_file) as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            if int(fields[1]) == pid:
+                total += vm_hwm(int(stat_file.split('/')[2]))
+        except (OSError, ValueError, IndexError):
+            pass
+
+    return total or None
+
+
+def get_json(url):
+    try:
+        r = requests.get(url, timeout=5)
+        return r.json() if r.status_code == 200 else None
+    except (requests.exceptions.RequestException, ValueError):
+        return None
+
+
+def nodes_ready(addresses):
+    #
+    # The simulator is up when every node answers.
+    #
+    for address in addresses:
+        try:
+            requests.get('http://{}/redfish/v1'.format(address), timeout=5)
+        except requests.exceptions.RequestException:
+            return False
+
+    return True
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+def trace_summary(filenames, windows):
+    #
+    # Request counts and bytes by verb, for each (name, start, end) window of real time.
+    #
+    def summary(verbs):
+        for stats in verbs.values():
+            stats['Mean'] = stats['Elapsed'] / stats['Count']
+
+        return { 'Total'    : sum(stats['Count'] for stats in verbs.values()),
+                 'Errors'   : sum(stats['Errors'] for stats in verbs.values()),
+                 'Sent'     : sum(stats['Sent'] for stats in verbs.values()),
+                 'Received' : sum(stats['Received'] for stats in verbs.values()),
+                 'Verbs'    : verbs }
+
+    results = { name : {} for name,_,_ in windows }
+    for filename in filenames:
+        try:
+            header, records = read_trace(filename)
+        except Exception as e:
+            progress('can\'t read trace {} ({})'.format(filename, e))
+            continue
+
+        for record in records:
+            when = header['Start'] + record['Time']
+            for name, start, end in windows:
+                if not start <= when < end: continue
+
+                stats = results[name].setdefault(record['Verb'], { 'Count' : 0, 'Errors' : 0, 'Sent' : 0, 'Received' : 0, 'Elapsed' : 0.0 })
+                stats['Count'] += 1
+                stats['Errors'] += 1 if record['Status'] == 0 or record['Status'] >= 400 else 0
+                stats['Sent'] += record['Sent']
+                stats['Received'] += record['Received']
+                stats['Elapsed'] += record['Elapsed']
+
+    return { name : summary(verbs) for name,verbs in results.items() }
+
+
+def revision():
+    try:
+        package_dir = os.path.dirname(os.path.abspath(__file__))
+        return subprocess.run([ 'git', 'rev-parse', '--short', 'HEAD' ], cwd=package_dir,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+def benchmark(args):
+    work_dir = os.path.abspath(args['work'] or tempfile.mkdtemp(prefix='zfmbench-'))
+    conf_dir = os.path.join(work_dir, 'zfm')
+    os.makedirs(work_dir, exist_ok=True)
+    progress('working in {}'.format(work_dir))
+
+    python = sys.executable
+    stages = {}
+
+    #
+    # Generate, route and configure the fabric.
+    #
+    config, num_switches, num_endpoints = generate(args['base'], args['switches'], args['endpoints'], args['interval'])
+
+    config_file = os.path.join(work_dir, 'fabric.conf')
+    route_file = os.path.join(work_dir, 'fabric.route')
+    with open(config_file, 'w') as f:
+        json.dump(config, f, indent=4)
+
+    addresses = [ profile[config['Layout'].index('Addr')] for nodes in config['Nodes'].values() for profile in nodes.values() ]
+    progress('{} switches, {} endpoints, {} links'.format(num_switches, num_endpoints, len(config['Connections'])))
+
+    stages['Route'] = run_stage('zfmroute', [ python, '-m', 'km.route.zfmroute', '-c', config_file, '-r', route_file ],
+                                os.path.join(work_dir, 'zfmroute.log'))
+    stages['Config'] = run_stage('zfmconf', [ python, '-m', 'km.conf.zfmconf', '-c', config_file, '-r', route_file, '-d', conf_dir ],
+                                 os.path.join(work_dir, 'zfmconf.log'))
+
+    #
+    # Start the simulator and wait for every node to answer.
+    #
+    sim_trace = os.path.join(work_dir, 'zfmsim.trace.gz')
+    sim_command = [ python, '-m', 'km.sim.zfmsim', '-d', conf_dir, '-T', sim_trace ]
+    if args['async']:   sim_command += [ '-a' ]
+    if args['workers']: sim_command += [ '-w', str(args['workers']) ]
+    if args['speedup']: sim_command += [ '-s', str(args['speedup']) ]
+
+    fm_trace = os.path.join(work_dir, 'zfm.trace.gz')
+    fm_address = '127.0.0.1:{}'.format(args['port'])
+    fm_command = [ python, '-m', 'km.fm.zfm', '-d', conf_dir, '-H', fm_address, '-c', '-l', 'info',
+                   '-s', args['sweep'], '-T', fm_trace ]
+
+    sim = fm = None
+    try:
+        progress('zfmsim ...')
+        start = time.time()
+        sim = subprocess.Popen(sim_command, stdout=open(os.path.join(work_dir, 'zfmsim.log'), 'w'), stderr=subprocess.STDOUT)
+        if not wait_for('zfmsim', lambda : nodes_ready(addresses), sim):
+            sys.exit(1)
+        stages['Simulator'] = time.time() - start
+
+        #
+        # Initialize the fabric.  The FM's server comes up once initialization is done.
+        #
+        progress('zfm initialization ...')
+        start = time.time()
+        fm = subprocess.Popen(fm_command, stdout=open(os.path.join(work_dir, 'zfm.log'), 'w'), stderr=subprocess.STDOUT)
+        stats_url = 'http://{}/stats?format=JSON'.format(fm_address)
+        stats = wait_for('zfm initialization', lambda : get_json(stats_url), fm)
+        if not stats:
+            sys.exit(1)
+        initialized = time.time()
+        stages['Initialize'] = initialized - start
+
+        #
+        # Let every node be swept a few times.
+        #
+        progress('zfm sweeps ...')
+        start = time.time()
+        rounds = { name : node['Sweeps'] for name,node in stats['Nodes'].items() }
+        def sweeps_done():
+            stats = get_json(stats_url)
+            if stats and all(node['Sweeps'] - rounds.get(name, 0) >= args['sweeps'] for name,node in stats['Nodes'].items()):
+                return stats
+            return None
+
+        stats = wait_for('zfm sweeps', sweeps_done, fm)
+        if not stats:
+            sys.exit(1)
+        swept = time.time()
+        stages['Sweeps'] = swept - start
+
+        memory = { 'zfm' : peak_memory(fm.pid), 'zfmsim' : peak_memory(sim.pid) }
+
+    finally:
+        if fm:  stop(fm)
+        if sim: stop(sim)
+
+    #
+    # The traces are complete now that the processes are gone.
+    #
+    root, extension = os.path.splitext(sim_trace)
+    sim_traces = [ sim_trace ] if os.path.exists(sim_trace) else sorted(glob.glob('{}-*{}'.format(root, extension)))
+
+    windows = [ ('Initialize', 0, initialized), ('Sweeps', initialized, swept) ]
+
+    return { 'Benchmark' : 'bringup',
+             'Timestamp' : datetime.datetime.now().isoformat(),
+             'Revision'  : revision(),
+             'Host'      : platform.node(),
+             'Python'    : platform.python_version(),
+             'Fabric'    : { 'Switches' : num_switches, 'Endpoints' : num_endpoints, 'Links' : len(config['Connections']) },
+             'Options'   : { key : args[key] for key in [ 'base', 'sweep', 'interval', 'sweeps', 'async', 'workers', 'speedup' ] },
+             'Stages'    : stages,
+             'Phases'    : { command : phase['Elapsed'] for command,phase in stats['Phases'].items() },
+             'Requests'  : trace_summary([ fm_trace ], windows),
+             'Server'    : trace_summary(sim_traces, windows),
+             'Memory'    : memory,
+             'WorkDir'   : work_dir }
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    #
+    # Get the command line parameters.
+    #
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    parser = argparse.ArgumentParser(description='fabric bring-up benchmark')
+
+    parser.add_argument('-b', '--base',      help='base fabric configuration',       required=False, default=os.path.join(package_dir, 'env', 'NxM.conf'))
+    parser.add_argument('-S', '--switches',  help='switches',                        required=True,  type=int)
+    parser.add_argument('-E', '--endpoints', help='endpoints',                       required=True,  type=int)
+    parser.add_argument('-n', '--sweeps',    help='sweeps of each node',             required=False, default=3,        type=int)
+    parser.add_argument('-i', '--interval',  help='sweep interval (seconds)',        required=False, default=4,        type=int)
+    parser.add_argument('-t', '--sweep',     help='sweep type',                      required=False, default='medium')
+    parser.add_argument('-a', '--async',     help='asyncio simulator host',          required=False, default=False,    action='store_true')
+    parser.add_argument('-w', '--workers',   help='simulator worker processes',      required=False, default=0,        type=int)
+    parser.add_argument('-s', '--speedup',   help='simulated time per real second',  required=False, default=None,     type=float)
+    parser.add_argument('-p', '--port',      help='fabric manager port',             required=False, default=BENCH_FM_PORT, type=int)
+    parser.add_argument('-W', '--work',      help='working directory',               required=False, default=None)
+    parser.add_argument('-o', '--output',    help='JSON results file',               required=False, default=None)
+
+    args = vars(parser.parse_args())
+
+    result = benchmark(args)
+
+    if args['output']:
+        with open(args['output'], 'w') as f:
+            json.dump(result, f, indent=4)
+    else:
+        json.dump(result, sys.stdout, indent=4)
+        print()
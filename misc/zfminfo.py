@@ -81,6 +81,12 @@ def zfm_port(args, parameters):
 
 # ----------------------------------------------------------------------------------------------------------------------
 
+def zfm_history(args, parameters):
+    url = 'http://{}/{}/{}/history?{}'.format(args['server_address'], args['node'], args['port'], '&'.join(parameters))
+    return zfm_request(url)
+
+# ----------------------------------------------------------------------------------------------------------------------
+
 if __name__ == '__main__':
 
     #
@@ -90,7 +96,8 @@ if __name__ == '__main__':
 limitations: -f and -n are mutually exclusive
              -f and -p are mutually exclusive
              -t can only be specified with -f
-             -p can only be specified with -n""")
+             -p can only be specified with -n
+             -y can only be specified with -p""")
 
     parser = argparse.ArgumentParser(description='Gen-Z fabric manager information',
                                      formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -104,6 +111,8 @@ limitations: -f and -n are mutually exclusive
     parser.add_argument('-f', '--fabric',     help='fabric view (default)',                                     action='store_true')
     parser.add_argument('-n', '--node',       help='node name')
     parser.add_argument('-p', '--port',       help='port number')
+    parser.add_argument('-l', '--live',       help='live read instead of the sweep results',                    action='store_true')
+    parser.add_argument('-y', '--history',    help='port metrics history over the last N seconds',              nargs='?', const='all')
     parser.add_argument('server',             help='Gen-Z fabric manager server IP address',                    nargs='?', metavar='ZFM management address')
 
     args = vars(parser.parse_args())
@@ -117,6 +126,9 @@ limitations: -f and -n are mutually exclusive
     elif args['port'] and not args['node']:
         print('-p can only be specified with -n')
         sys.exit(0)
+    elif args['history'] and not args['port']:
+        print('-y can only be specified with -p')
+        sys.exit(0)
 
     args['format'] = 'JSON' if args['json'] else 'ASCII'
 
@@ -153,6 +165,10 @@ limitations: -f and -n are mutually exclusive
         parameters.append('config=Enabled')
     if args['type']:
         parameters.append('type={}'.format(args['type']))
+    if args['live']:
+        parameters.append('fresh=1')
+    if args['history'] and args['history'] != 'all':
+        parameters.append('window={}'.format(args['history']))
 
     #
     # Get the information.
@@ -162,6 +178,8 @@ limitations: -f and -n are mutually exclusive
             status, data = zfm_fabric(args, parameters)
         elif args['node'] and not args['port']:
             status, data = zfm_node(args, parameters)
+        elif args['node'] and args['port'] and args['history']:
+            status, data = zfm_history(args, parameters)
         elif args['node'] and args['port']:
             status, data = zfm_port(args, parameters)
     except KeyboardInterrupt:
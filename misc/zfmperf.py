@@ -61,9 +61,16 @@ endpoint_help = textwrap.dedent("""\
 
 # ----------------------------------------------------------------------------------------------------------------------
 
+#
+# Last GET reply for each URL and its ETag.  Polls ask for the resource only if it has changed.
+#
+etags = {}
+
 def rest(f, url, data):
     REST_RETRIES = 3
     headers = { "Accept": "application/json", "Content-Type": "application/json" }
+    if f == requests.get and url in etags:
+        headers['If-None-Match'] = etags[url][0]
 
     r = None
     reply = None
@@ -88,10 +95,14 @@ def rest(f, url, data):
         else:
             status = r.status_code
 
-    if r and status//100 == 2:
+    if status == HTTPStatus.NOT_MODIFIED and url in etags:
+        status = HTTPStatus.OK
+        reply = json.loads(etags[url][1])
+    elif r and status//100 == 2:
         if r.text and len(r.text) > 0:
             reply = r.text
             if reply and reply.startswith('<pre>'): reply = reply[5:-6]
+            if f == requests.get and 'ETag' in r.headers: etags[url] = (r.headers['ETag'], reply)
             reply = json.loads(reply)
 
     return status, reply
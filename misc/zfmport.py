@@ -58,9 +58,16 @@ command_help = textwrap.dedent("""\
 
 # -------------------------------------------------------------------------------------------------
 
+#
+# Last GET reply for each URL and its ETag.  Polls ask for the resource only if it has changed.
+#
+etags = {}
+
 def rest(f, url, data):
     REST_RETRIES = 3
     headers = { "Accept": "application/json", "Content-Type": "application/json" }
+    if f == requests.get and url in etags:
+        headers['If-None-Match'] = etags[url][0]
 
     r = None
     reply = None
@@ -85,13 +92,17 @@ def rest(f, url, data):
         else:
             status = r.status_code
 
-    if not r:
+    if status == HTTPStatus.NOT_MODIFIED and url in etags:
+        status = HTTPStatus.OK
+        reply = json.loads(etags[url][1])
+    elif not r:
         print('REST request failed with code {}'.format(status))
     elif status//100 != 2:
         print('REST request returned error code {}'.format(status))
     elif r.text and len(r.text) > 0:
         reply = r.text
         if reply and reply.startswith('<pre>'): reply = reply[5:-6]
+        if f == requests.get and 'ETag' in r.headers: etags[url] = (r.headers['ETag'], reply)
         reply = json.loads(reply)
 
     return status//100 == 2, reply
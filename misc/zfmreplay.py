@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+#
+# (C) Copyright 2020 Hewlett Packard Enterprise Development LP.
+# Licensed under the Apache v2.0 license.
+#
+
+#
+# Replays a REST trace recorded by zfm.py -T (or zfmsim.py -T) against a (simulated) fabric.
+#
+# Example calls:
+#
+# ./zfmreplay.py zfm.trace.gz                                  at the recorded pace
+# ./zfmreplay.py -r 10 -c 32 zfm.trace.gz                      10 times faster, up to 32 requests at a time
+# ./zfmreplay.py -r 0 -c 64 -o replay.json zfm.trace.gz        as fast as possible, results to replay.json
+# ./zfmreplay.py -a 127.0.0.1:10011=10.0.0.5:8081 zfm.trace.gz send switch11's requests somewhere else
+#
+
+import os
+import sys
+import json
+import time
+import argparse
+import requests
+
+from threading          import Lock
+from concurrent.futures import ThreadPoolExecutor
+
+from km.fm.trace     import read_trace
+from km.fm.histogram import Histogram
+
+REPLAY_TIMEOUT = 30     # seconds without a reply before a request is given up
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class Replay():
+
+    def __init__(self, records, rate, concurrency, addresses):
+        self.records = records
+        self.rate = rate
+        self.concurrency = concurrency
+        self.addresses = addresses
+
+        #
+        # Conditional GETs use the ETag from the last reply for the URL, like the FM does.
+        #
+        self.etags = {}
+
+        self.lock = Lock()
+        self.verbs = {}
+        self.statuses = {}
+        self.sent = 0
+        self.received = 0
+        self.lag = Histogram()
+        self.elapsed = 0
+
+
+    def issue(self, record, due):
+        address = self.addresses.get(record['Address'], record['Address'])
+        url = 'http://{}{}'.format(address, record['Path'])
+
+        headers = { 'Accept' : 'application/json', 'Content-Type' : 'application/json' }
+        if record['Conditional'] and url in self.etags:
+            headers['If-None-Match'] = self.etags[url]
+
+        start = time.time()
+        try:
+            r = requests.request(record['Verb'], url, headers=headers, data=record['Data'], timeout=REPLAY_TIMEOUT)
+        except requests.exceptions.RequestException:
+            status, received = 0, 0
+        else:
+            status, received = r.status_code, len(r.content)
+            if 'ETag' in r.headers:
+                self.etags[url] = r.headers['ETag']
+
+        elapsed = time.time() - start
+
+        #
+        # How far behind the schedule the request went out shows when the concurrency (or the
+        # server) can't keep up with the rate.
+        #
+        self.lag.record(max(0, start - due))
+
+        with self.lock:
+            stats = self.verbs.setdefault(record['Verb'], { 'Latency' : Histogram(), 'Recorded' : Histogram() })
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            self.sent += len(record['Data'] or '')
+            self.received += received
+
+        stats['Latency'].record(elapsed)
+        stats['Recorded'].record(record['Elapsed'])
+
+
+    def run(self):
+        #
+        # The requests go out at their recorded times divided by the rate, or all at once for a
+        # rate of 0.  The pool limits how many are outstanding.
+        #
+        pool = ThreadPoolExecutor(max_workers=self.concurrency)
+        start = time.time()
+
+        for record in self.records:
+            due = start + record['Time']/self.rate if self.rate > 0 else start
+            delay = due - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+            pool.submit(self.issue, record, due)
+
+        pool.shutdown(wait=True)
+        self.elapsed = time.time() - start
+
+
+    def summary(self):
+        count = sum(self.statuses.values())
+
+        return { 'Requests'    : count,
+                 'Elapsed'     : self.elapsed,
+                 'Throughput'  : count / self.elapsed if self.elapsed else None,
+                 'Rate'        : self.rate,
+                 'Concurrency' : self.concurrency,
+                 'Sent'        : self.sent,
+                 'Received'    : self.received,
+                 'Statuses'    : { str(status) : n for status,n in sorted(self.statuses.items()) },
+                 'Lag'         : self.lag.summary(),
+                 'Verbs'       : { verb : { 'Latency'  : stats['Latency'].summary(),
+                                            'Recorded' : stats['Recorded'].summary() }
+                                   for verb,stats in sorted(self.verbs.items()) }
+        }
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+def print_summary(summary):
+    print('{} requests in {:.2f} seconds ({:.1f}/s), {} bytes sent, {} bytes received'.format(
+          summary['Requests'], summary['Elapsed'], summary['Throughput'] or 0, summary['Sent'], summary['Received']))
+    print('statuses : {}'.format('  '.join('{}={}'.format(s, n) for s,n in summary['Statuses'].items())))
+    print('lag      : mean={:.1f}ms max={:.1f}ms'.format(1000*(summary['Lag']['Mean'] or 0), 1000*(summary['Lag']['Max'] or 0)))
+    print()
+
+    header = '{:<10} {:>8} {:>10} {:>10} {:>10} {:>14}'
+    print(header.format('Verb', 'Count', 'Mean', 'P50<=', 'P99<=', 'Recorded mean'))
+    for verb, stats in summary['Verbs'].items():
+        latency, recorded = stats['Latency'], stats['Recorded']
+        print('{:<10} {:>8} {:>8.1f}ms {:>8.1f}ms {:>8.1f}ms {:>12.1f}ms'.format(
+              verb, latency['Count'], 1000*latency['Mean'], 1000*latency['P50'], 1000*latency['P99'], 1000*recorded['Mean']))
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    #
+    # Get the command line parameters.
+    #
+    parser = argparse.ArgumentParser(description='REST trace replay')
+
+    parser.add_argument('-r', '--rate',        help='speed up (0 for as fast as possible)',  required=False, default=1.0, type=float)
+    parser.add_argument('-c', '--concurrency', help='requests outstanding at once',          required=False, default=8,   type=int)
+    parser.add_argument('-a', '--address',     help='old=new node address',                  required=False, default=[],  action='append')
+    parser.add_argument('-v', '--verb',        help='only replay this verb',                 required=False, default=[],  action='append')
+    parser.add_argument('-o', '--output',      help='JSON results file',                     required=False, default=None)
+    parser.add_argument('trace',               help='trace file')
+
+    args = vars(parser.parse_args())
+
+    try:
+        header, records = read_trace(args['trace'])
+    except Exception as e:
+        print('can\'t read trace {} ({})'.format(args['trace'], e))
+        sys.exit(1)
+
+    if args['verb']:
+        records = [ record for record in records if record['Verb'] in args['verb'] ]
+
+    addresses = dict(address.split('=', 1) for address in args['address'])
+
+    print('replaying {} requests from a {} trace'.format(len(records), header['Trace']))
+
+    replay = Replay(records, args['rate'], args['concurrency'], addresses)
+    try:
+        replay.run()
+    except KeyboardInterrupt:
+        sys.exit(1)
+
+    summary = replay.summary()
+    print_summary(summary)
+
+    if args['output']:
+        with open(args['output'], 'w') as f:
+            json.dump(summary, f, indent=4)
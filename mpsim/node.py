@@ -12,8 +12,8 @@ import glob
 import copy
 import time
 import shutil
-import select
 import socket
+import selectors
 import random
 import itertools
 
@@ -24,6 +24,7 @@ from port import Port
 # ----------------------------------------------------------------------------------------------------------------------
 
 class Node():
+    STATS_INTERVAL = 1.0        # seconds between port statistics updates
 
     def __init__(self, data, browser):
         profile = data['profile']
@@ -35,6 +36,13 @@ class Node():
         self.env['redfish_base'] = '/redfish/v1'
         self.env['browser'] = browser
 
+        #
+        # Resource versions (for ETags).  The epoch keeps ETags from a previous run from matching.
+        #
+        self.env['versions'] = {}
+        self.env['generation'] = itertools.count(1)
+        self.env['epoch'] = '{:x}'.format(int(time.time()))
+
         #
         # Create a socket endpoint for all dead-ended ports.
         #
@@ -60,6 +68,14 @@ class Node():
             if not self.ports[i]:
                 self.ports[i] = Port(self, 'Disabled', i, '127.0.0.1', -1, 0x0)
 
+        #
+        # The port sockets are registered once, each with its port, so a ready socket leads
+        # straight to its port.
+        #
+        self.selector = selectors.DefaultSelector()
+        for port in self.ports:
+            self.selector.register(port.socket, selectors.EVENT_READ, port)
+
         #
         # Create the thread to run the ports.
         #
@@ -75,19 +91,33 @@ class Node():
 # ----------------------------------------------------------------------------------------------------------------------
 
     def run(self):
+        next_update = time.time() + self.STATS_INTERVAL
 
         while True:
-            port_sockets = [ port.socket for port in self.ports ]
-            ready_sockets, _, _ = select.select(port_sockets, [], [], 1.0)
-            if len(ready_sockets) > 0:
-                ready_ports = [ p for p in self.ports if p.socket in ready_sockets ]
-                for p in ready_ports:
-                    p.process_request()
-            else:
+            #
+            # Wait for packets until the next statistics update is due.
+            #
+            timeout = max(0, next_update - time.time())
+            for key, _ in self.selector.select(timeout):
+                key.data.process_request()
+
+            #
+            # The statistics run on their own schedule, so a busy port can't hold them off.
+            #
+            now = time.time()
+            if now >= next_update:
                 for p in self.ports:
                     if p.state == 'Enabled':
                         p.update_port_statistics()
 
+                #
+                # Keep to the schedule, but if we have fallen behind it, start over from now rather
+                # than running the missed updates back to back.
+                #
+                next_update += self.STATS_INTERVAL
+                if next_update <= now:
+                    next_update = now + self.STATS_INTERVAL
+
 # ----------------------------------------------------------------------------------------------------------------------
 
     def update_resource(self, old_data, new_data):
@@ -124,6 +154,16 @@ class Node():
         # Update the rest of the resource.
         #
         self.update_resource(attribute, data)
+        self.changed(base_name)
+
+
+    def changed(self, *paths):
+        #
+        # Give the resources new versions.  Their ETags change and their serialized replies are
+        # rebuilt on the next GET.
+        #
+        for path in paths:
+            self.env['versions'][path] = next(self.env['generation'])
 
 # ----------------------------------------------------------------------------------------------------------------------
 
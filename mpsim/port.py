@@ -56,6 +56,7 @@ class Port():
         with self.lock:
             if patch_data:
                 attribute['Status']['State'] = 'Starting'
+                self.node.changed(self.node.port_to_path(self.index))
 
                 #
                 # Send a training packet to my peer
@@ -84,6 +85,7 @@ class Port():
 
                 attribute['Status']['State'] = 'StandbyOffline'
                 attribute['LinkState'] = 'Enabled'
+                self.node.changed(self.node.port_to_path(self.index))
 
                 Log.info('{}/{} trained with {:X} {}', self.node.name(), self.index, self.remote_uid, self.remote_port)
 
@@ -109,6 +111,7 @@ class Port():
             attribute['Status']['State'] = 'Disabled'
             attribute['LinkState'] = 'Disabled'
             attribute['InterfaceState'] = 'Disabled'
+            self.node.changed(self.node.port_to_path(self.index))
 
 
 # ----------------------------------------------------------------------------------------------------------------------
@@ -155,6 +158,11 @@ class Port():
         return port_attribute, metrics_attribute
 
 
+    def metrics_changed(self):
+        port_attribute, _ = self.port_metrics_attribute()
+        self.node.changed(port_attribute['Metrics']['@odata.id'])
+
+
 
     def reset_port_statistics(self):
         port_attribute, metrics_attribute = self.port_metrics_attribute()
@@ -198,6 +206,8 @@ class Port():
                 vc_metrics['RecvBytes'] = 0
                 vc_metrics['Occupancy'] = 0
 
+        self.metrics_changed()
+
 
     def update_port_statistics(self):
         port_attribute, metrics_attribute = self.port_metrics_attribute()
@@ -253,6 +263,8 @@ class Port():
 
                     vc_metrics['Occupancy'] += random.randint(0,1)
 
+            self.metrics_changed()
+
 # ----------------------------------------------------------------------------------------------------------------------
 
     #
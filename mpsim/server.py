@@ -39,11 +39,13 @@ def browser_update(node):
 # -------   ----------      ----------------------------------------------------
 # GET       collection      Retrieve all resources in a collection
 # GET       resource        Retrieve a single resource
+# DEEPGET   resource        Retrieve a resource and the resources below it
 # HEAD      collection      Retrieve all resources in a collection (header only)
 # HEAD      resource        Retrieve a single resource (header only)
 # POST      collection      Create a new resource in a collection
 # PUT       resource        Update a resource
 # PATCH     resource        Update a resource
+# DEEPPATCH resource        Update a resource and the resources below it
 # DELETE    resource        Delete a resource
 # OPTIONS   any             Return available HTTP methods and other options
 #
@@ -81,7 +83,7 @@ class RestHandler(BaseHTTPRequestHandler):
     # ----------------------------------------------------------------------------------------------
 
     def reply(self, status, headers=None, data=None):
-        encoded_data = data.encode() if data else None
+        encoded_data = data.encode() if type(data) is str else data
 
         if headers and 'Content-Length' not in headers:
             headers['Content-Length'] = str(len(encoded_data))
@@ -105,22 +107,40 @@ class RestHandler(BaseHTTPRequestHandler):
 
     # ----------------------------------------------------------------------------------------------
 
-    def do_GET(self):
-        Log.info('GET {}', self.path)
-        path = self.normalize_path(self.path)
+    def representation(self):
+        #
+        # Browser mode decorates the resources with links for people.  Clients that ask for
+        # JSON (e.g. the fabric manager) still get plain JSON.
+        #
+        if self.server.env['browser'] and 'application/json' not in self.headers.get('Accept', ''):
+            return 'browser'
+        else:
+            return 'json'
+
+
+    def etag(self, path, representation):
+        suffix = '-html' if representation == 'browser' else ''
+        return '"{}-{}{}"'.format(self.server.env['epoch'], self.server.env['versions'].get(path, 0), suffix)
 
+
+    def serialize(self, path, representation):
         #
-        # If we don't know this resource, send 404.
+        # Serialized replies are kept per resource version and representation, so an unchanged
+        # resource is only serialized once.  The version is read first : a change during
+        # serialization leaves a stale version behind and the next GET serializes again.
         #
-        if path not in self.server.attributes:
-            self.reply(404)
-            return
+        key = (path, representation)
+        version = self.server.env['versions'].get(path, 0)
+        cached = self.server.serialized.get(key)
+        if cached and cached[0] == version:
+            return cached[1], cached[2]
 
         #
         # Get the resource.  Update the links if requested.
         #
-        data = copy.deepcopy(self.server.attributes[path])
-        if self.server.env['browser']:
+        data = self.server.attributes[path]
+        if representation == 'browser':
+            data = copy.deepcopy(data)
             browser_update(data)
             data = '<pre>' + json.dumps(data, indent=4, separators=(',', ': ')) + '</pre>'
             content_type = 'text/html'
@@ -128,10 +148,66 @@ class RestHandler(BaseHTTPRequestHandler):
             data = json.dumps(data, indent=4, separators=(',', ': '))
             content_type = 'application/json'
 
-        headers = { 'Content-Type'   : content_type,
-                    'Cache-Control'  : 'no-cache, no-store, must-revalidate',
-                    'Pragma'         : 'no-cache',
-                    'Expires'        : '0' }
+        encoded_data = data.encode()
+        self.server.serialized[key] = (version, content_type, encoded_data)
+
+        return content_type, encoded_data
+
+    # ----------------------------------------------------------------------------------------------
+
+    def do_GET(self):
+        Log.info('GET {}', self.path)
+        path = self.normalize_path(self.path)
+
+        #
+        # If we don't know this resource, send 404.
+        #
+        if path not in self.server.attributes:
+            self.reply(404)
+            return
+
+        #
+        # If the requester already has this version, send 304.
+        #
+        representation = self.representation()
+        etag = self.etag(path, representation)
+        if self.headers.get('If-None-Match') == etag:
+            self.reply(304, { 'ETag' : etag, 'Vary' : 'Accept', 'Content-Length' : '0' })
+            return
+
+        content_type, data = self.serialize(path, representation)
+
+        headers = { 'Content-Type'  : content_type,
+                    'Cache-Control' : 'no-cache',
+                    'Vary'          : 'Accept',
+                    'ETag'          : etag }
+
+        self.reply(200, headers, data)
+
+    # ----------------------------------------------------------------------------------------------
+
+    def do_DEEPGET(self):
+        Log.info('DEEPGET {}', self.path)
+        path = self.normalize_path(self.path)
+
+        #
+        # If we don't know this resource, send 404.
+        #
+        if path not in self.server.attributes:
+            self.reply(404)
+            return
+
+        #
+        # Return the resource and every resource below it, keyed by name.
+        #
+        prefix = path + '/'
+        data = { name : value for name,value in self.server.attributes.items() if name == path or name.startswith(prefix) }
+        data = json.dumps(data)
+
+        headers = { 'Content-Type'  : 'application/json',
+                    'Cache-Control' : 'no-cache, no-store, must-revalidate',
+                    'Pragma'        : 'no-cache',
+                    'Expires'       : '0' }
 
         self.reply(200, headers, data)
 
@@ -190,6 +266,7 @@ class RestHandler(BaseHTTPRequestHandler):
             # Put the new entry into the tree.
             #
             self.server.attributes[data_id] = data
+            self.server.node.changed(path, data_id)
 
             #
             # Reply to the user.
@@ -241,7 +318,43 @@ class RestHandler(BaseHTTPRequestHandler):
 
     def do_DEEPPATCH(self):
         Log.info('DEEPPATCH {}', self.path)
-        self.reply(405)
+
+        path = self.normalize_path(self.path)
+
+        data_length = int(self.headers['Content-Length'])
+
+        try:
+            data = json.loads(self.rfile.read(data_length).decode('utf-8'))
+            entries = { self.normalize_path(name) : value for name,value in data.items() }
+        except Exception as e:
+            Log.info('invalid DEEPPATCH request - JSON improperly formatted')
+            self.reply(400)
+            return
+
+        #
+        # The payload maps every resource at or below the path to its update.
+        # If the resource or any of the entries doesn't exist, then 404.
+        # If any entry is a collection or isn't below the resource, then 400 (405 would tell the
+        # FM that DEEPPATCH isn't supported at all).
+        # Otherwise, 204.
+        #
+        if path not in self.server.attributes:
+            status = 404
+        elif any(name not in self.server.attributes for name in entries):
+            status = 404
+        elif any(name != path and not name.startswith(path + '/') for name in entries):
+            status = 400
+        elif any('Members' in self.server.attributes[name] for name in entries):
+            status = 400
+        else:
+            status = 204
+            for name,value in entries.items():
+                self.server.node.do_PATCH(name, value)
+
+        #
+        # Reply to user.
+        #
+        self.reply(status)
 
     # ----------------------------------------------------------------------------------------------
 
@@ -273,6 +386,10 @@ class RestHandler(BaseHTTPRequestHandler):
                     self.server.attributes[parent_path]['Members@odata.count'] -= 1
                     break
 
+            self.server.node.changed(path, parent_path)
+            for representation in [ 'json', 'browser' ]:
+                self.server.serialized.pop((path, representation), None)
+
         #
         # Reply to user.
         #
@@ -292,6 +409,7 @@ class RedfishServer():
         self.server.node = node
         self.server.env = node.env
         self.server.attributes = node.env['attributes']
+        self.server.serialized = {}
 
         #
         # Create the REDfish thread.
@@ -29,7 +29,8 @@ setup(
     description='ZFM tools',
     scripts=['fm/zfm.py', 'sim/zfmsim.py', 'conf/zfmconf.py', 'route/zfmroute.py',
              'misc/zfmcurl.py', 'misc/zfminfo.py', 'misc/zfmlink.py', 'misc/zfmperf.py',
-             'misc/zfmport.py', 'misc/zfmrest.py', 'misc/zfmtr.py', 'logger/zfmlogger.py',
+             'misc/zfmport.py', 'misc/zfmrest.py', 'misc/zfmtr.py', 'misc/zfmreplay.py', 'misc/zfmbench.py',
+             'logger/zfmlogger.py',
              'tools/vmctl.py' ]
 )
 
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+#
+# (C) Copyright 2020 Hewlett Packard Enterprise Development LP.
+# Licensed under the Apache v2.0 license.
+#
+
+import re
+import os
+import sys
+import time
+import heapq
+
+from threading import Thread
+from threading import Condition
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class Clock():
+
+    #
+    # Simulated time.  It runs 'speedup' times faster than real time, so port training, counters
+    # and anything else timed by the simulator play out in a fraction of the real time.  A speedup
+    # of 1 is real time.
+    #
+    def __init__(self, speedup=1.0):
+        self.speedup = speedup
+        self.real_start = time.time()
+        self.virtual_start = self.real_start
+
+
+    def set_speedup(self, speedup):
+        #
+        # Carry on from the current simulated time, so time never goes backwards.
+        #
+        now = time.time()
+        self.virtual_start = self.time(now)
+        self.real_start = now
+        self.speedup = speedup
+
+
+    def time(self, now=None):
+        if now is None: now = time.time()
+        return self.virtual_start + (now - self.real_start)*self.speedup
+
+
+    def real_delay(self, delay):
+        return max(0, delay / self.speedup)
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class Scheduler():
+
+    #
+    # Timers on the simulated clock.  The timers are a heap of (due time, sequence, function,
+    # args) entries served by one thread, which sleeps until the earliest one comes due.  The
+    # sequence keeps the heap from comparing functions.
+    #
+    def __init__(self, clock):
+        self.clock = clock
+        self.timers = []
+        self.sequence = 0
+        self.condition = Condition()
+        self.thread = None
+
+
+    def call_at(self, due, function, *args):
+        with self.condition:
+            if not self.thread:
+                self.thread = Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+            self.sequence += 1
+            heapq.heappush(self.timers, (due, self.sequence, function, args))
+            self.condition.notify()
+
+
+    def call_later(self, delay, function, *args):
+        self.call_at(self.clock.time() + delay, function, *args)
+
+
+    def run(self):
+
+        while True:
+            #
+            # Wait for the earliest timer to come due, then run everything that is due.  The
+            # functions are called without the lock so they can set new timers.
+            #
+            with self.condition:
+                while (not self.timers) or (self.timers[0][0] > self.clock.time()):
+                    timeout = self.clock.real_delay(self.timers[0][0] - self.clock.time()) if self.timers else None
+                    self.condition.wait(timeout)
+
+                now = self.clock.time()
+                due = []
+                while self.timers and (self.timers[0][0] <= now):
+                    _, _, function, args = heapq.heappop(self.timers)
+                    due.append((function, args))
+
+            for function, args in due:
+                try:
+                    function(*args)
+                except Exception as e:
+                    print('timer {} failed ({})'.format(getattr(function, '__name__', function), e))
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+#
+# The simulator's clock and timers.  They are shared by all of the nodes in a process.
+#
+clock = Clock()
+scheduler = Scheduler(clock)
+
+# ----------------------------------------------------------------------------------------------------------------------
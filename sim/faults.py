@@ -0,0 +1,511 @@
+#!/usr/bin/env python3
+#
+# (C) Copyright 2020 Hewlett Packard Enterprise Development LP.
+# Licensed under the Apache v2.0 license.
+#
+
+import re
+import os
+import sys
+import json
+import copy
+import time
+import random
+import requests
+
+from threading import Lock
+from threading import Thread
+
+from km.sim.clock import clock
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+FAULT_HANG        = 35                          # seconds a timed out request is held before its connection is closed
+FAULT_BURST       = 100                         # errors added by an error counter burst
+FAULT_REPORT      = 'faults.report.json'        # default report file (in the config directory)
+FAULT_OBSERVE     = 0.5                         # real seconds between reads of the FM's view of the fabric
+FAULT_FM_TIMEOUT  = 5                           # seconds to wait for the FM's view
+
+PORT_FAULTS       = [ 'LinkDown', 'LinkFlap', 'Health', 'ErrorBurst' ]
+NODE_FAULTS       = [ 'Latency', 'Timeout', 'DropPatch' ]
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class Fault():
+
+    #
+    # One scheduled fault.  The times the fault was injected and cleared, and the times the FM
+    # first saw it and first saw it gone, are real (time.time()) times : they measure the FM.
+    # A fault has no recovery time if there is nothing to recover from (an error burst) or if the
+    # FM stopped sweeping the port (it downs ports with bad links and doesn't bring them back).
+    #
+    def __init__(self, number, fault_type, node, port, start, duration, spec, seed):
+        self.number = number
+        self.type = fault_type
+        self.node = node
+        self.port = port
+        self.start = start
+        self.duration = duration
+        self.spec = spec
+        self.rng = random.Random('{}-{}'.format(seed, number))
+
+        self.active = False
+        self.changes = []
+        self.paths = []
+        self.baseline = None
+        self.injected = None
+        self.cleared = None
+        self.detected = None
+        self.recovered = None
+        self.unswept = False
+        self.finished = False
+
+
+    def name(self):
+        return '{}[{}]'.format(self.node, self.port) if self.port is not None else self.node
+
+
+    def change(self, attribute, keys, value):
+        #
+        # Set attribute[keys...] to value, remembering what it was so clear() can put it back.
+        #
+        for key in keys[:-1]:
+            attribute = attribute[key]
+
+        self.changes.append((keys, copy.deepcopy(attribute[keys[-1]]), value))
+        attribute[keys[-1]] = value
+
+
+    def undo(self, attribute):
+        #
+        # Put back only what the fault changed, and only where it still holds the fault's value.
+        # Anything changed in the meantime (the FM disabling the port, a reset) stands.
+        #
+        for keys, old_value, new_value in self.changes:
+            container = attribute
+            for key in keys[:-1]:
+                container = container[key]
+
+            if container[keys[-1]] == new_value:
+                container[keys[-1]] = old_value
+
+
+    def shows(self, state):
+        #
+        # Does the FM's view of the port show the fault?
+        #
+        if self.type in [ 'LinkDown', 'LinkFlap' ]:
+            return not state['Up']
+        elif self.type == 'Health':
+            return not state['Healthy']
+        elif self.type == 'ErrorBurst':
+            return state['Errors'] - self.baseline >= self.spec.get('Count', FAULT_BURST)
+
+        return False
+
+
+    def report(self):
+        #
+        # A fault that cleared before the FM saw it was missed : it has no recovery time.
+        #
+        ttd = self.detected - self.injected if self.detected and self.injected else None
+        if self.type == 'ErrorBurst' or self.unswept:
+            ttr = 'n/a'
+        else:
+            ttr = self.recovered - self.cleared if self.recovered and self.cleared and self.detected else None
+
+        return { 'Number'   : self.number,
+                 'Type'     : self.type,
+                 'Node'     : self.node,
+                 'Port'     : self.port,
+                 'Start'    : self.start,
+                 'Duration' : self.duration,
+                 'Injected' : self.injected,
+                 'Cleared'  : self.cleared,
+                 'Missed'   : self.detected is None and not self.unswept and (self.cleared is not None or self.finished),
+                 'Unswept'  : self.unswept,
+                 'TTD'      : ttd,
+                 'TTR'      : ttr }
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class FaultEngine():
+
+    #
+    # Injects faults into the simulated nodes on a fixed schedule and measures how long the FM
+    # takes to see each one (time to detect) and to see it gone (time to recover).
+    #
+    # Port faults are measured against the FM's own view of the fabric, read from its /metrics
+    # (which it serves from what its sweeps have read) : the FM has seen a link down when it
+    # shows the port down, and has seen it gone when it shows the port up again.  This needs the
+    # FM's address ("FM").  The FM exposes nothing for node faults, so those are seen when one of
+    # the FM's requests is hit by them, and seen gone on its first request after they clear.
+    #
+    # The fault script is a JSON file :
+    #
+    #   { "Seed"   : 1,
+    #     "Report" : "faults.report.json",
+    #     "FM"     : "127.0.0.1:60000",
+    #     "Faults" : [ { "Type"     : "LinkDown",          # see below
+    #                    "Node"     : "switch11",          # node name or "*" for a random node
+    #                    "Port"     : 2,                   # port faults : port number or "*"
+    #                    "Start"    : 60,                  # simulated seconds after start up
+    #                    "Duration" : 30 } ],              # simulated seconds
+    #     "Random" : { "Count"    : 10,                    # faults picked at random (optional)
+    #                  "Types"    : [ "LinkDown", "Latency" ],
+    #                  "Start"    : [ 60, 600 ],
+    #                  "Duration" : [ 5, 60 ] } }
+    #
+    #   LinkDown     the link and interface go down, then come back
+    #   LinkFlap     "Count" link downs, one every "Period" seconds, each down for half a period
+    #   Health       the port health goes to "Health" (default Critical)
+    #   ErrorBurst   "Count" errors are added to the "Counter" interface error counter
+    #   Latency      requests are delayed by "Delay" +/- "Jitter" real seconds
+    #   Timeout      requests are held for "Delay" real seconds and then dropped, with
+    #                probability "Probability" (default 1)
+    #   DropPatch    PATCHes are acknowledged but not applied, with probability "Probability"
+    #
+    # The same seed gives the same schedule, and each fault makes its own random choices, so runs
+    # can be compared.
+    #
+    def __init__(self, servers, script):
+        self.servers = { server.node_name : server for server in servers }
+        self.seed = script.get('Seed', 0)
+        self.report_file = script.get('Report', FAULT_REPORT)
+        self.fm = script.get('FM', None)
+        self.rng = random.Random(self.seed)
+        self.lock = Lock()
+        self.view = {}
+
+        self.faults = []
+        for spec in script.get('Faults', []):
+            self.add(spec)
+
+        generator = script.get('Random', None)
+        if generator:
+            for i in range(generator.get('Count', 0)):
+                self.add({ 'Type'     : self.rng.choice(generator.get('Types', PORT_FAULTS)),
+                           'Node'     : '*',
+                           'Port'     : '*',
+                           'Start'    : self.rng.uniform(*generator.get('Start', [0, 600])),
+                           'Duration' : self.rng.uniform(*generator.get('Duration', [5, 60])) })
+
+        self.faults.sort(key=lambda fault : (fault.start, fault.number))
+
+        if not self.fm and any(fault.type in PORT_FAULTS for fault in self.faults):
+            print('no FM address in the fault script : port faults won\'t be measured')
+
+
+    @staticmethod
+    def load(filename, servers):
+        try:
+            with open(filename) as f:
+                script = json.load(f)
+        except:
+            print('can\'t read fault script {}'.format(filename))
+            return None
+
+        return FaultEngine(servers, script)
+
+
+    def add(self, spec):
+        fault_type = spec.get('Type', None)
+        if fault_type not in PORT_FAULTS + NODE_FAULTS:
+            print('unknown fault type {}'.format(fault_type))
+            return
+
+        #
+        # Pick the random targets.  Only enabled ports are picked.
+        #
+        def enabled_ports(name):
+            return [ i for i,port in enumerate(self.servers[name].profile['ports']) if port['State'] == 'Enabled' ]
+
+        node = spec.get('Node', '*')
+        if node == '*':
+            candidates = sorted(name for name in self.servers if fault_type in NODE_FAULTS or enabled_ports(name))
+            if not candidates:
+                print('{} fault : no node to put it on'.format(fault_type))
+                return
+
+            node = self.rng.choice(candidates)
+
+        if node not in self.servers:
+            print('{} fault : unknown node {}'.format(fault_type, node))
+            return
+
+        port = None
+        if fault_type in PORT_FAULTS:
+            port = spec.get('Port', '*')
+            if port == '*':
+                ports = enabled_ports(node)
+                if not ports:
+                    print('{} fault : {} has no enabled ports'.format(fault_type, node))
+                    return
+
+                port = self.rng.choice(ports)
+
+        #
+        # A flap is a run of short link downs.
+        #
+        start = spec.get('Start', 0)
+        if fault_type == 'LinkFlap':
+            period = spec.get('Period', 10)
+            for i in range(spec.get('Count', 3)):
+                self.faults.append(Fault(len(self.faults), fault_type, node, port, start + i*period, period/2, spec, self.seed))
+        else:
+            duration = 0 if fault_type == 'ErrorBurst' else spec.get('Duration', 30)
+            self.faults.append(Fault(len(self.faults), fault_type, node, port, start, duration, spec, self.seed))
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+    def start(self):
+        #
+        # The faults run as work items of their nodes, so they don't race the node's own work.
+        #
+        for fault in self.faults:
+            server = self.servers[fault.node]
+            server.node.schedule(fault.start, [self.inject, fault])
+
+        if self.fm:
+            Thread(target=self.observe, daemon=True).start()
+
+        print('{} faults scheduled (seed {})'.format(len(self.faults), self.seed))
+
+
+    def inject(self, fault):
+        server = self.servers[fault.node]
+
+        if fault.port is not None:
+            port_path = server.node.port_to_path(fault.port)
+            port_attr = server.cache[port_path]
+            metrics_path = port_attr['Metrics']['@odata.id']
+            fault.paths = [ port_path, metrics_path ]
+
+            server.node.materialize_port(fault.port)
+
+            if fault.type in [ 'LinkDown', 'LinkFlap' ]:
+                fault.change(port_attr, [ 'LinkState' ], 'Disabled')
+                fault.change(port_attr, [ 'InterfaceState' ], 'Disabled')
+                fault.change(port_attr, [ 'Status', 'State' ], 'Disabled')
+            elif fault.type == 'Health':
+                fault.change(port_attr, [ 'Status', 'Health' ], fault.spec.get('Health', 'Critical'))
+            elif fault.type == 'ErrorBurst':
+                counters = server.cache[metrics_path]['Gen-Z']
+                counter = fault.spec.get('Counter', None) or fault.rng.choice(sorted(counters))
+                counters[counter] += fault.spec.get('Count', FAULT_BURST)
+
+            server.node.changed(*fault.paths)
+
+        with self.lock:
+            fault.active = True
+            fault.injected = time.time()
+
+            #
+            # A burst is seen when the FM's error counts for the port have gone up by the burst.
+            #
+            state = self.view.get((fault.node, fault.port), None)
+            if fault.type == 'ErrorBurst' and state:
+                fault.baseline = state['Errors']
+
+            #
+            # The FM can't see a fault on a port it has already stopped sweeping.
+            #
+            if fault.port is not None and state and not state['Active']:
+                fault.unswept = True
+                fault.finished = True
+
+        print('fault {} {} {} : injected'.format(fault.number, fault.type, fault.name()))
+        self.write_report()
+
+        #
+        # A burst has nothing to clear.  It is over once the FM has seen it.
+        #
+        if fault.type != 'ErrorBurst':
+            server.node.schedule(fault.duration, [self.clear, fault])
+
+
+    def clear(self, fault):
+        server = self.servers[fault.node]
+
+        if fault.changes:
+            fault.undo(server.cache[fault.paths[0]])
+            server.node.changed(*fault.paths)
+
+        with self.lock:
+            fault.active = False
+            fault.cleared = time.time()
+
+        print('fault {} {} {} : cleared'.format(fault.number, fault.type, fault.name()))
+        self.write_report()
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+    def request(self, server, method, path):
+        #
+        # Called for every request a node gets.  Returns how many seconds to hold the request and
+        # what to do with it : None (serve it), 'drop' (close the connection without a reply) or
+        # 'ignore' (acknowledge it without doing it).
+        #
+        delay = 0
+        outcome = None
+        events = []
+
+        with self.lock:
+            now = time.time()
+            for fault in self.faults:
+                if fault.type not in NODE_FAULTS: continue
+                if fault.node != server.node_name or fault.injected is None: continue
+                if fault.recovered is not None: continue
+
+                if fault.active:
+                    hit = True
+                    if fault.type == 'Latency':
+                        jitter = fault.spec.get('Jitter', 0)
+                        delay += max(0, fault.spec.get('Delay', 1) + fault.rng.uniform(-jitter, jitter))
+                    elif fault.type == 'Timeout':
+                        hit = fault.rng.random() < fault.spec.get('Probability', 1)
+                        if hit:
+                            delay += fault.spec.get('Delay', FAULT_HANG)
+                            outcome = 'drop'
+                    elif fault.type == 'DropPatch':
+                        hit = method in [ 'PATCH', 'DEEPPATCH' ] and fault.rng.random() < fault.spec.get('Probability', 1)
+                        if hit and not outcome:
+                            outcome = 'ignore'
+
+                    if hit and fault.detected is None:
+                        fault.detected = now
+                        events.append('fault {} {} {} : detected after {:.2f} seconds'.format(
+                                      fault.number, fault.type, fault.name(), now - fault.injected))
+                else:
+                    fault.recovered = now
+                    if fault.detected is None:
+                        events.append('fault {} {} {} : missed'.format(fault.number, fault.type, fault.name()))
+                    else:
+                        events.append('fault {} {} {} : recovered after {:.2f} seconds'.format(
+                                      fault.number, fault.type, fault.name(), now - fault.cleared))
+
+        if events:
+            for event in events:
+                print(event)
+            self.write_report()
+
+        return delay, outcome
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+    def observe(self):
+        #
+        # Follow the FM's view of the ports.  Reading /metrics costs the FM no requests to the
+        # nodes, so watching doesn't change what is watched.
+        #
+        url = 'http://{}/metrics?format=JSON'.format(self.fm)
+
+        while True:
+            try:
+                r = requests.get(url, timeout=FAULT_FM_TIMEOUT)
+                metrics = r.json()['Metrics'] if r.status_code == 200 else None
+            except (requests.exceptions.RequestException, ValueError, KeyError):
+                metrics = None
+
+            if metrics:
+                self.update(self.port_view(metrics))
+
+            time.sleep(FAULT_OBSERVE)
+
+
+    @staticmethod
+    def port_view(metrics):
+        view = {}
+
+        def samples(family):
+            for sample in metrics.get(family, {}).get('Samples', []):
+                labels = sample['Labels']
+                yield view.setdefault((labels['node'], int(labels['port'])), { 'Up' : False, 'Active' : False, 'Healthy' : True, 'Errors' : 0 }), sample
+
+        for state, sample in samples('zfm_port_up'):      state['Up'] = sample['Value'] == 1
+        for state, sample in samples('zfm_port_active'):  state['Active'] = sample['Value'] == 1
+        for state, sample in samples('zfm_port_healthy'): state['Healthy'] = sample['Value'] == 1
+        for state, sample in samples('zfm_port_interface_total'):
+            state['Errors'] += sample['Value']
+
+        return view
+
+
+    def update(self, view):
+        events = []
+
+        with self.lock:
+            self.view = view
+            now = time.time()
+
+            for fault in self.faults:
+                if fault.type not in PORT_FAULTS: continue
+                if fault.injected is None or fault.finished: continue
+
+                state = view.get((fault.node, fault.port), None)
+                if state is None: continue
+
+                if fault.type == 'ErrorBurst' and fault.baseline is None:
+                    fault.baseline = state['Errors']
+
+                if fault.detected is None:
+                    if fault.shows(state):
+                        fault.detected = now
+                        events.append('fault {} {} {} : detected after {:.2f} seconds'.format(
+                                      fault.number, fault.type, fault.name(), now - fault.injected))
+
+                        fault.finished = fault.type == 'ErrorBurst'
+                    elif fault.cleared is not None:
+                        fault.finished = True
+                        events.append('fault {} {} {} : missed'.format(fault.number, fault.type, fault.name()))
+
+                elif fault.cleared is not None:
+                    if not state['Active']:
+                        fault.finished = True
+                        fault.unswept = True
+                        events.append('fault {} {} {} : no longer swept'.format(fault.number, fault.type, fault.name()))
+                    elif not fault.shows(state):
+                        fault.finished = True
+                        fault.recovered = now
+                        events.append('fault {} {} {} : recovered after {:.2f} seconds'.format(
+                                      fault.number, fault.type, fault.name(), now - fault.cleared))
+
+        if events:
+            for event in events:
+                print(event)
+            self.write_report()
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+    def summary(self):
+        def stats(values):
+            values = [ v for v in values if type(v) in [ int, float ] ]
+            return { 'Count' : len(values),
+                     'Mean'  : sum(values)/len(values) if values else None,
+                     'Max'   : max(values) if values else None }
+
+        reports = [ fault.report() for fault in self.faults ]
+
+        return { 'Seed'    : self.seed,
+                 'Speedup' : clock.speedup,
+                 'Faults'  : reports,
+                 'Missed'  : sum(1 for r in reports if r['Missed']),
+                 'TTD'     : stats(r['TTD'] for r in reports),
+                 'TTR'     : stats(r['TTR'] for r in reports) }
+
+
+    def write_report(self):
+        #
+        # The report is rewritten after every event, so it is up to date whenever the simulator
+        # is stopped.
+        #
+        with self.lock:
+            try:
+                tmp_file = self.report_file + '.tmp'
+                with open(tmp_file, 'w') as f:
+                    json.dump(self.summary(), f, indent=4)
+                os.replace(tmp_file, self.report_file)
+            except Exception as e:
+                print('can\'t write fault report {} ({})'.format(self.report_file, e))
+
+# ----------------------------------------------------------------------------------------------------------------------
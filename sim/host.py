@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+#
+# (C) Copyright 2020 Hewlett Packard Enterprise Development LP.
+# Licensed under the Apache v2.0 license.
+#
+
+import io
+import os
+import sys
+import time
+import socket
+import asyncio
+
+from km.sim.server  import RestHandler
+from km.sim.server  import init_server
+from km.sim.traffic import TrafficModel
+from km.sim.faults  import FaultEngine
+from km.fm.trace    import TraceWriter
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+HOST_BACKLOG      = 1024        # pending connections per listening socket
+HOST_HEADER_LIMIT = 65536       # largest request head accepted (bytes)
+
+NOT_FOUND         = b'HTTP/1.0 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n'
+BAD_REQUEST       = b'HTTP/1.0 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n'
+SERVER_ERROR      = b'HTTP/1.0 500 Internal Server Error\r\nContent-Length: 0\r\nConnection: close\r\n\r\n'
+NO_CONTENT        = b'HTTP/1.0 204 No Content\r\nContent-Length: 0\r\nConnection: close\r\n\r\n'
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class VirtualServer():
+
+    #
+    # Stands in for the HTTPServer of a node : it holds the node environment that init_server
+    # sets up and that the handler and node use.
+    #
+    def __init__(self, profile, loop):
+        self.loop = loop
+        init_server(self, profile)
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class SimHost():
+
+    #
+    # Serves any number of simulated nodes from one event loop.  There is one listening socket
+    # per distinct address:port in the node profiles.  Nodes that share a socket have a path
+    # prefix in their address (e.g. 127.0.0.1:8081/switch11) and requests are routed by the
+    # first path component.  A node with the socket to itself needs no prefix.
+    #
+    def __init__(self, profiles, browser, traffic_file=None, fault_file=None, trace_file=None):
+        self.profiles = profiles
+        self.browser = browser
+        self.traffic_file = traffic_file
+        self.fault_file = fault_file
+        self.trace_file = trace_file
+        self.listeners = {}
+
+
+    def add_node(self, profile, loop):
+        hostname, _, hostport = profile['address'].partition(':')
+        hostport, _, prefix = hostport.partition('/')
+        if not hostport: hostport = '8081'
+
+        try:
+            hostaddr = socket.gethostbyname(hostname)
+        except:
+            print('can\'t resolve the server address {}'.format(profile['address']))
+            return False
+
+        profile['address'] = '{}:{}{}'.format(hostaddr, hostport, '/' + prefix if prefix else '')
+        profile['browser'] = self.browser
+
+        routes = self.listeners.setdefault((hostaddr, int(hostport)), {})
+        if prefix in routes:
+            print('{} : address {} is already in use'.format(profile['name'], profile['address']))
+            return False
+
+        routes[prefix] = VirtualServer(profile, loop)
+        return True
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+    def route(self, routes, path):
+        #
+        # Returns the node's server and the path with the node prefix taken off.
+        #
+        if '' in routes and len(routes) == 1:
+            return routes[''], path
+
+        _, _, rest = path.partition('/')
+        prefix, _, rest = rest.partition('/')
+        server = routes.get(prefix, None)
+        if server:
+            return server, '/' + rest
+
+        return routes.get('', None), path
+
+
+    def trace(self, server, start, method, path, header_lines, status, body):
+        trace = getattr(server, 'trace', None)
+        if trace:
+            data = body.decode('utf-8') if body else None
+            conditional = b'\r\nif-none-match:' in b'\r\n' + header_lines.lower()
+            trace.record(start, server.node_name, server.node_address, method.decode('latin-1'), path,
+                         status, len(data or ''), 0, time.time() - start, conditional, data)
+
+
+    async def dispatch(self, routes, head, body, peer):
+        try:
+            request_line, _, header_lines = head.partition(b'\r\n')
+            method, path, version = request_line.split(b' ', 2)
+        except ValueError:
+            return BAD_REQUEST, True
+
+        server, path = self.route(routes, path.decode('latin-1'))
+        if not server:
+            return NOT_FOUND, True
+
+        #
+        # The node's requests go through the same handler as the threaded servers.  It reads
+        # the request from, and writes the reply to, memory.
+        #
+        request = b' '.join([ method, path.encode('latin-1'), version ]) + b'\r\n' + header_lines + body
+
+        handler = RestHandler.__new__(RestHandler)
+        handler.server = server
+
+        #
+        # Faults hold the request without holding up the other nodes.  The requests that they
+        # drop or ignore never reach the handler, so they are traced here (as the threaded
+        # servers trace them).
+        #
+        faults = getattr(server, 'faults', None)
+        if faults:
+            start = time.time()
+            delay, outcome = faults.request(server, method.decode('latin-1'), handler.normalize_path(path))
+            if delay:
+                await asyncio.sleep(delay)
+
+            if outcome == 'drop':
+                self.trace(server, start, method, path, header_lines, 0, None)
+                return b'', True
+            if outcome == 'ignore':
+                self.trace(server, start, method, path, header_lines, 204, body)
+                return NO_CONTENT, True
+
+        handler.client_address = peer
+        handler.rfile = io.BytesIO(request)
+        handler.wfile = io.BytesIO()
+        handler.close_connection = True
+        handler.inject_faults = False
+
+        try:
+            handler.handle_one_request()
+        except Exception as e:
+            print('{} : request failed ({})'.format(server.node_name, e))
+            return SERVER_ERROR, True
+
+        return handler.wfile.getvalue(), handler.close_connection
+
+
+    async def serve(self, reader, writer, routes):
+        peer = writer.get_extra_info('peername')
+
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+
+                #
+                # Read the body, if there is one.
+                #
+                length = 0
+                for line in head.split(b'\r\n')[1:]:
+                    name, _, value = line.partition(b':')
+                    if name.strip().lower() == b'content-length':
+                        length = int(value.strip())
+
+                body = await reader.readexactly(length) if length else b''
+
+                reply, close = await self.dispatch(routes, head, body, peer)
+                writer.write(reply)
+                await writer.drain()
+
+                if close:
+                    break
+
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            pass
+
+        finally:
+            writer.close()
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+
+        for profile in self.profiles:
+            if not self.add_node(profile, loop):
+                return False
+
+        if self.traffic_file:
+            servers = [ server for routes in self.listeners.values() for server in routes.values() ]
+            traffic = TrafficModel.load(self.traffic_file, servers)
+            if not traffic:
+                return False
+
+            for server in servers:
+                server.traffic = traffic
+
+        if self.fault_file:
+            servers = [ server for routes in self.listeners.values() for server in routes.values() ]
+            faults = FaultEngine.load(self.fault_file, servers)
+            if not faults:
+                return False
+
+            for server in servers:
+                server.faults = faults
+
+            faults.start()
+
+        if self.trace_file:
+            trace = TraceWriter(self.trace_file, 'zfmsim')
+            for routes in self.listeners.values():
+                for server in routes.values():
+                    server.trace = trace
+
+        for (address, port), routes in self.listeners.items():
+            try:
+                await asyncio.start_server(lambda r, w, routes=routes: self.serve(r, w, routes), address, port,
+                                           backlog=HOST_BACKLOG, limit=HOST_HEADER_LIMIT, reuse_address=True)
+            except OSError as e:
+                print('can\'t listen on {}:{} ({})'.format(address, port, e))
+                return False
+
+        print('{} nodes on {} sockets'.format(sum(len(routes) for routes in self.listeners.values()), len(self.listeners)))
+        sys.stdout.flush()
+        return True
+
+
+    async def main(self):
+        if not await self.start():
+            return 1
+
+        await asyncio.Event().wait()
+
+
+    def run(self):
+        try:
+            return asyncio.run(self.main())
+        except KeyboardInterrupt:
+            return 0
+
+# ----------------------------------------------------------------------------------------------------------------------
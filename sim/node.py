@@ -10,12 +10,49 @@ import sys
 import json
 import glob
 import copy
+import math
 import time
 import random
 
 from queue import Queue
-from queue import Empty
 from threading import Thread
+from threading import RLock
+
+from km.sim.clock import clock
+from km.sim.clock import scheduler
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+ERROR_PROBABILITY        = 0.05 / 1.05                      # chance per second of each interface counter moving
+MESSAGE_PROBABILITY      = 0.75                             # chance per second of a request/response each way
+VC_PROBABILITY           = 1 - 0.25**4                      # chance per second of any VC traffic
+VC_DIRECTION_PROBABILITY = (1 - 0.25**2) / (1 - 0.25**4)    # chance that a busy VC second moves each way
+LINK_TRAIN_TIME          = 2.0                              # simulated seconds for link training
+INTERFACE_TRAIN_TIME     = 1.0                              # simulated seconds for interface enablement
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+def binomial(n, p):
+    #
+    # Successes in n trials of probability p.  Large n uses the normal approximation.
+    #
+    if n < 32:
+        return sum(1 for i in range(n) if random.random() < p)
+
+    mean = n*p
+    return min(n, max(0, round(random.gauss(mean, math.sqrt(mean*(1 - p))))))
+
+
+def total_bytes(count, low, high):
+    #
+    # Sum of count message sizes picked uniformly from low..high.
+    #
+    if count < 32:
+        return sum(random.randint(low, high) for i in range(count))
+
+    mean = (low + high)/2
+    variance = ((high - low + 1)**2 - 1)/12
+    return max(0, round(random.gauss(count*mean, math.sqrt(count*variance))))
 
 # ----------------------------------------------------------------------------------------------------------------------
 
@@ -28,6 +65,28 @@ class Node():
         self.server = server
         self.port_range = [ i for i in range(self.server.profile['portStart'], self.server.profile['portEnd']) ]
 
+        #
+        # Port statistics are brought up to date when they are read.  This is when each port's
+        # were last updated (from the node's start until the first read), and the metrics
+        # resource -> port map.
+        #
+        self.stats_start = clock.time()
+        self.stats_times = {}
+        self.metrics_ports = None
+
+        #
+        # The server thread (reads and PATCHes) and the node's own work items both change the
+        # port resources, so they take turns.
+        #
+        self.lock = RLock()
+
+        #
+        # In the asyncio host the node's work runs on the host's event loop instead of a thread.
+        #
+        self.loop = getattr(server, 'loop', None)
+        if self.loop:
+            return
+
         #
         # Create an async queue for requests.
         #
@@ -69,19 +128,30 @@ class Node():
     def update_resource(self, old_data, new_data):
         self.update_dict(old_data, new_data)
 
+
+    def changed(self, *paths):
+        #
+        # Give the resources new versions.  Their ETags change and their serialized replies are
+        # rebuilt on the next GET.
+        #
+        for path in paths:
+            self.server.versions[path] = next(self.server.generation)
+
 # ----------------------------------------------------------------------------------------------------------------------
 
     #
     # REST interface functions.
     #
     def do_PATCH(self, base_name, data):
-        attribute_data = self.server.cache[base_name]
-        self.trigger(base_name, data)
-        self.update_resource(attribute_data, data)
+        with self.lock:
+            attribute_data = self.server.cache[base_name]
+            self.trigger(base_name, data)
+            self.update_resource(attribute_data, data)
+            self.changed(base_name)
 
 # ----------------------------------------------------------------------------------------------------------------------
 
-    def reset_port_statistics(self, port_attribute):
+    def reset_port_statistics(self, index, port_attribute):
 
         #
         # Get metrics path.
@@ -128,81 +198,152 @@ class Node():
                 vc_metrics['RecvBytes'] = 0
                 vc_metrics['Occupancy'] = 0
 
+        #
+        # The counters start again from now, not from when they were last brought up to date.
+        #
+        self.stats_times[index] = clock.time()
+        self.changed(metrics_path)
 
-    def update_port_statistics(self):
 
+    def metrics_port(self, path):
         #
-        # Get the port number
+        # Map the metrics resources to their ports the first time one is asked for.
         #
-        port_list = self.server.profile['ports']
-        for index,info in enumerate(port_list):
-            port_path = self.port_to_path(index)
-            port_attr = self.server.cache[port_path]
+        if self.metrics_ports is None:
+            self.metrics_ports = {}
+            for index in range(len(self.server.profile['ports'])):
+                port_path = self.port_to_path(index)
+                port_attr = self.server.cache.get(port_path, None) if port_path else None
+                if port_attr and 'Metrics' in port_attr:
+                    self.metrics_ports[port_attr['Metrics']['@odata.id']] = index
 
-            #
-            # Check port state.
-            #
-            if info['State'] != 'Enabled':
-                continue
-            if port_attr['LinkState'] != 'Enabled':
-                continue
-            if port_attr['InterfaceState'] != 'Enabled':
-                continue
+        return self.metrics_ports.get(path, -1)
 
-            #
-            # Get metrics path.
-            #
-            metrics_path = port_attr['Metrics']['@odata.id']
-            metrics_attr = self.server.cache[metrics_path]
-            oem_metrics = metrics_attr['Oem']['Hpe']['Metrics']
 
-            #
-            # Port Interface statistics.
-            #
-            interface_metrics = metrics_attr['Gen-Z']
-            for error_name in interface_metrics:
-                interface_metrics[error_name] += int(random.uniform(0,1.05))
+    def materialize(self, path):
+        index = self.metrics_port(path)
+        if index >= 0:
+            self.materialize_port(index)
+
+
+    def materialize_port(self, index):
+        #
+        # The counters only move when someone looks at them : the whole seconds since they were
+        # last brought up to date are simulated in one step.  The fraction left over carries on
+        # to the next read.
+        #
+        with self.lock:
+            now = clock.time()
+            last = self.stats_times.get(index, self.stats_start)
+            seconds = int(now - last)
+
+            self.stats_times[index] = last + seconds
+            if seconds > 0:
+                self.update_port_statistics(index, seconds)
+
+
+    def update_port_statistics(self, index, seconds):
+
+        #
+        # Check port state.  The counters only run while the port is up.
+        #
+        info = self.server.profile['ports'][index]
+        port_path = self.port_to_path(index)
+        port_attr = self.server.cache[port_path]
+
+        if info['State'] != 'Enabled':
+            return
+        if port_attr['LinkState'] != 'Enabled':
+            return
+        if port_attr['InterfaceState'] != 'Enabled':
+            return
+
+        #
+        # Get metrics path.
+        #
+        metrics_path = port_attr['Metrics']['@odata.id']
+        metrics_attr = self.server.cache[metrics_path]
+        oem_metrics = metrics_attr['Oem']['Hpe']['Metrics']
+
+        #
+        # Port Interface statistics.
+        #
+        interface_metrics = metrics_attr['Gen-Z']
+        for error_name in interface_metrics:
+            interface_metrics[error_name] += binomial(seconds, ERROR_PROBABILITY)
+
+        #
+        # With a traffic model, the traffic counters follow the flows routed through the port.
+        #
+        traffic = getattr(self.server, 'traffic', None)
+        if traffic:
+            self.update_port_traffic(oem_metrics, traffic.port_rates(self.server.node_name, index), seconds)
+            self.changed(metrics_path)
+            return
+
+        #
+        # Port Requestor/Responder statistics.
+        #
+        for group in [ 'Request', 'Response' ]:
+            group_metrics = oem_metrics.get(group, None)
+            if group_metrics:
+                for direction in [ 'Xmit', 'Recv' ]:
+                    count = binomial(seconds, MESSAGE_PROBABILITY)
+                    group_metrics[direction + 'Count'] += count
+                    group_metrics[direction + 'Bytes'] += total_bytes(count, 1, 256)
+
+        #
+        # Port VC statistics.  Each second with any traffic picks one VC, so the busy seconds are
+        # dealt out over the VCs.
+        #
+        vc_metrics = oem_metrics.get('VC0', None)
+        if vc_metrics:
+            remaining = binomial(seconds, VC_PROBABILITY)
+            for vc_index in range(16):
+                share = binomial(remaining, 1/(16 - vc_index))
+                remaining -= share
+                if share == 0: continue
+
+                vc_metrics = oem_metrics['VC{}'.format(vc_index)]
+                for direction in [ 'Xmit', 'Recv' ]:
+                    count = binomial(share, VC_DIRECTION_PROBABILITY)
+                    vc_metrics[direction + 'Count'] += count
+                    vc_metrics[direction + 'Bytes'] += total_bytes(count, 0, 256)
+
+                vc_metrics['Occupancy'] += binomial(share, 0.5)
+
+        self.changed(metrics_path)
 
-            #
-            # Port Requestor/Responder statistics.
-            #
-            msg_probs = [ random.randint(0,3) > 0 for i in range(4) ]
-
-            request_metrics = oem_metrics.get('Request', None)
-            if request_metrics:
-                if msg_probs[0]:
-                    request_metrics['XmitCount'] += 1
-                    request_metrics['XmitBytes'] += random.randint(1,256)
-                if msg_probs[1]:
-                    request_metrics['RecvCount'] += 1
-                    request_metrics['RecvBytes'] += random.randint(1,256)
-
-            response_metrics = oem_metrics.get('Response', None)
-            if response_metrics:
-                if msg_probs[2]:
-                    response_metrics['XmitCount'] += 1
-                    response_metrics['XmitBytes'] += random.randint(1,256)
-                if msg_probs[3]:
-                    response_metrics['RecvCount'] += 1
-                    response_metrics['RecvBytes'] += random.randint(1,256)
 
+    def update_port_traffic(self, oem_metrics, rates, seconds):
+
+        def advance(metrics, direction, counts):
             #
-            # Port VC statistics.
+            # The rates are fractional, so round at random to keep the counters unbiased.
             #
-            vc_metrics = oem_metrics.get('VC0', None)
-            if vc_metrics:
-                if any(msg_probs):
-                    vc_index = random.randint(0,15)
-                    vc_metrics = oem_metrics['VC{}'.format(vc_index)]
+            packets, octets = counts
+            metrics[direction + 'Count'] += int(packets*seconds + random.random())
+            metrics[direction + 'Bytes'] += int(octets*seconds + random.random())
+
+        if not rates:
+            return
+
+        for group in [ 'Request', 'Response' ]:
+            group_metrics = oem_metrics.get(group, None)
+            if group_metrics:
+                for direction in [ 'Xmit', 'Recv' ]:
+                    advance(group_metrics, direction, rates[group][direction])
 
-                    if msg_probs[0] or msg_probs[2]:
-                        vc_metrics['XmitCount'] += 1
-                        vc_metrics['XmitBytes'] += random.randint(0,256)
-                    if msg_probs[1] or msg_probs[3]:
-                        vc_metrics['RecvCount'] += 1
-                        vc_metrics['RecvBytes'] += random.randint(0,256)
+        #
+        # Occupancy is a level, not a count.
+        #
+        if 'VC0' in oem_metrics:
+            for vc_index in range(16):
+                vc_metrics = oem_metrics['VC{}'.format(vc_index)]
+                for direction in [ 'Xmit', 'Recv' ]:
+                    advance(vc_metrics, direction, rates['VC'][direction].get(vc_index, (0, 0)))
 
-                    vc_metrics['Occupancy'] += random.randint(0,1)
+                vc_metrics['Occupancy'] = rates['Occupancy'].get(vc_index, 0)
 
 # ----------------------------------------------------------------------------------------------------------------------
 
@@ -210,28 +351,34 @@ class Node():
     # Thread functions.
     #
     def enqueue(self, args):
-        self.queue.put(args)
+        if self.loop:
+            self.loop.call_soon(lambda: args[0](*args[1:]))
+        else:
+            self.queue.put(args)
 
 
-    def dequeue(self):
-        work_item = None
-        try:
-            work_item = self.queue.get(True, 1)
-        except Empty:
-            pass
+    def schedule(self, delay, args):
+        #
+        # Queue a work item after 'delay' simulated seconds.  The timer only hands the item over,
+        # so the node's work still runs one item at a time.
+        #
+        if self.loop:
+            self.loop.call_later(clock.real_delay(delay), self.enqueue, args)
+        else:
+            scheduler.call_later(delay, self.enqueue, args)
 
-        return work_item
+
+    def dequeue(self):
+        return self.queue.get()
 
 
     def run(self):
         while True:
             work_item = self.dequeue()
-            if work_item:
-                function = work_item[0]
-                args = work_item[1:]
+            function = work_item[0]
+            args = work_item[1:]
+            with self.lock:
                 function(*args)
-            else:
-                self.update_port_statistics()
 
 # ----------------------------------------------------------------------------------------------------------------------
 
@@ -252,13 +399,19 @@ class Node():
         if port_profile['State'] != 'Enabled':
             return
 
+        #
+        # Bring the statistics up to date before the port state changes under them.
+        #
+        if 'LinkState' in data or 'InterfaceState' in data:
+            self.materialize_port(port_number)
+
         #
         # Patching LinkState can trigger port training.
         #
         if 'LinkState' in data:
             if port_attribute['LinkState'] == 'Disabled' and data['LinkState'] == 'Enabled':
                 port_attribute['Status']['State'] = 'Starting'
-                self.enqueue([self.link_train_continue, base_name, port_number, time.time()])
+                self.schedule(LINK_TRAIN_TIME, [self.link_train_complete, base_name, port_number])
             elif port_attribute['LinkState'] == 'Enabled' and data['LinkState'] == 'Disabled':
                 port_attribute['Oem']['Hpe']['RemoteComponentID'] = { 'UID' : 0, 'Port' : 0 }
 
@@ -270,16 +423,16 @@ class Node():
         #
         if 'InterfaceState' in data:
             if data['InterfaceState'] == 'Enabled':
-                self.enqueue([self.interface_train_continue, base_name, port_number, time.time()])
+                self.schedule(INTERFACE_TRAIN_TIME, [self.interface_train_complete, base_name, port_number])
             elif data['InterfaceState'] == 'Disabled':
-                self.reset_port_statistics(port_attribute)
+                self.reset_port_statistics(port_number, port_attribute)
 
             port_attribute['InterfaceState'] = data['InterfaceState']
             del data['InterfaceState']
 
 
-    def link_train_continue(self, *args):
-        base_name, port_number, start_time = args
+    def link_train_complete(self, *args):
+        base_name, port_number = args
         port_attribute = self.server.cache[base_name]
 
         #
@@ -289,13 +442,6 @@ class Node():
         if port_profile['State'] != 'Enabled':
             return
 
-        #
-        # Wait for 2 seconds to simulate training complete.
-        #
-        if (time.time() - start_time) < 2.0:
-            self.enqueue([self.link_train_continue, base_name, port_number, start_time])
-            return
-
         #
         # Update the remote component id.
         #
@@ -306,10 +452,11 @@ class Node():
         #
         port_attribute['Status']['State'] = 'StandbyOffline'
         port_attribute['LinkState'] = 'Enabled'
+        self.changed(base_name)
 
 
-    def interface_train_continue(self, *args):
-        base_name, port_number, start_time = args
+    def interface_train_complete(self, *args):
+        base_name, port_number = args
         port_attribute = self.server.cache[base_name]
 
         #
@@ -319,16 +466,10 @@ class Node():
         if port_profile['State'] != 'Enabled':
             return
 
-        #
-        # Wait for 1 second to simulate interface enablement.
-        #
-        if (time.time() - start_time) < 1.0:
-            self.enqueue([self.interface_train_continue, base_name, port_number, start_time])
-            return
-
         #
         # Update the port status.
         #
         port_attribute['Status']['State'] = 'Enabled'
+        self.changed(base_name)
 
 # ----------------------------------------------------------------------------------------------------------------------
@@ -10,7 +10,9 @@ import sys
 import json
 import glob
 import copy
+import time
 import socket
+import itertools
 
 from http.server import HTTPServer
 from http.server import BaseHTTPRequestHandler
@@ -42,11 +44,13 @@ def browser_update(node):
 # -------   ----------      ----------------------------------------------------
 # GET       collection      Retrieve all resources in a collection
 # GET       resource        Retrieve a single resource
+# DEEPGET   resource        Retrieve a resource and the resources below it
 # HEAD      collection      Retrieve all resources in a collection (header only)
 # HEAD      resource        Retrieve a single resource (header only)
 # POST      collection      Create a new resource in a collection
 # PUT       resource        Update a resource
 # PATCH     resource        Update a resource
+# DEEPPATCH resource        Update a resource and the resources below it
 # DELETE    resource        Delete a resource
 # OPTIONS   any             Return available HTTP methods and other options
 #
@@ -55,6 +59,11 @@ def browser_update(node):
 
 class RestHandler(BaseHTTPRequestHandler):
 
+    #
+    # The asyncio host applies the faults itself, so it can hold requests without blocking.
+    #
+    inject_faults = True
+
     def normalize_path(self, path):
         new_path = path
 
@@ -79,14 +88,70 @@ class RestHandler(BaseHTTPRequestHandler):
     def log_message(self, format, *args):
         return
 
+
+    def handle_one_request(self):
+        start = time.time()
+        self.command = None
+        self.reply_status = 0
+        self.reply_bytes = 0
+        self.request_data = None
+
+        super().handle_one_request()
+
+        #
+        # Record the request in the trace, if there is one.
+        #
+        trace = getattr(self.server, 'trace', None)
+        if trace and self.command:
+            conditional = 'If-None-Match' in getattr(self, 'headers', {})
+            trace.record(start, self.server.node_name, self.server.node_address, self.command, self.path,
+                         self.reply_status, len(self.request_data or ''), self.reply_bytes, time.time() - start,
+                         conditional, self.request_data)
+
+
+    def read_data(self):
+        data_length = int(self.headers.get('Content-Length', 0))
+        self.request_data = self.rfile.read(data_length).decode('utf-8')
+        return self.request_data
+
+
+    def parse_request(self):
+        if not super().parse_request():
+            return False
+
+        #
+        # The fault engine can hold the request, drop it or acknowledge it without doing it.
+        #
+        faults = getattr(self.server, 'faults', None)
+        if not faults or not self.inject_faults:
+            return True
+
+        delay, outcome = faults.request(self.server, self.command, self.normalize_path(self.path))
+        if delay:
+            time.sleep(delay)
+
+        if outcome == 'drop':
+            self.close_connection = True
+            return False
+
+        if outcome == 'ignore':
+            self.read_data()
+            self.reply(204)
+            return False
+
+        return True
+
     # ----------------------------------------------------------------------------------------------
 
     def reply(self, status, headers=None, data=None):
-        encoded_data = data.encode() if data else None
+        encoded_data = data.encode() if type(data) is str else data
 
         if headers and 'Content-Length' not in headers:
             headers['Content-Length'] = str(len(encoded_data))
 
+        self.reply_status = status
+        self.reply_bytes = len(encoded_data) if encoded_data else 0
+
         try:
             self.send_response(status)
             if headers:
@@ -107,22 +172,40 @@ class RestHandler(BaseHTTPRequestHandler):
 
     # ----------------------------------------------------------------------------------------------
 
-    def do_GET(self):
-        print('GET {}:{}'.format(self.server.node_address, self.path))
-        path = self.normalize_path(self.path)
+    def representation(self):
+        #
+        # Browser mode decorates the resources with links for people.  Clients that ask for
+        # JSON (e.g. the fabric manager) still get plain JSON.
+        #
+        if self.server.browser and 'application/json' not in self.headers.get('Accept', ''):
+            return 'browser'
+        else:
+            return 'json'
+
+
+    def etag(self, path, representation):
+        suffix = '-html' if representation == 'browser' else ''
+        return '"{}-{}{}"'.format(self.server.epoch, self.server.versions.get(path, 0), suffix)
+
 
+    def serialize(self, path, representation):
         #
-        # If we don't know this resource, send 404.
+        # Serialized replies are kept per resource version and representation, so an unchanged
+        # resource is only serialized once.  The version is read first : a change during
+        # serialization leaves a stale version behind and the next GET serializes again.
         #
-        if path not in self.server.cache:
-            self.reply(404)
-            return
+        key = (path, representation)
+        version = self.server.versions.get(path, 0)
+        cached = self.server.serialized.get(key)
+        if cached and cached[0] == version:
+            return cached[1], cached[2]
 
         #
         # Get the resource.  Update the links if requested.
         #
-        data = copy.deepcopy(self.server.cache[path])
-        if self.server.browser:
+        data = self.server.cache[path]
+        if representation == 'browser':
+            data = copy.deepcopy(data)
             browser_update(data)
             data = '<pre>' + json.dumps(data, indent=4, separators=(',', ': ')) + '</pre>'
             content_type = 'text/html'
@@ -130,7 +213,72 @@ class RestHandler(BaseHTTPRequestHandler):
             data = json.dumps(data, indent=4, separators=(',', ': '))
             content_type = 'application/json'
 
+        encoded_data = data.encode()
+        self.server.serialized[key] = (version, content_type, encoded_data)
+
+        return content_type, encoded_data
+
+    # ----------------------------------------------------------------------------------------------
+
+    def do_GET(self):
+        print('GET {}:{}'.format(self.server.node_address, self.path))
+        path = self.normalize_path(self.path)
+
+        #
+        # If we don't know this resource, send 404.
+        #
+        if path not in self.server.cache:
+            self.reply(404)
+            return
+
+        #
+        # Statistics are only brought up to date when they're read.
+        #
+        self.server.node.materialize(path)
+
+        #
+        # If the requester already has this version, send 304.
+        #
+        representation = self.representation()
+        etag = self.etag(path, representation)
+        if self.headers.get('If-None-Match') == etag:
+            self.reply(304, { 'ETag' : etag, 'Vary' : 'Accept', 'Content-Length' : '0' })
+            return
+
+        content_type, data = self.serialize(path, representation)
+
         headers = { 'Content-Type'  : content_type,
+                    'Cache-Control' : 'no-cache',
+                    'Vary'          : 'Accept',
+                    'ETag'          : etag }
+
+        self.reply(200, headers, data)
+
+    # ----------------------------------------------------------------------------------------------
+
+    def do_DEEPGET(self):
+        print('DEEPGET {}:{}'.format(self.server.node_address, self.path))
+        path = self.normalize_path(self.path)
+
+        #
+        # If we don't know this resource, send 404.
+        #
+        if path not in self.server.cache:
+            self.reply(404)
+            return
+
+        #
+        # Return the resource and every resource below it, keyed by name.
+        #
+        prefix = path + '/'
+        names = [ name for name in self.server.cache if name == path or name.startswith(prefix) ]
+        for name in names:
+            self.server.node.materialize(name)
+
+        data = { name : self.server.cache[name] for name in names }
+        data = json.dumps(data)
+
+        headers = { 'Content-Type'  : 'application/json',
                     'Cache-Control' : 'no-cache, no-store, must-revalidate',
                     'Pragma'        : 'no-cache',
                     'Expires'       : '0' }
@@ -144,10 +292,8 @@ class RestHandler(BaseHTTPRequestHandler):
 
         path = self.normalize_path(self.path)
 
-        data_length = int(self.headers['Content-Length'])
-
         try:
-            data = json.loads(self.rfile.read(data_length).decode('utf-8'))
+            data = json.loads(self.read_data())
         except Exception as e:
             print('invalid POST request - JSON improperly formatted')
             self.reply(400)
@@ -192,6 +338,7 @@ class RestHandler(BaseHTTPRequestHandler):
             # Put the new entry into the tree.
             #
             self.server.cache[data_id] = data
+            self.server.node.changed(path, data_id)
 
             #
             # Reply to the user.
@@ -216,10 +363,8 @@ class RestHandler(BaseHTTPRequestHandler):
 
         path = self.normalize_path(self.path)
 
-        data_length = int(self.headers['Content-Length'])
-
         try:
-            data = json.loads(self.rfile.read(data_length).decode('utf-8'))
+            data = json.loads(self.read_data())
         except Exception as e:
             print('invalid PATCH request - JSON improperly formatted')
             self.reply(400)
@@ -247,7 +392,41 @@ class RestHandler(BaseHTTPRequestHandler):
 
     def do_DEEPPATCH(self):
         print('DEEPPATCH {}:{}'.format(self.server.node_address, self.path))
-        self.reply(405)
+
+        path = self.normalize_path(self.path)
+
+        try:
+            data = json.loads(self.read_data())
+            entries = { self.normalize_path(name) : value for name,value in data.items() }
+        except Exception as e:
+            print('invalid DEEPPATCH request - JSON improperly formatted')
+            self.reply(400)
+            return
+
+        #
+        # The payload maps every resource at or below the path to its update.
+        # If the resource or any of the entries doesn't exist, then 404.
+        # If any entry is a collection or isn't below the resource, then 400 (405 would tell the
+        # FM that DEEPPATCH isn't supported at all).
+        # Otherwise, 204.
+        #
+        if path not in self.server.cache:
+            status = 404
+        elif any(name not in self.server.cache for name in entries):
+            status = 404
+        elif any(name != path and not name.startswith(path + '/') for name in entries):
+            status = 400
+        elif any('Members' in self.server.cache[name] for name in entries):
+            status = 400
+        else:
+            status = 204
+            for name,value in entries.items():
+                self.server.node.do_PATCH(name, value)
+
+        #
+        # Reply to the user.
+        #
+        self.reply(status)
 
     # ----------------------------------------------------------------------------------------------
 
@@ -279,6 +458,10 @@ class RestHandler(BaseHTTPRequestHandler):
                     self.server.cache[parent_path]['Members@odata.count'] -= 1
                     break
 
+            self.server.node.changed(path, parent_path)
+            for representation in [ 'json', 'browser' ]:
+                self.server.serialized.pop((path, representation), None)
+
         #
         # Reply to the user.
         #
@@ -286,6 +469,43 @@ class RestHandler(BaseHTTPRequestHandler):
 
 # ----------------------------------------------------------------------------------------------------------------------
 
+def init_server(server, profile):
+    #
+    # Setup the server environment.  It holds everything the handler and the node need, so the
+    # same setup serves a threaded HTTPServer or a virtual node in the asyncio host.
+    #
+    server.versions = {}
+    server.generation = itertools.count(1)
+    server.epoch = '{:x}'.format(int(time.time()))
+    server.serialized = {}
+    server.node_name = profile['name']
+    server.node_type = profile['type']
+    server.node_address = profile['address']
+    server.redfish_base = '/redfish/v1'
+    server.browser = profile['browser']
+    server.profile = profile
+
+    #
+    # Read the attributes.
+    #
+    attribute_filename = profile['attributes']
+    try:
+        with open(attribute_filename) as f:
+            server.cache = json.load(f)
+    except:
+        print('can\'t read attribute file', attribute_filename)
+        sys.exit(0)
+
+    #
+    # Create the GenZ environment.
+    #
+    if   server.node_type == 'Memory'  : server.node = Memory(server)
+    elif server.node_type == 'Switch'  : server.node = Switch(server)
+    elif server.node_type == 'Compute' : server.node = Compute(server)
+    elif server.node_type == 'IO'      : server.node = IO(server)
+
+# ----------------------------------------------------------------------------------------------------------------------
+
 class NodeMP():
     def __init__(self, profile):
         if type(profile) is not dict:
@@ -314,32 +534,8 @@ class NodeMP():
         self.profile = profile
 
         self.server = HTTPServer((self.address, self.port), RestHandler)
-        self.server.node_name = profile['name']
-        self.server.node_type = profile['type']
-        self.server.node_address = profile['address']
         self.server.node_port = self.port
-        self.server.redfish_base = '/redfish/v1'
-        self.server.browser = profile['browser']
-        self.server.profile = profile
-
-        #
-        # Read the attributes.
-        #
-        attribute_filename = profile['attributes']
-        try:
-            with open(attribute_filename) as f:
-                self.server.cache = json.load(f)
-        except:
-            print('can\'t read attribute file', attribute_filename)
-            sys.exit(0)
-
-        #
-        # Create the GenZ environment.
-        #
-        if   self.server.node_type == 'Memory'  : self.server.node = Memory(self.server)
-        elif self.server.node_type == 'Switch'  : self.server.node = Switch(self.server)
-        elif self.server.node_type == 'Compute' : self.server.node = Compute(self.server)
-        elif self.server.node_type == 'IO'      : self.server.node = IO(self.server)
+        init_server(self.server, profile)
 
 
     def run(self):
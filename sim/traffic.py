@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+#
+# (C) Copyright 2020 Hewlett Packard Enterprise Development LP.
+# Licensed under the Apache v2.0 license.
+#
+
+import json
+
+from threading import Lock
+
+from km.sim.clock import clock
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+TRAFFIC_REFRESH     = 5         # simulated seconds between re-tracing the flows through the current tables
+TRAFFIC_MAX_HOPS    = 32        # flows that go further than this are taken to be looping
+TRAFFIC_PACKET_SIZE = 256       # default packet size (bytes)
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class TrafficModel():
+
+    #
+    # Flow level traffic : each flow in the traffic matrix is traced hop by hop through the
+    # route tables and VCATs that are loaded in the simulated nodes, and its rate is added to
+    # every port and VC that it crosses.  The nodes turn the rates into counters when their
+    # metrics are read.
+    #
+    # The traffic matrix is a JSON file :
+    #
+    #   { "Flows" : [ { "Source"      : "node1",     # endpoint name or "*" for all endpoints
+    #                   "Destination" : "node5",     # endpoint name or "*" for all other endpoints
+    #                   "Rate"        : 1000000,     # request bytes per second
+    #                   "Response"    : 250000,      # response bytes per second (optional)
+    #                   "PacketSize"  : 256 } ] }    # bytes (optional)
+    #
+    def __init__(self, servers, matrix):
+        self.servers = { server.node_name : server for server in servers }
+        self.flows = self.expand(matrix.get('Flows', []))
+        self.rates = {}
+        self.refreshed = 0
+        self.summary = None
+        self.lock = Lock()
+
+        #
+        # Destination CIDs of each node.  The fabric is a single subnet.
+        #
+        self.cids = { name : set(gcid % 4096 for gcid in server.profile['GCIDs']) for name,server in self.servers.items() }
+
+
+    @staticmethod
+    def load(filename, servers):
+        try:
+            with open(filename) as f:
+                matrix = json.load(f)
+        except:
+            print('can\'t read traffic matrix {}'.format(filename))
+            return None
+
+        return TrafficModel(servers, matrix)
+
+
+    def expand(self, flows):
+        endpoints = [ name for name,server in self.servers.items() if server.node_type != 'Switch' ]
+
+        expanded = []
+        for flow in flows:
+            sources = endpoints if flow['Source'] == '*' else [ flow['Source'] ]
+            for source in sources:
+                destinations = [ name for name in endpoints if name != source ] if flow['Destination'] == '*' else [ flow['Destination'] ]
+                for destination in destinations:
+                    if source not in self.servers or destination not in self.servers:
+                        print('traffic flow {} -> {} : unknown node'.format(source, destination))
+                        continue
+
+                    expanded.append({ 'Source'      : source,
+                                      'Destination' : destination,
+                                      'Rate'        : flow.get('Rate', 0),
+                                      'Response'    : flow.get('Response', 0),
+                                      'PacketSize'  : flow.get('PacketSize', TRAFFIC_PACKET_SIZE) })
+
+        return expanded
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+    def port_rates(self, name, index):
+        #
+        # The per second rates of one port.  The flows are traced again every TRAFFIC_REFRESH
+        # seconds so that table loads and link changes show up.
+        #
+        with self.lock:
+            if clock.time() - self.refreshed >= TRAFFIC_REFRESH:
+                self.refresh()
+
+            return self.rates.get((name, index), None)
+
+
+    def refresh(self):
+        self.rates = {}
+        self.refreshed = clock.time()
+
+        routed = dropped = 0
+        for flow in self.flows:
+            for group, source, destination, rate in [ ('Request',  flow['Source'],      flow['Destination'], flow['Rate']),
+                                                      ('Response', flow['Destination'], flow['Source'],      flow['Response']) ]:
+                if rate <= 0: continue
+
+                delivered = self.send(group, source, destination, rate, flow['PacketSize'])
+                routed += delivered
+                dropped += 1 - delivered
+
+        #
+        # Occupancy is the share of the link each VC is using.
+        #
+        for (name, index), rates in self.rates.items():
+            capacity = self.capacity(name, index)
+            for vc, (packets, octets) in rates['VC']['Xmit'].items():
+                rates['Occupancy'][vc] = min(100, round(100 * octets / capacity)) if capacity else 0
+
+        summary = (routed, dropped)
+        if summary != self.summary:
+            print('traffic : {:.2f} flows routed, {:.2f} dropped'.format(routed, dropped))
+            self.summary = summary
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+    def send(self, group, source, destination, rate, packet_size):
+        #
+        # Start the flow at the source endpoint : its destination table picks the port(s) and its
+        # requester/responder VCAT picks the VC.  Returns the fraction of the flow delivered.
+        #
+        server = self.servers[source]
+        cid = min(self.cids[destination])
+
+        adapter = self.adapter(server)
+        if not adapter:
+            return 0
+
+        vcat_name = 'REQ-VCAT' if group == 'Request' else 'RSP-VCAT'
+        routes = self.routes(server, adapter['Gen-Z']['SSDT']['@odata.id'], cid)
+
+        frontier = {}
+        for egress, vc_action in routes:
+            vc = self.select_vc(server, adapter['Gen-Z'][vcat_name]['@odata.id'], 0, vc_action)
+            key = (source, egress, vc)
+            frontier[key] = frontier.get(key, 0) + rate / len(routes)
+
+            self.add(source, egress, group, 'Xmit', rate / len(routes), packet_size)
+
+        #
+        # Move the flow a hop at a time.  The frontier holds the rate leaving each (node, port,
+        # VC), so the parts of the flow that meet again after taking different routes are merged
+        # instead of being followed separately.
+        #
+        delivered = 0
+        for hop in range(TRAFFIC_MAX_HOPS):
+            if not frontier: break
+
+            next_frontier = {}
+            for (name, egress, vc), share in frontier.items():
+                delivered += self.forward(group, name, egress, vc, cid, share, packet_size, next_frontier)
+
+            frontier = next_frontier
+
+        return delivered / rate
+
+
+    def forward(self, group, name, egress, vc, cid, rate, packet_size, frontier):
+        #
+        # Cross the link out of the egress port.  Returns the rate delivered at the far end.
+        #
+        server = self.servers[name]
+        port_profile = server.profile['ports'][egress]
+        if port_profile['State'] != 'Enabled':
+            return 0
+
+        remote = port_profile['Remote']
+        next_name, ingress = remote['Node'], remote['Port']
+        next_server = self.servers.get(next_name, None)
+        if not next_server or not self.port_up(next_server, ingress):
+            return 0
+
+        self.add_vc(name, egress, vc, 'Xmit', rate, packet_size)
+        self.add_vc(next_name, ingress, vc, 'Recv', rate, packet_size)
+
+        #
+        # Delivered?
+        #
+        if cid in self.cids[next_name]:
+            self.add(next_name, ingress, group, 'Recv', rate, packet_size)
+            return rate
+
+        #
+        # Relay : the ingress port's LPRT picks the egress port(s) and its VCAT the next VC.
+        # The valid routes with their links up share the flow equally.
+        #
+        port_attr = next_server.cache[next_server.node.port_to_path(ingress)]
+        tables = port_attr.get('Gen-Z', {})
+        if 'LPRT' not in tables:
+            return 0
+
+        routes = self.routes(next_server, tables['LPRT']['@odata.id'], cid)
+        for next_egress, vc_action in routes:
+            next_vc = self.select_vc(next_server, tables['VCAT']['@odata.id'], vc, vc_action) if 'VCAT' in tables else vc
+            key = (next_name, next_egress, next_vc)
+            frontier[key] = frontier.get(key, 0) + rate / len(routes)
+
+        return 0
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+    def adapter(self, server):
+        #
+        # The fabric adapter that owns the endpoint's first port holds its SSDT and VCATs.
+        #
+        for index, port_profile in enumerate(server.profile['ports']):
+            if port_profile['State'] != 'Enabled': continue
+
+            adapter_name = server.node.port_to_path(index).rsplit('/Ports/', 1)[0]
+            adapter = server.cache.get(adapter_name, None)
+            if adapter and 'SSDT' in adapter.get('Gen-Z', {}):
+                return adapter
+
+        return None
+
+
+    def routes(self, server, table_name, cid):
+        route_set = server.cache.get('{}/{}/RouteSet'.format(table_name, cid), None)
+        if not route_set:
+            return []
+
+        #
+        # Routes out of ports that are down aren't taken.
+        #
+        routes = []
+        for member in route_set['Members']:
+            entry = server.cache[member['@odata.id']]
+            if entry['Valid'] and self.port_up(server, entry['EgressIdentifier']):
+                routes.append((entry['EgressIdentifier'], entry['VCAction']))
+
+        return routes
+
+
+    def select_vc(self, server, vcat_name, vc, vc_action):
+        #
+        # The VCAT entry for the current VC gives, for each action, the VCs the packet may move
+        # to.  The lowest one is used.
+        #
+        entry = server.cache.get('{}/{}'.format(vcat_name, vc), None)
+        if not entry or vc_action >= len(entry['VCATEntry']):
+            return vc
+
+        mask = entry['VCATEntry'][vc_action]['VCMask']
+        return (mask & -mask).bit_length() - 1 if mask else vc
+
+
+    def port_up(self, server, index):
+        port_path = server.node.port_to_path(index)
+        port_attr = server.cache.get(port_path, None) if port_path else None
+        return bool(port_attr) and port_attr['LinkState'] == 'Enabled' and port_attr['InterfaceState'] == 'Enabled'
+
+
+    def capacity(self, name, index):
+        server = self.servers[name]
+        port_attr = server.cache[server.node.port_to_path(index)]
+        return port_attr.get('CurrentSpeedGbps', 0) * 1e9 / 8
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+    def port(self, name, index):
+        return self.rates.setdefault((name, index), { 'Request'   : { 'Xmit' : [0, 0], 'Recv' : [0, 0] },
+                                                      'Response'  : { 'Xmit' : [0, 0], 'Recv' : [0, 0] },
+                                                      'VC'        : { 'Xmit' : {},     'Recv' : {}     },
+                                                      'Occupancy' : {} })
+
+
+    def add(self, name, index, group, direction, rate, packet_size):
+        counts = self.port(name, index)[group][direction]
+        counts[0] += rate / packet_size
+        counts[1] += rate
+
+
+    def add_vc(self, name, index, vc, direction, rate, packet_size):
+        counts = self.port(name, index)['VC'][direction].setdefault(vc, [0, 0])
+        counts[0] += rate / packet_size
+        counts[1] += rate
+
+# ----------------------------------------------------------------------------------------------------------------------
@@ -9,10 +9,24 @@ import sys
 import json
 import glob
 import time
+import queue
+import signal
 import argparse
+import multiprocessing
+import multiprocessing.connection
 
 from threading import Thread
-from km.sim.server import NodeMP
+from km.sim.server  import NodeMP
+from km.sim.host    import SimHost
+from km.sim.traffic import TrafficModel
+from km.sim.faults  import FaultEngine
+from km.sim.clock   import clock
+from km.fm.trace    import TraceWriter
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+WORKER_READY_TIMEOUT = 60   # seconds for a worker to start all of its nodes
+WORKER_STOP_TIMEOUT  = 5    # seconds for a worker to exit before it is killed
 
 # ----------------------------------------------------------------------------------------------------------------------
 
@@ -46,10 +60,186 @@ def find_node_by_uid(fabric, uid):
 
 # ----------------------------------------------------------------------------------------------------------------------
 
-def main(zfm_config_file, browser):
+def start_nodes(profiles, browser, traffic_file=None, fault_file=None, trace=None):
+    #
+    # Create the nodes (which binds their servers) and start a server thread for each one.
+    #
+    nodes = []
+    for profile in profiles:
+        profile['browser'] = browser
+        nodes.append(NodeMP(profile))
+
+    #
+    # The traffic model routes flows across all of the nodes.  A traffic matrix that can't be
+    # used stops the simulator (as it does with the asyncio host).
+    #
+    if traffic_file:
+        servers = [ node.server for node in nodes ]
+        traffic = TrafficModel.load(traffic_file, servers)
+        if not traffic:
+            return None
+
+        for server in servers:
+            server.traffic = traffic
+
+    #
+    # So does the fault engine, which keeps one report for the whole fabric.
+    #
+    if fault_file:
+        servers = [ node.server for node in nodes ]
+        faults = FaultEngine.load(fault_file, servers)
+        if faults:
+            for server in servers:
+                server.faults = faults
+
+            faults.start()
+
+    #
+    # All of the nodes write to one request trace.
+    #
+    if trace:
+        for node in nodes:
+            node.server.trace = trace
+
+    threads = []
+
+    for node in nodes:
+        t = Thread(target=node.run, daemon=True)
+        threads.append(t)
+
+    for t in threads:
+        t.start()
+
+    return threads
+
+
+def worker(index, profiles, browser, speedup, trace_file, ready):
+    #
+    # The supervisor handles ^C and stops the workers itself.
+    #
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    clock.set_speedup(speedup)
+
+    #
+    # Each worker writes its own trace (e.g. sim.trace.gz -> sim.trace-0.gz).  A worker exits
+    # without running the exit handlers, so it closes its trace itself when it is stopped.
+    #
+    trace = None
+    if trace_file:
+        root, extension = os.path.splitext(trace_file)
+        trace = TraceWriter('{}-{}{}'.format(root, index, extension), 'zfmsim')
+
+        def terminate(signum, frame):
+            raise SystemExit
+
+        signal.signal(signal.SIGTERM, terminate)
+
+    try:
+        threads = start_nodes(profiles, browser, trace=trace)
+    except BaseException as e:
+        ready.put((index, False, 'startup failed ({})'.format(e)))
+        if trace:
+            trace.close()
+        return
+
+    ready.put((index, True, '{} nodes'.format(len(threads))))
+
+    try:
+        for t in threads:
+            t.join()
+    finally:
+        if trace:
+            trace.close()
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+def stop_workers(workers):
+    for process in workers:
+        if process.is_alive():
+            process.terminate()
+
+    for process in workers:
+        process.join(WORKER_STOP_TIMEOUT)
+        if process.is_alive():
+            process.kill()
+            process.join()
+
+
+def supervise(profiles, browser, num_workers, speedup, trace_file):
+    #
+    # Shard the nodes round robin across the workers.  Each worker runs its own node servers and
+    # statistics threads, so the nodes no longer share one interpreter.
+    #
+    shards = [ profiles[i::num_workers] for i in range(num_workers) ]
+    shards = [ shard for shard in shards if shard ]
+
+    ready = multiprocessing.Queue()
+    workers = [ multiprocessing.Process(target=worker, args=(i, shard, browser, speedup, trace_file, ready), name='zfmsim-{}'.format(i))
+                for i,shard in enumerate(shards) ]
+
+    start = time.time()
+    try:
+        for process in workers:
+            process.start()
+
+        #
+        # Wait for every worker to report that its nodes are up.
+        #
+        pending = set(range(len(workers)))
+        deadline = start + WORKER_READY_TIMEOUT
+        while pending:
+            try:
+                index, status, message = ready.get(timeout=max(0, deadline - time.time()))
+            except queue.Empty:
+                print('workers {} not ready after {} seconds'.format(sorted(pending), WORKER_READY_TIMEOUT))
+                return 1
+
+            print('worker {} (pid {}) : {}'.format(index, workers[index].pid, message))
+            if not status:
+                return 1
+
+            pending.discard(index)
+
+        print('{} nodes ready in {} workers ({:.2f} seconds)'.format(len(profiles), len(workers), time.time() - start))
+        sys.stdout.flush()
+
+        #
+        # Wait around for a worker to exit or the user to kill us.  The nodes in a worker that
+        # dies are gone, so the whole fabric is taken down.
+        #
+        sentinels = { process.sentinel : process for process in workers }
+        exited = multiprocessing.connection.wait(list(sentinels))
+        for sentinel in exited:
+            process = sentinels[sentinel]
+            process.join()
+            print('worker {} exited with status {}'.format(process.name, process.exitcode))
+
+        return 1
+
+    except KeyboardInterrupt:
+        return 0
+
+    finally:
+        stop_workers(workers)
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+def main(zfm_config_file, browser, num_workers=0, async_host=False, traffic_file=None, speedup=1.0, fault_file=None,
+         trace_file=None):
     fabric_config_file = None
     node_config_dir = None
 
+    #
+    # Simulated time can run faster than real time.
+    #
+    if speedup <= 0:
+        print('the speedup must be positive')
+        return 1
+
+    clock.set_speedup(speedup)
+
     #
     # Get the fabric config file name and the node config directory names.
     #
@@ -70,35 +260,50 @@ def main(zfm_config_file, browser):
                 fabric[name] = profile
 
     #
-    # Read the node configuration files.
+    # SIGTERM shuts down like ^C, so the exit handlers (e.g. closing the trace) run.
     #
-    nodes = []
-    for name, profile in fabric.items():
-        profile['browser'] = browser
-        nodes.append(NodeMP(profile))
+    def terminate(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, terminate)
 
     #
-    # Start the nodes.
+    # The asyncio host serves all of the nodes from one event loop.
     #
-    threads = []
+    if async_host:
+        return SimHost(list(fabric.values()), browser, traffic_file, fault_file, trace_file).run()
 
-    for node in nodes:
-        t = Thread(target=node.run, daemon=True)
-        threads.append(t)
+    #
+    # With workers, the nodes are spread over that many processes.
+    #
+    if num_workers > 0:
+        if traffic_file:
+            print('the traffic model needs every node in one process - ignoring it with workers')
+        if fault_file:
+            print('the fault engine needs every node in one process - ignoring it with workers')
 
-    for t in threads:
-        t.start()
+        return supervise(list(fabric.values()), browser, num_workers, speedup, trace_file)
 
     #
-    # Wait around for the nodes to exit or the user to kill us.
+    # Start the nodes.
+    #
+    trace = TraceWriter(trace_file, 'zfmsim') if trace_file else None
+    threads = start_nodes(fabric.values(), browser, traffic_file, fault_file, trace)
+    if threads is None:
+        return 1
+
+    #
+    # Wait around for the nodes to exit or the user to kill us.  As with the workers and the
+    # asyncio host, a requested shutdown (^C or SIGTERM) is a clean exit and nodes that go away
+    # on their own are not.
     #
     try:
         for t in threads:
             t.join()
     except KeyboardInterrupt:
-        return 1
-    else:
         return 0
+    else:
+        return 1
 
 # ----------------------------------------------------------------------------------------------------------------------
 
@@ -109,11 +314,23 @@ if __name__ == '__main__':
     #
     parser = argparse.ArgumentParser(description='fabric simulator')
 
-    parser.add_argument('-d', '--dir',     help='simulated ZFM config file', required=True)
-    parser.add_argument('-b', '--browser', help='href links for browsers',   required=False,  default=False,      action='store_true')
+    parser.add_argument('-d', '--dir',     help='simulated ZFM config file',       required=True)
+    parser.add_argument('-b', '--browser', help='href links for browsers',         required=False,  default=False,  action='store_true')
+    parser.add_argument('-w', '--workers', help='worker processes',                required=False,  default=0,      type=int)
+    parser.add_argument('-a', '--async',   help='serve nodes from one event loop', required=False,  default=False,  action='store_true')
+    parser.add_argument('-t', '--traffic', help='traffic matrix file',             required=False,  default=None)
+    parser.add_argument('-s', '--speedup', help='simulated time per real second',  required=False,  default=1.0,    type=float)
+    parser.add_argument('-f', '--faults',  help='fault script file',               required=False,  default=None)
+    parser.add_argument('-T', '--trace',   help='REST trace file',                 required=False,  default=None)
 
     args = vars(parser.parse_args())
 
+    #
+    # The trace file is named relative to where we were started, not the config directory.
+    #
+    if args['trace']:
+        args['trace'] = os.path.abspath(args['trace'])
+
     #
     # Chdir to the config directory.
     #
@@ -124,4 +341,4 @@ if __name__ == '__main__':
         sys.exit(1)
 
     args['conf'] = 'zfm.conf'
-    main(args['conf'], args['browser'])
+    sys.exit(main(args['conf'], args['browser'], args['workers'], args['async'], args['traffic'], args['speedup'], args['faults'], args['trace']))